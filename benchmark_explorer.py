@@ -0,0 +1,187 @@
+"""Benchmarks how the FileExplorer lists directories.
+
+Builds a synthetic tree (by default 10k directories with 10 files each) and times,
+for the current os.scandir-based population and for the previous
+listdir/isdir/listdir one:
+  - expand_root: populating the root level, i.e. 10k directories that each need
+    a "has children" check for their placeholder
+  - expand_all: populating every one of the subdirectories as well
+
+Besides wall time it counts the file system calls made from Python (listdir,
+scandir, stat, lstat). os.scandir reads its entries in batches, so these counts
+are a lower bound of the real syscalls; run under `strace -c -f` for exact ones.
+
+    python benchmark_explorer.py --dirs 10000 --files 10
+    python benchmark_explorer.py --compare bench_results/previous.json
+
+Needs no display: the Treeview is replaced by a stand-in that only hands out ids.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+DEFAULT_DIRS = 10000
+DEFAULT_FILES = 10
+DEFAULT_REPEAT = 3
+COUNTED_CALLS = ["listdir", "scandir", "stat", "lstat"]
+
+
+class TreeStandIn:
+    """Takes insert() calls like a ttk.Treeview and returns fresh item ids."""
+    def __init__(self):
+        self.items = 0
+
+    def insert(self, parent, index, **options):
+        self.items += 1
+        return f"I{self.items}"
+
+
+class CallCounter:
+    """Counts calls to the os functions in COUNTED_CALLS while active."""
+    def __init__(self):
+        self.counts = dict.fromkeys(COUNTED_CALLS, 0)
+        self._originals = {}
+
+    def __enter__(self):
+        for name in COUNTED_CALLS:
+            original = self._originals[name] = getattr(os, name)
+            setattr(os, name, self._counting(name, original))
+        return self
+
+    def _counting(self, name, original):
+        def counted(*args, **kwargs):
+            self.counts[name] += 1
+            return original(*args, **kwargs)
+        return counted
+
+    def __exit__(self, *exc_info):
+        for name, original in self._originals.items():
+            setattr(os, name, original)
+        return False
+
+
+def make_tree(root, dir_count, files_per_dir):
+    for dir_number in range(dir_count):
+        directory = os.path.join(root, f"dir{dir_number:06d}")
+        os.mkdir(directory)
+        for file_number in range(files_per_dir):
+            with open(os.path.join(directory, f"file{file_number:03d}.txt"), "w"):
+                pass
+
+
+def legacy_populate(tree, parent_node_id, dir_path):
+    """The population FileExplorer used before os.scandir: listdir, isdir per entry, listdir per directory."""
+    for item_name in sorted(os.listdir(dir_path)):
+        full_path = os.path.join(dir_path, item_name)
+        item_type = "directory" if os.path.isdir(full_path) else "file"
+        item_id = tree.insert(parent_node_id, "end", text=item_name, image="",
+                              values=[full_path, item_type], open=False)
+        if item_type == "directory":
+            try:
+                if os.listdir(full_path):
+                    tree.insert(item_id, "end", text="...", values=["placeholder", "placeholder"])
+            except OSError:
+                tree.insert(item_id, "end", text="[Error reading]", values=["error", "error"])
+
+
+def scandir_populate(tree, parent_node_id, dir_path):
+    import main
+    explorer = main.FileExplorer.__new__(main.FileExplorer)
+    explorer.file_tree = tree
+    explorer.folder_icon = explorer.file_icon = None
+    explorer.ignore = main.IgnoreMatcher(dir_path)
+    explorer._nodes = {}
+    explorer._watch = lambda watched_path: None # Watching isn't part of listing
+    explorer._remember_listing = lambda *listing: None # Nor is caching it
+    explorer.populate_file_explorer(parent_node_id, dir_path)
+
+
+def run_scenario(populate, root, expand_all, repeat):
+    subdirectories = sorted(os.path.join(root, name) for name in os.listdir(root))
+    timings = []
+    for _ in range(repeat):
+        tree = TreeStandIn()
+        with CallCounter() as counter:
+            start = time.perf_counter()
+            populate(tree, "", root)
+            if expand_all:
+                for directory in subdirectories:
+                    populate(tree, "", directory)
+            timings.append(time.perf_counter() - start)
+    result = {"best_s": round(min(timings), 4), "items": tree.items}
+    result["calls"] = counter.counts # Same on every run
+    result["total_calls"] = sum(counter.counts.values())
+    return result
+
+
+def compare(previous, current):
+    """Prints how each timing moved relative to a previous results file."""
+    for scenario, implementations in current["results"].items():
+        for name, entry in implementations.items():
+            old = previous["results"].get(scenario, {}).get(name)
+            if not old:
+                continue
+            print(f"{scenario} {name}: {old['best_s']} s -> {entry['best_s']} s ({_change(old['best_s'], entry['best_s'])}), "
+                  f"{old['total_calls']} -> {entry['total_calls']} calls")
+
+
+def _change(before, after):
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FileExplorer directory listing.")
+    parser.add_argument("--dirs", type=int, default=DEFAULT_DIRS, help="Directories in the synthetic tree")
+    parser.add_argument("--files", type=int, default=DEFAULT_FILES, help="Files in each directory")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Runs per scenario; the best is kept")
+    parser.add_argument("--root", help="Directory to build the tree in (default: a temporary one)")
+    parser.add_argument("--output", help="JSON results file (default: bench_results/explorer-<time>.json)")
+    parser.add_argument("--compare", help="Previous JSON results file to compare against")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    parent = tempfile.mkdtemp(dir=args.root)
+    try:
+        root = os.path.join(parent, "tree")
+        os.mkdir(root)
+        start = time.perf_counter()
+        make_tree(root, args.dirs, args.files)
+        print(f"Built {args.dirs} x {args.files} tree in {time.perf_counter() - start:.1f} s")
+        results = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dirs": args.dirs,
+            "files": args.files,
+            "results": {},
+        }
+        for scenario, expand_all in (("expand_root", False), ("expand_all", True)):
+            results["results"][scenario] = {
+                "legacy": run_scenario(legacy_populate, root, expand_all, args.repeat),
+                "scandir": run_scenario(scandir_populate, root, expand_all, args.repeat),
+            }
+            print(scenario, json.dumps(results["results"][scenario]))
+    finally:
+        shutil.rmtree(parent)
+
+    output = args.output or os.path.join("bench_results", time.strftime("explorer-%Y%m%d-%H%M%S.json"))
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as previous_file:
+            compare(json.load(previous_file), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Benchmarks syntax highlighting through the real TextEditor.
+
+Generates synthetic Python files of increasing size and times, for each size:
+  - full highlight: apply_syntax_highlighting() over the whole document
+  - load: set_content() until every background/viewport tag has been applied
+  - keystroke: one character typed mid-document, then highlight_dirty_lines()
+  - scroll: jumping the viewport to a new position and letting it highlight
+
+Results are written as JSON so runs can be compared over time:
+
+    python benchmark_highlighting.py --sizes 1000 10000 100000 1000000
+    python benchmark_highlighting.py --compare bench_results/previous.json
+
+Needs a display. Without one, Xvfb is started if it is installed (e.g. in CI).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+KEYSTROKE_SAMPLES = 50
+SCROLL_SAMPLES = 20
+XVFB_DISPLAY = ":99"
+
+IDENTIFIERS = ["value", "result", "items", "config", "path", "index", "count", "buffer", "node", "data"]
+
+
+def generate_python_source(line_count, seed=0):
+    """Returns roughly line_count lines of Python-like code.
+
+    The mix aims at real-world density: most lines hold a keyword, about one in five
+    a string, one in eight a comment, and every function opens with a docstring.
+    """
+    rng = random.Random(seed)
+    lines = []
+    while len(lines) < line_count:
+        name = rng.choice(IDENTIFIERS)
+        if rng.random() < 0.1:
+            lines.append(f"class {name.title()}Handler(object):")
+            lines.append(f"    '''Handles {name} events.'''")
+        lines.append(f"def process_{name}_{len(lines)}(self, {name}, flag=None):")
+        lines.append('    """Processes the given %s.' % name)
+        lines.append("")
+        lines.append(f"    Returns None if {name} is empty.")
+        lines.append('    """')
+        for _ in range(rng.randint(3, 12)):
+            other = rng.choice(IDENTIFIERS)
+            kind = rng.random()
+            if kind < 0.125:
+                lines.append(f"    # Check the {other} before touching the {name}")
+            elif kind < 0.325:
+                lines.append(f"    {other} = \"{other}-{rng.randint(0, 999)}\" if flag else '{name}'")
+            elif kind < 0.5:
+                lines.append(f"    for {other} in {name}:")
+                lines.append(f"        if {other} is None or not {other}:")
+                lines.append("            continue")
+            elif kind < 0.65:
+                lines.append(f"    while {other} and {name}:")
+                lines.append(f"        {other} = {other}[1:]  # drop the head")
+            elif kind < 0.8:
+                lines.append("    try:")
+                lines.append(f"        {other} = int({name})")
+                lines.append("    except ValueError:")
+                lines.append("        pass")
+            else:
+                lines.append(f"    {other} = {name}.get({rng.randint(0, 100)}, {other})")
+        lines.append(f"    return {name}")
+        lines.append("")
+    return "\n".join(lines[:line_count]) + "\n"
+
+
+def ensure_display():
+    """Makes sure Tk can connect to a display, starting Xvfb if there is none.
+
+    Returns the Xvfb process (to be terminated afterwards) or None.
+    """
+    if os.environ.get("DISPLAY") or sys.platform in ("win32", "darwin"):
+        return None
+    if not shutil.which("Xvfb"):
+        sys.exit("No display available and Xvfb is not installed.")
+    process = subprocess.Popen(["Xvfb", XVFB_DISPLAY, "-screen", "0", "1280x1024x24"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ["DISPLAY"] = XVFB_DISPLAY
+    time.sleep(1) # Give the server a moment to accept connections
+    return process
+
+
+def _wait_until_highlighted(root, editor, timeout=600):
+    """Pumps the event loop until no background highlighting job is pending."""
+    deadline = time.perf_counter() + timeout
+    while (editor._highlight_job or editor._viewport_after_id) and time.perf_counter() < deadline:
+        root.update()
+        time.sleep(0.001)
+
+
+def _summary_ms(samples):
+    samples = sorted(samples)
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+    }
+
+
+def benchmark_size(root, line_count, seed):
+    import main
+    source = generate_python_source(line_count, seed)
+    frame = main.tk.Frame(root)
+    frame.pack(expand=True, fill="both")
+    editor = main.TextEditor(frame, None, None)
+    root.update()
+    result = {"lines": line_count, "chars": len(source)}
+
+    start = time.perf_counter()
+    editor.set_content(source)
+    _wait_until_highlighted(root, editor)
+    result["load_s"] = round(time.perf_counter() - start, 4)
+
+    start = time.perf_counter()
+    editor.apply_syntax_highlighting()
+    result["full_highlight_s"] = round(time.perf_counter() - start, 4)
+    # Back to the mode an opened file of this size would be in
+    editor.apply_syntax_highlighting(allow_background=True)
+    _wait_until_highlighted(root, editor)
+
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(KEYSTROKE_SAMPLES):
+        line = rng.randint(1, line_count)
+        editor.text_area.see(f"{line}.0")
+        root.update()
+        start = time.perf_counter()
+        editor.text_area.insert(f"{line}.0", "x")
+        editor.highlight_dirty_lines()
+        _wait_until_highlighted(root, editor)
+        samples.append(time.perf_counter() - start)
+    result["keystroke"] = _summary_ms(samples)
+
+    samples = []
+    for _ in range(SCROLL_SAMPLES):
+        start = time.perf_counter()
+        editor.text_area.yview_moveto(rng.random())
+        root.update()
+        _wait_until_highlighted(root, editor)
+        samples.append(time.perf_counter() - start)
+    result["scroll"] = _summary_ms(samples)
+
+    frame.destroy()
+    root.update()
+    return result
+
+
+def compare(previous, current):
+    """Prints how each timing moved relative to a previous results file."""
+    previous_by_size = {entry["lines"]: entry for entry in previous["results"]}
+    for entry in current["results"]:
+        old = previous_by_size.get(entry["lines"])
+        if not old:
+            continue
+        print(f"{entry['lines']} lines:")
+        for key in ("load_s", "full_highlight_s"):
+            print(f"  {key}: {old[key]} -> {entry[key]} ({_change(old[key], entry[key])})")
+        for key in ("keystroke", "scroll"):
+            before, after = old[key]["median_ms"], entry[key]["median_ms"]
+            print(f"  {key} median_ms: {before} -> {after} ({_change(before, after)})")
+
+
+def _change(before, after):
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark syntax highlighting in the TextEditor.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Line counts to generate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON results file (default: bench_results/highlighting-<time>.json)")
+    parser.add_argument("--compare", help="Previous JSON results file to compare against")
+    args = parser.parse_args()
+
+    xvfb = ensure_display()
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.geometry("1024x768")
+        results = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "tk": root.tk.call("info", "patchlevel"),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "results": [],
+        }
+        for line_count in args.sizes:
+            entry = benchmark_size(root, line_count, args.seed)
+            print(json.dumps(entry))
+            results["results"].append(entry)
+        root.destroy()
+    finally:
+        if xvfb:
+            xvfb.terminate()
+
+    output = args.output or os.path.join("bench_results", time.strftime("highlighting-%Y%m%d-%H%M%S.json"))
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as previous_file:
+            compare(json.load(previous_file), results)
+
+
+if __name__ == "__main__":
+    main()
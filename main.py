@@ -1,43 +1,1081 @@
 # Import the Tkinter library
 import tkinter as tk
 from tkinter import Text, filedialog, Menu, ttk, messagebox, simpledialog
+from array import array
+import bisect
+import codecs
+import ctypes
+from collections import OrderedDict, deque
+import hashlib
+import heapq
+import itertools
+import json
+import mmap
 import os
+import queue
 import re
 import shutil
+try:
+    import sqlite3
+except ImportError: # Python built without it; listings just aren't cached
+    sqlite3 = None
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import time
 
 # --- Syntax Highlighting Definitions ---
 SYNTAX_RULES = [ # Ensure this is defined before TextEditor if TextEditor uses it at class level
     ("keyword", r"\b(def|class|if|elif|else|for|while|return|import|from|try|except|finally|with|as|True|False|None|and|or|not|is|in|lambda|global|nonlocal|yield|async|await|pass|break|continue)\b"),
     ("comment", r"#.*"),
     ("string", r"(\".*?\"|\'.*?\')"), # Basic strings, does not cover multi-line strings perfectly yet
-    ("multiline_string_double", r"\"\"\".*?\"\"\""),
-    ("multiline_string_single", r"\'\'\'.*?\'\'\'"),
+    # An unterminated triple-quoted string runs to the end of the text, as in Python
+    ("multiline_string_double", r"\"\"\".*?(?:\"\"\"|\Z)"),
+    ("multiline_string_single", r"\'\'\'.*?(?:\'\'\'|\Z)"),
 ]
 
+# Delimiters of the rules above that may span several lines. The lexer's state at
+# the start of a line is LEXER_STATE_NORMAL or 1 + the index of the string it is in.
+MULTILINE_STRING_DELIMITERS = [
+    ("multiline_string_double", '"""'),
+    ("multiline_string_single", "'''"),
+]
+LEXER_STATE_NORMAL = 0
+LEXER_STATE_UNKNOWN = 255 # Line not lexed since it was last edited
+
+# Regions larger than this are lexed on a background thread instead of in the key handler
+BACKGROUND_HIGHLIGHT_MIN_CHARS = 50000
+HIGHLIGHT_DEBOUNCE_SECONDS = 0.15 # Typing pause before a background job starts
+HIGHLIGHT_POLL_MS = 30
+HIGHLIGHT_BATCH_RANGES = 500 # Tag ranges applied per after() callback (give or take a line's worth)
+# Documents with at least this many lines only get their visible lines highlighted
+VIEWPORT_HIGHLIGHT_MIN_LINES = 20000
+VIEWPORT_HIGHLIGHT_MARGIN = 100 # Extra lines highlighted above and below the viewport
+# How far above a viewport gap the lexer walks back to a line with a known start state
+VIEWPORT_STATE_LOOKBACK_LINES = 20000
+
+class SyntaxLexer:
+    """Tokenizes text for highlighting with a single regex pass.
+
+    All rules are merged into one alternation of named groups, so each character is
+    claimed by at most one rule: a keyword inside a string stays part of the string.
+    """
+    def __init__(self, rules, multiline_delimiters=()):
+        self.tags = [tag for tag, _ in rules]
+        self.multiline_delimiters = list(multiline_delimiters)
+        self._state_of_tag = {tag: state for state, (tag, _) in enumerate(self.multiline_delimiters, 1)}
+        # Triple-quoted strings must be tried before the plain string rule, which
+        # would otherwise match their first two quotes as an empty string.
+        ordered_rules = sorted(rules, key=lambda rule: not rule[0].startswith("multiline"))
+        self.pattern = re.compile("|".join(self._rule_group(tag, pattern) for tag, pattern in ordered_rules))
+
+    @staticmethod
+    def _rule_group(tag, pattern):
+        # Triple-quoted strings are allowed to span lines; every other rule is line-local.
+        if tag.startswith("multiline"):
+            return f"(?P<{tag}>(?s:{pattern}))"
+        return f"(?P<{tag}>{pattern})"
+
+    def tokenize(self, text, state=LEXER_STATE_NORMAL):
+        """Yields non-overlapping (tag, start_offset, end_offset) tuples in text order.
+
+        state is the lexer state at the start of text, e.g. inside a docstring that
+        was opened further up.
+        """
+        position = 0
+        if state != LEXER_STATE_NORMAL:
+            tag, delimiter = self.multiline_delimiters[state - 1]
+            closing = text.find(delimiter)
+            position = len(text) if closing == -1 else closing + len(delimiter)
+            if position:
+                yield tag, 0, position
+        for match in self.pattern.finditer(text, position):
+            if match.end() > match.start():
+                yield match.lastgroup, match.start(), match.end()
+
+    def lex(self, text, first_line=1, state=LEXER_STATE_NORMAL, is_cancelled=None, collect_ranges=True):
+        """Lexes whole lines of text, starting in `state`, and records per-line start states.
+
+        Returns (ranges, line_states). ranges maps each tag to a flat
+        [start, end, start, end, ...] list of Tk indices (None if collect_ranges is
+        False). line_states[k] is the lexer state at the start of line first_line + k,
+        up to and including the line that follows the text. If is_cancelled is given
+        it is polled every few thousand tokens and None is returned once it says True.
+        """
+        line_table = LineTable(text, first_line)
+        line_starts = line_table.line_starts
+        line_states = array("B", bytes(len(line_starts)))
+        ranges = {tag: [] for tag in self.tags} if collect_ranges else None
+        for count, (tag, start, end) in enumerate(self.tokenize(text, state)):
+            if is_cancelled and count % 4096 == 0 and is_cancelled():
+                return None
+            if collect_ranges:
+                ranges[tag].append(line_table.position(start))
+                ranges[tag].append(line_table.position(end))
+            token_state = self._state_of_tag.get(tag)
+            if token_state is None:
+                continue
+            # Every line that starts inside the string starts in its state
+            delimiter = self.multiline_delimiters[token_state - 1][1]
+            opened_before_text = start == 0 and state == token_state
+            terminated = text.startswith(delimiter, end - len(delimiter)) and (
+                opened_before_text or end - start >= 2 * len(delimiter))
+            first_inside = 0 if opened_before_text else bisect.bisect_right(line_starts, start)
+            if terminated:
+                last_inside = bisect.bisect_left(line_starts, end)
+            else:
+                last_inside = bisect.bisect_right(line_starts, end)
+            if last_inside > first_inside:
+                line_states[first_inside:last_inside] = array("B", [token_state]) * (last_inside - first_inside)
+        return ranges, line_states
+
+    def highlight_ranges(self, text, first_line=1, is_cancelled=None):
+        """Tag ranges of text lexed from the normal state; see lex()."""
+        result = self.lex(text, first_line, is_cancelled=is_cancelled)
+        return result[0] if result else None
+
+
+class LineTable:
+    """Converts offsets within a block of text to Tk "line.col" indices without Tcl calls."""
+    def __init__(self, text, first_line=1):
+        self.first_line = first_line
+        self.line_starts = [0]
+        newline = text.find("\n")
+        while newline != -1:
+            self.line_starts.append(newline + 1)
+            newline = text.find("\n", newline + 1)
+
+    def position(self, offset):
+        line = bisect.bisect_right(self.line_starts, offset) - 1
+        return f"{self.first_line + line}.{offset - self.line_starts[line]}"
+
+
+class LineStateCache:
+    """Lexer state at the start of every line, one byte per line in an array.
+
+    Lines that were edited, or never lexed, read as LEXER_STATE_UNKNOWN. Line 1
+    always starts in the normal state.
+    """
+    def __init__(self):
+        self.states = array("B")
+
+    def get(self, line):
+        if line <= 1:
+            return LEXER_STATE_NORMAL
+        if line - 1 < len(self.states):
+            return self.states[line - 1]
+        return LEXER_STATE_UNKNOWN
+
+    def update(self, first_line, states):
+        """Stores states for first_line, first_line + 1, ..."""
+        start = first_line - 1
+        if start > len(self.states):
+            self.states.extend(array("B", [LEXER_STATE_UNKNOWN]) * (start - len(self.states)))
+        self.states[start:start + len(states)] = array("B", states)
+
+    def replace_lines(self, first_line, old_last_line, new_last_line):
+        """Follows an edit: first_line..old_last_line became first_line..new_last_line.
+
+        first_line keeps its start state (nothing above it changed); the other edited
+        lines become unknown and the ones below keep theirs, moved along.
+        """
+        if first_line >= len(self.states):
+            return
+        self.states[first_line:old_last_line] = array("B", [LEXER_STATE_UNKNOWN]) * (new_last_line - first_line)
+
+    def invalidate_from(self, line):
+        del self.states[max(line - 1, 1):]
+
+    def last_known_line(self, line):
+        """The closest line at or above `line` whose start state is known."""
+        known = self.states[:line].tobytes().rstrip(bytes([LEXER_STATE_UNKNOWN]))
+        return max(len(known), 1)
+
+
+class GrammarRegistry:
+    """Maps file extensions to syntax grammars.
+
+    A grammar's rules are only compiled into a SyntaxLexer the first time a file of
+    that type is opened; the lexer is then shared by every tab for the rest of the
+    session. Extensions without a grammar are plain text and are never lexed.
+    """
+    def __init__(self, default_grammar=None):
+        self.default_grammar = default_grammar # Used for buffers that have no path yet
+        self._grammars = {} # name -> (rules, multiline_delimiters)
+        self._grammar_of_extension = {}
+        self._lexers = {} # name -> compiled SyntaxLexer
+        self._lock = threading.Lock() # Editors and workers may ask for a lexer at the same time
+
+    def register(self, name, extensions, rules, multiline_delimiters=()):
+        self._grammars[name] = (rules, multiline_delimiters)
+        self._lexers.pop(name, None)
+        for extension in extensions:
+            self._grammar_of_extension[extension.lower()] = name
+
+    def grammar_for_path(self, filepath):
+        """Name of the grammar for filepath, or None for plain text."""
+        if not filepath or filepath == "Untitled":
+            return self.default_grammar
+        extension = os.path.splitext(filepath)[1].lower()
+        return self._grammar_of_extension.get(extension)
+
+    def lexer(self, name):
+        """The compiled lexer for grammar `name`, compiling it on first use."""
+        lexer = self._lexers.get(name)
+        if lexer is None:
+            with self._lock:
+                lexer = self._lexers.get(name)
+                if lexer is None:
+                    rules, multiline_delimiters = self._grammars[name]
+                    lexer = self._lexers[name] = SyntaxLexer(rules, multiline_delimiters)
+        return lexer
+
+    def lexer_for_path(self, filepath):
+        """The lexer for filepath, or None if it is plain text."""
+        name = self.grammar_for_path(filepath)
+        return self.lexer(name) if name else None
+
+    def is_compiled(self, name):
+        return name in self._lexers
+
+
+GRAMMARS = GrammarRegistry(default_grammar="python")
+GRAMMARS.register("python", [".py", ".pyw", ".pyi"], SYNTAX_RULES, MULTILINE_STRING_DELIMITERS)
+
+
+class LineIntervalSet:
+    """Sorted, non-overlapping (first_line, last_line) intervals, e.g. lines already highlighted."""
+    def __init__(self):
+        self.intervals = []
+
+    def add(self, first_line, last_line):
+        # Merge with every interval that overlaps or touches the new one
+        merged = []
+        for interval_first, interval_last in self.intervals:
+            if interval_last + 1 < first_line or interval_first > last_line + 1:
+                merged.append((interval_first, interval_last))
+            else:
+                first_line = min(first_line, interval_first)
+                last_line = max(last_line, interval_last)
+        merged.append((first_line, last_line))
+        merged.sort()
+        self.intervals = merged
+
+    def remove(self, first_line, last_line):
+        remaining = []
+        for interval_first, interval_last in self.intervals:
+            if interval_last < first_line or interval_first > last_line:
+                remaining.append((interval_first, interval_last))
+                continue
+            if interval_first < first_line:
+                remaining.append((interval_first, first_line - 1))
+            if interval_last > last_line:
+                remaining.append((last_line + 1, interval_last))
+        self.intervals = remaining
+
+    def missing(self, first_line, last_line):
+        """Returns the sub-intervals of first_line..last_line that are not in the set."""
+        gaps = []
+        position = first_line
+        for interval_first, interval_last in self.intervals:
+            if interval_last < position:
+                continue
+            if interval_first > last_line:
+                break
+            if interval_first > position:
+                gaps.append((position, interval_first - 1))
+            position = interval_last + 1
+        if position <= last_line:
+            gaps.append((position, last_line))
+        return gaps
+
+    def replace_lines(self, first_line, old_last_line, new_last_line):
+        """Follows an edit: first_line..old_last_line became first_line..new_last_line.
+
+        The edited lines drop out of the set and everything below them moves along.
+        """
+        self.remove(first_line, old_last_line)
+        shift = new_last_line - old_last_line
+        self.intervals = [(interval_first + shift, interval_last + shift) if interval_first > old_last_line
+                          else (interval_first, interval_last)
+                          for interval_first, interval_last in self.intervals]
+
+
+class HighlightWorker:
+    """Lexes buffer snapshots on a background thread.
+
+    Every job carries the edit version of the snapshot it was taken from. submit()
+    supersedes any job that has not finished, and a job only starts once nothing newer
+    has been submitted for `delay` seconds, so a burst of typing costs one pass.
+    The Tk side collects results with take_result(); the worker never touches Tk.
+    """
+    def __init__(self, lexer, delay=HIGHLIGHT_DEBOUNCE_SECONDS):
+        self.lexer = lexer
+        self.delay = delay
+        self._condition = threading.Condition()
+        self._job = None # (version, first_line, text, start_state) waiting to be lexed
+        self._submitted_at = 0.0
+        self._result = None # (version, first_line, ranges, line_states) of the newest finished job
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="highlight-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, version, first_line, text, state=LEXER_STATE_NORMAL):
+        with self._condition:
+            self._job = (version, first_line, text, state)
+            self._submitted_at = time.monotonic()
+            self._result = None
+            self._condition.notify()
+
+    def take_result(self):
+        with self._condition:
+            result, self._result = self._result, None
+        return result
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._job = None
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # Wait for a job, then for a typing pause long enough to start it
+                while not self._stopped:
+                    if self._job is None:
+                        self._condition.wait()
+                        continue
+                    remaining = self._submitted_at + self.delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._stopped:
+                    return
+                (version, first_line, text, state), self._job = self._job, None
+
+            # A newer submit() makes this snapshot stale, so stop lexing it
+            lexed = self.lexer.lex(text, first_line, state, is_cancelled=lambda: self._job is not None)
+            with self._condition:
+                if lexed is not None and self._job is None:
+                    self._result = (version, first_line) + lexed
+
+# --- Document Model ---
+DOCUMENT_EDIT_LOG_LIMIT = 1000 # Most recent edits kept in Document.edit_log
+PIECE_COALESCE_MAX_CHARS = 4096 # Consecutive typing is merged into one piece up to this size
+UNDO_MEMORY_BUDGET_CHARS = 2 * 1024 * 1024 # Undo/redo text kept per tab
+
+
+LINE_INDEX_BLOCK_LINES = 512 # Line lengths per LineIndex block
+
+
+class FenwickTree:
+    """Prefix sums over a list of numbers with O(log n) point updates and queries."""
+    def __init__(self, values=()):
+        self.size = len(values)
+        self.tree = [0] + list(values)
+        for index in range(1, self.size + 1):
+            parent = index + (index & -index)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[index]
+
+    def add(self, position, delta):
+        """Adds delta to the value at 0-based position."""
+        index = position + 1
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix_sum(self, count):
+        """Sum of the first `count` values."""
+        total = 0
+        while count > 0:
+            total += self.tree[count]
+            count -= count & -count
+        return total
+
+    def find(self, value):
+        """Largest count with prefix_sum(count) <= value, and that prefix sum.
+
+        With non-negative values this is the 0-based position the value-th unit falls in.
+        """
+        position = 0
+        remaining = value
+        step = 1 << self.size.bit_length()
+        while step:
+            candidate = position + step
+            if candidate <= self.size and self.tree[candidate] <= remaining:
+                position = candidate
+                remaining -= self.tree[candidate]
+            step >>= 1
+        return position, value - remaining
+
+
+class LineIndex:
+    """Maps character offsets to (line, column) and back, maintained across edits.
+
+    Line lengths (including the newline) are kept in blocks of up to
+    2 * LINE_INDEX_BLOCK_LINES; Fenwick trees over the blocks' character and line
+    totals find the block for an offset or line in O(log n), and edits only touch
+    the lengths of the lines they change. Lines are numbered from 1 and columns from
+    0, like Tk indices.
+    """
+    def __init__(self, text=""):
+        lengths = array("q", (len(line) + 1 for line in text.split("\n")))
+        lengths[-1] -= 1 # The last line has no newline
+        self._set_blocks([lengths[position:position + LINE_INDEX_BLOCK_LINES]
+                          for position in range(0, len(lengths), LINE_INDEX_BLOCK_LINES)])
+
+    def _set_blocks(self, blocks):
+        self.blocks = blocks # array("q") of line lengths each
+        self._block_chars = FenwickTree([sum(block) for block in blocks])
+        self._block_lines = FenwickTree([len(block) for block in blocks])
+
+    @property
+    def line_count(self):
+        return self._block_lines.prefix_sum(len(self.blocks))
+
+    def __len__(self):
+        return self._block_chars.prefix_sum(len(self.blocks))
+
+    def _block_of_line(self, line):
+        """(block number, first line of the block) of a 1-based line, clamped to the last line."""
+        line = max(1, min(line, self.line_count))
+        block, lines_before = self._block_lines.find(line - 1)
+        return block, lines_before + 1
+
+    def offset(self, line, column=0):
+        """Offset of line.column; columns past the end of the line are clamped to it."""
+        if line > self.line_count:
+            return len(self)
+        block, block_first_line = self._block_of_line(line)
+        lengths = self.blocks[block]
+        row = line - block_first_line
+        line_start = self._block_chars.prefix_sum(block) + sum(lengths[:row])
+        # Stop before the newline, as Tk does for a column past the end of the line
+        line_length = lengths[row] - (1 if line < self.line_count else 0)
+        return line_start + max(0, min(column, line_length))
+
+    def position(self, offset):
+        """(line, column) of an offset; offsets past the end map to the end of the text."""
+        offset = max(0, min(offset, len(self)))
+        block, chars_before = self._block_chars.find(offset)
+        if block >= len(self.blocks):
+            # The end of the text, after the last line's last character
+            block = len(self.blocks) - 1
+            chars_before -= sum(self.blocks[block])
+        lengths = self.blocks[block]
+        line = self._block_lines.prefix_sum(block) + 1
+        line_count = self.line_count
+        column = offset - chars_before
+        for length in lengths:
+            if column < length or line == line_count:
+                break
+            column -= length
+            line += 1
+        return line, column
+
+    def index(self, offset):
+        """Tk "line.col" index of an offset."""
+        return "%d.%d" % self.position(offset)
+
+    def insert(self, offset, text):
+        line, column = self.position(offset)
+        pieces = text.split("\n")
+        if len(pieces) == 1:
+            self._replace_lines(line, line, [self.line_length(line) + len(text)])
+            return
+        tail = self.line_length(line) - column
+        lengths = [column + len(pieces[0]) + 1]
+        lengths.extend(len(piece) + 1 for piece in pieces[1:-1])
+        lengths.append(len(pieces[-1]) + tail)
+        self._replace_lines(line, line, lengths)
+
+    def delete(self, start, end):
+        if end <= start:
+            return
+        start_line, start_column = self.position(start)
+        end_line, end_column = self.position(end)
+        self._replace_lines(start_line, end_line,
+                            [start_column + self.line_length(end_line) - end_column])
+
+    def line_length(self, line):
+        """Characters on a line, including its newline."""
+        block, block_first_line = self._block_of_line(line)
+        return self.blocks[block][line - block_first_line]
+
+    def _replace_lines(self, first_line, last_line, lengths):
+        first_block, first_block_line = self._block_of_line(first_line)
+        last_block, last_block_line = self._block_of_line(last_line)
+        if first_block == last_block and len(self.blocks[first_block]) - (last_line - first_line) + len(lengths) <= 2 * LINE_INDEX_BLOCK_LINES:
+            # The common case: one block changes and the block layout stays the same
+            block = self.blocks[first_block]
+            old_chars = sum(block)
+            old_lines = len(block)
+            block[first_line - first_block_line:last_line - first_block_line + 1] = array("q", lengths)
+            self._block_chars.add(first_block, sum(block) - old_chars)
+            self._block_lines.add(first_block, len(block) - old_lines)
+            return
+        merged = array("q")
+        for block in self.blocks[first_block:last_block + 1]:
+            merged.extend(block)
+        merged[first_line - first_block_line:last_line - first_block_line + 1] = array("q", lengths)
+        replacement = [merged[position:position + LINE_INDEX_BLOCK_LINES]
+                       for position in range(0, len(merged), LINE_INDEX_BLOCK_LINES)]
+        blocks = self.blocks[:first_block] + replacement + self.blocks[last_block + 1:]
+        self._set_blocks(blocks or [array("q", [0])])
+
+
+class DocumentSnapshot:
+    """Read-only view of a Document at one version.
+
+    Pieces are never modified in place and their strings are immutable, so a
+    snapshot stays valid while the document keeps changing and can be read from
+    another thread.
+    """
+    def __init__(self, pieces, length, version):
+        self.pieces = pieces
+        self.length = length
+        self.version = version
+
+    def __len__(self):
+        return self.length
+
+    def text(self):
+        return "".join(source[start:start + length] for source, start, length in self.pieces)
+
+    def slice(self, start, end):
+        """Characters start..end (offsets), copying only the pieces they touch."""
+        return "".join(self.chunks(start, end))
+
+    def chunks(self, start=0, end=None, chunk_size=None):
+        """Yields the text between start and end in order, at most chunk_size characters at a time."""
+        end = self.length if end is None else min(end, self.length)
+        piece_start = 0
+        for source, source_start, length in self.pieces:
+            piece_end = piece_start + length
+            if piece_end > start and piece_start < end:
+                first = source_start + max(start - piece_start, 0)
+                last = source_start + min(end, piece_end) - piece_start
+                step = chunk_size or max(last - first, 1)
+                for position in range(first, last, step):
+                    yield source[position:min(position + step, last)]
+            if piece_end >= end:
+                break
+            piece_start = piece_end
+
+
+class Document:
+    """The editor's text as a piece table, independent of any widget.
+
+    Each piece is (source, start, length): a slice of the text the document was
+    loaded with or of a string that was inserted later. Edits only split and
+    replace pieces, never copy the text around them. Every edit bumps `version`
+    and is recorded in `edit_log` as (version, offset, removed_text, inserted_text).
+    `lines` converts between offsets and line/column positions.
+    """
+    def __init__(self, text=""):
+        self.version = 0
+        self.lines = LineIndex(text)
+        self.edit_log = deque(maxlen=DOCUMENT_EDIT_LOG_LIMIT)
+        self._pieces = [(text, 0, len(text))] if text else []
+        self._length = len(text)
+        self._original = text
+
+    def __len__(self):
+        return self._length
+
+    def snapshot(self):
+        return DocumentSnapshot(self._pieces, self._length, self.version)
+
+    def text(self):
+        return self.snapshot().text()
+
+    def slice(self, start, end):
+        return self.snapshot().slice(start, end)
+
+    def _split(self, offset):
+        """Index of the piece that starts at offset, splitting the piece containing it if needed.
+
+        Returns the new piece list and the index; self._pieces is left untouched.
+        """
+        piece_start = 0
+        for index, (source, start, length) in enumerate(self._pieces):
+            if piece_start == offset:
+                return list(self._pieces), index
+            if piece_start + length > offset:
+                head = offset - piece_start
+                pieces = self._pieces[:index]
+                pieces.append((source, start, head))
+                pieces.append((source, start + head, length - head))
+                pieces.extend(self._pieces[index + 1:])
+                return pieces, index + 1
+            piece_start += length
+        return list(self._pieces), len(self._pieces)
+
+    def insert(self, offset, text):
+        if not text:
+            return
+        offset = max(0, min(offset, self._length))
+        pieces, index = self._split(offset)
+        previous = pieces[index - 1] if index else None
+        if (previous and previous[0] is not self._original and previous[1] + previous[2] == len(previous[0])
+                and previous[2] + len(text) <= PIECE_COALESCE_MAX_CHARS):
+            # Typing right after the previous insertion: extend its piece instead of adding one
+            source = previous[0][previous[1]:] + text
+            pieces[index - 1] = (source, 0, len(source))
+        else:
+            pieces.insert(index, (text, 0, len(text)))
+        self._pieces = pieces
+        self._length += len(text)
+        self.lines.insert(offset, text)
+        self._record(offset, "", text)
+
+    def delete(self, start, end):
+        """Removes the characters between offsets start and end and returns them."""
+        start = max(0, start)
+        end = min(end, self._length)
+        if end <= start:
+            return ""
+        removed = self.slice(start, end)
+        self._pieces, first = self._split(start)
+        pieces, last = self._split(end)
+        self._pieces = pieces[:first] + pieces[last:]
+        self._length -= end - start
+        self.lines.delete(start, end)
+        self._record(start, removed, "")
+        return removed
+
+    def replace(self, start, end, text):
+        self.delete(start, end)
+        self.insert(start, text)
+
+    def _record(self, offset, removed, inserted):
+        self.version += 1
+        self.edit_log.append((self.version, offset, removed, inserted))
+
+    def edits_since(self, version):
+        """Edits made after `version`, oldest first, or None if the log no longer reaches back that far."""
+        if version == self.version:
+            return []
+        if not self.edit_log or self.edit_log[0][0] > version + 1:
+            return None
+        return [edit for edit in self.edit_log if edit[0] > version]
+
+
+class UndoHistory:
+    """Editor-level undo/redo of compact edits with a memory budget.
+
+    Each step is a list of (offset, removed_text, inserted_text) edits. Consecutive
+    typing and consecutive Backspace/Delete presses on a line merge into one step.
+    Once the steps hold more than budget_chars characters the oldest are dropped; a
+    single edit larger than the budget clears the history. Every state gets an id,
+    so the saved marker tells whether the buffer is back at its saved state without
+    comparing contents.
+    """
+    def __init__(self, budget_chars=UNDO_MEMORY_BUDGET_CHARS):
+        self.budget_chars = budget_chars
+        self.clear()
+
+    def clear(self):
+        self._undo = deque() # (state_id, edits), oldest first
+        self._redo = []
+        self._chars = 0
+        self._next_id = 1
+        self._base_id = self._new_id() # State below the oldest undo step
+        self._saved_id = None
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    @staticmethod
+    def _size(edits):
+        return sum(len(removed) + len(inserted) for _, removed, inserted in edits)
+
+    def state_id(self):
+        return self._undo[-1][0] if self._undo else self._base_id
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def mark_saved(self):
+        self._saved_id = self.state_id()
+
+    def mark_unsaved(self):
+        """Forgets the saved state, e.g. after writing it to disk failed."""
+        self._saved_id = None
+
+    def is_at_saved_state(self):
+        return self._saved_id == self.state_id()
+
+    def record(self, edits):
+        """Adds a step for edits that were just applied to the buffer."""
+        if not edits:
+            return
+        self._chars -= sum(self._size(step_edits) for _, step_edits in self._redo)
+        self._redo = []
+        size = self._size(edits)
+        if size > self.budget_chars:
+            # Too big to keep; nothing before it can be undone either
+            self._undo.clear()
+            self._chars = 0
+            self._base_id = self._new_id()
+            return
+        # The saved state has to stay reachable by undo, so typing after a save starts a new step
+        at_saved_state = self._undo and self._undo[-1][0] == self._saved_id
+        merged = self._merge(self._undo[-1][1], edits) if self._undo and not at_saved_state else None
+        if merged:
+            _, top_edits = self._undo.pop()
+            self._chars -= self._size(top_edits)
+            edits = merged
+            size = self._size(edits)
+        # A merged step is a new state too, or the saved marker would still match it
+        self._undo.append((self._new_id(), edits))
+        self._chars += size
+        while self._chars > self.budget_chars and len(self._undo) > 1:
+            state_id, dropped = self._undo.popleft()
+            self._base_id = state_id
+            self._chars -= self._size(dropped)
+
+    @staticmethod
+    def _merge(top_edits, edits):
+        if len(top_edits) != 1 or len(edits) != 1:
+            return None
+        top_offset, top_removed, top_inserted = top_edits[0]
+        offset, removed, inserted = edits[0]
+        if len(inserted) == 1 and inserted != "\n" and not removed and not top_removed:
+            # Typing: each character lands right after the previous one
+            if top_inserted and not top_inserted.endswith("\n") and offset == top_offset + len(top_inserted):
+                return [(top_offset, "", top_inserted + inserted)]
+        if len(removed) == 1 and removed != "\n" and not inserted and not top_inserted and top_removed:
+            if offset + 1 == top_offset: # Backspace
+                return [(offset, removed + top_removed, "")]
+            if offset == top_offset: # Delete
+                return [(offset, top_removed + removed, "")]
+        return None
+
+    def undo(self):
+        """Pops the latest step and returns its edits (to be reverted in reverse order), or None."""
+        if not self._undo:
+            return None
+        step = self._undo.pop()
+        self._redo.append(step)
+        return step[1]
+
+    def redo(self):
+        """Re-pushes the latest undone step and returns its edits (to be re-applied in order), or None."""
+        if not self._redo:
+            return None
+        step = self._redo.pop()
+        self._undo.append(step)
+        return step[1]
+
+
 class TextEditor:
-    def __init__(self, master_frame, status_bar, app_instance):
+    is_loading = False # Content is still being streamed in by load_streamed()
+    load_error = None # Set if streaming the file in failed part way
+    file_suffix = "" # What the file holds after the document's text; SAVE_SUFFIX once saved
+
+    def __init__(self, master_frame, status_bar, app_instance, filepath=None):
         self.frame = master_frame
         self.status_bar = status_bar # May not be needed if App handles all status updates
         self.app_instance = app_instance # For updating tab text
+        self.filepath = filepath
         self.text_area = Text(self.frame)
         self.text_area.pack(expand=True, fill='both', side='right')
         self.text_area.focus_set()
         self._configure_tags()
         self.is_modified = False
+        self._dirty_lines = None # (first_line, last_line) still waiting to be re-highlighted
+        self._edit_version = 0 # Bumped on every edit; stamps background highlighting jobs
+        self._highlighter = None # HighlightWorker, started the first time a large region needs lexing
+        self._highlight_job = None # (version, first_line, last_line) being lexed or applied in the background
+        self._highlight_poll_id = None
+        self._clean_lines = None # LineIntervalSet of highlighted lines; only used for large documents
+        self._line_states = LineStateCache() # Lexer state at the start of each line
+        self._viewport_after_id = None
+        self.lexer = GRAMMARS.lexer_for_path(filepath) # None for plain text, which is never lexed
+        self.document = Document() # Kept in sync with the widget by the edit hook
+        self._search_matches = None # SearchMatches of the last regex search, for one document version
+        self.undo_history = UndoHistory() # Replaces the widget's unbounded undo stack
+        self.file_format = FileFormat() # Encoding and line endings to save with
+        self.file_stamp = None # file_stamp() of the file when its content was last in sync with this tab
+        self.journal_dir = None # Where unsaved edits are journaled; None turns journaling off
+        self.journal = None # EditJournal while the tab has unsaved edits
+        self._journal_version = 0 # Document version the journal is up to date with
+        self._journal_paused = False
+        self._saved_version = 0 # Document version that matches the file
+        self._applying_history = False
+        self._loader = None # FileLoader while the file is streamed in
+        self._load_after_id = None
+        self._install_edit_hook()
+        self.text_area.configure(yscrollcommand=self._on_yview_changed)
 
         # Listen for text modifications
         self.text_area.bind("<<Modified>>", self._on_text_modified)
-        self.text_area.bind("<KeyRelease>", self.apply_syntax_highlighting) # Keep for syntax highlighting
+        self.text_area.bind("<KeyRelease>", self.highlight_dirty_lines) # Re-highlight only what the edit touched
+        self.text_area.bind("<<Undo>>", self.undo)
+        self.text_area.bind("<<Redo>>", self.redo)
+
+    def _install_edit_hook(self):
+        """Routes the widget's Tcl command through _on_widget_command.
+
+        Every insert/delete (typing, paste, programmatic changes) then reports which
+        lines it touched, so highlighting never has to diff the whole buffer.
+        """
+        self._widget_name = str(self.text_area)
+        self._widget_command = self._widget_name + "_orig"
+        self.text_area.tk.call("rename", self._widget_name, self._widget_command)
+        self.text_area.tk.createcommand(self._widget_name, self._on_widget_command)
+        self.text_area.bind("<Destroy>", self._on_text_area_destroy, add="+")
+
+    def _on_text_area_destroy(self, event=None):
+        if event is not None and event.widget is not self.text_area:
+            return
+        self._highlight_job = None
+        if self._highlighter:
+            self._highlighter.stop()
+        self._cancel_streamed_load()
+        self._discard_journal() # Closed without saving, so the edits were not wanted
+        try:
+            self.text_area.tk.deletecommand(self._widget_name)
+        except tk.TclError:
+            pass
+
+    def _call_widget(self, *args):
+        # Talks to the real Text widget, bypassing the edit hook
+        return self.text_area.tk.call((self._widget_command,) + args)
+
+    def _on_widget_command(self, *args):
+        operation = args[0] if args else ""
+        try:
+            if operation in ("insert", "delete", "replace") and str(self._call_widget("cget", "-state")) == "disabled":
+                # The widget ignores these when disabled, but Text's class bindings (BackSpace,
+                # paste) still send them; the editor itself enables the widget to change it.
+                return ""
+            if operation == "insert":
+                return self._tracked_insert(*args[1:])
+            if operation == "delete":
+                return self._tracked_delete(*args[1:])
+            if operation == "replace":
+                return self._tracked_replace(*args[1:])
+            return self._call_widget(*args)
+        except tk.TclError:
+            # An exception escaping a raw Tcl command would resurface later in mainloop
+            # (same approach as idlelib's WidgetRedirector)
+            return ""
+
+    def index_to_offset(self, index):
+        """Offset into self.document of a widget index such as "insert" or "3.4 + 2 chars"."""
+        line, column = str(self._call_widget("index", index)).split(".")
+        return self.document.lines.offset(int(line), int(column))
+
+    def offset_to_index(self, offset):
+        """Widget "line.col" index of an offset, without asking Tcl."""
+        return self.document.lines.index(offset)
+
+    def _tracked_insert(self, index, *chars_and_tags):
+        # Text inserted at "end" really goes in front of the widget's final newline,
+        # which is where index_to_offset puts "end"
+        offset = self.index_to_offset(index)
+        first_line = self.document.lines.position(offset)[0]
+        inserted = "".join(str(chars) for chars in chars_and_tags[::2])
+        result = self._call_widget("insert", index, *chars_and_tags)
+        self.document.insert(offset, inserted)
+        self._record_undo([(offset, "", inserted)] if inserted else [])
+        self._sync_journal()
+        self._on_lines_changed(first_line, first_line, first_line + inserted.count("\n"))
+        return result
+
+    def _deleted_span(self, indices):
+        """Lines and document offset ranges a delete of `indices` will remove.
+
+        Returns (first_line, last_line, ranges) with ranges sorted and merged the way
+        the widget deletes them.
+        """
+        # delete accepts "index1 ?index2 ...?" pairs; a lone index deletes one character
+        lines = self.document.lines
+        first_line = last_line = None
+        ranges = []
+        for position in range(0, len(indices), 2):
+            start_offset = self.index_to_offset(indices[position])
+            if position + 1 < len(indices):
+                end_offset = self.index_to_offset(indices[position + 1])
+            else:
+                end_offset = start_offset + 1
+            start_line, end_line = lines.position(start_offset)[0], lines.position(end_offset)[0]
+            first_line = start_line if first_line is None else min(first_line, start_line)
+            last_line = end_line if last_line is None else max(last_line, end_line)
+            if end_offset > start_offset:
+                ranges.append((start_offset, end_offset))
+        merged = []
+        for start_offset, end_offset in sorted(ranges):
+            if merged and start_offset <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end_offset))
+            else:
+                merged.append((start_offset, end_offset))
+        # The widget never deletes its final newline, so nothing past the last line goes away
+        return first_line, min(last_line, lines.line_count), merged
+
+    def _tracked_delete(self, *indices):
+        first_line, last_line, ranges = self._deleted_span(indices)
+        result = self._call_widget("delete", *indices)
+        edits = []
+        for start_offset, end_offset in reversed(ranges):
+            edits.append((start_offset, self.document.delete(start_offset, end_offset), ""))
+        self._record_undo(edits)
+        self._sync_journal()
+        self._on_lines_changed(first_line, last_line, first_line)
+        return result
+
+    def _tracked_replace(self, index1, index2, *chars_and_tags):
+        first_line, last_line, ranges = self._deleted_span((index1, index2))
+        start_offset = self.index_to_offset(index1)
+        inserted = "".join(str(chars) for chars in chars_and_tags[::2])
+        result = self._call_widget("replace", index1, index2, *chars_and_tags)
+        removed = "".join(self.document.delete(delete_start, delete_end) for delete_start, delete_end in ranges)
+        self.document.insert(start_offset, inserted)
+        if removed or inserted:
+            self._record_undo([(start_offset, removed, inserted)])
+        self._sync_journal()
+        self._on_lines_changed(first_line, last_line, first_line + inserted.count("\n"))
+        return result
+
+    def _record_undo(self, edits):
+        if not self._applying_history and not self.is_loading:
+            self.undo_history.record(edits)
+
+    def _sync_journal(self):
+        """Brings the crash-recovery journal in line with the document.
+
+        The journal is started on the first unsaved edit, appended to on every edit
+        after that and removed once the tab is back at its saved state. If the tab
+        still matched its file before, the journal only refers to the file instead of
+        copying the text.
+        """
+        if self.journal_dir is None or self.is_loading or self._journal_paused:
+            return
+        if self.undo_history.is_at_saved_state():
+            self._discard_journal()
+            return
+        if self.journal is None:
+            based_on_file = self.file_stamp and self.document.edits_since(self._saved_version) is not None
+            try:
+                self.journal = EditJournal(self.journal_dir, self.filepath, self.file_format,
+                                           self.file_stamp if based_on_file else None)
+            except OSError as e:
+                print(f"Error creating recovery journal: {e}")
+                self.journal_dir = None # Don't retry on every keystroke
+                return
+            if not based_on_file:
+                self._compact_journal()
+                return
+            self._journal_version = self._saved_version
+        edits = self.document.edits_since(self._journal_version)
+        if edits is None:
+            self._compact_journal() # More edits at once than the document's log keeps
+            return
+        try:
+            self.journal.append(edits)
+        except OSError as e:
+            print(f"Error writing recovery journal: {e}")
+        self._journal_version = self.document.version
+        if self.journal.needs_compaction(len(self.document)):
+            self._compact_journal()
+
+    def _compact_journal(self):
+        try:
+            self.journal.compact(self.filepath, self.document.snapshot())
+        except OSError as e:
+            print(f"Error writing recovery journal: {e}")
+        self._journal_version = self.document.version
+
+    def _discard_journal(self):
+        if self.journal:
+            self.journal.discard()
+            self.journal = None
+
+    def undo(self, event=None):
+        """Reverts the latest undo step; bound to <<Undo>> in place of the widget's own stack."""
+        edits = self.undo_history.undo()
+        if edits:
+            self._apply_history_edits([(offset, inserted, removed) for offset, removed, inserted in reversed(edits)])
+        return "break"
+
+    def redo(self, event=None):
+        edits = self.undo_history.redo()
+        if edits:
+            self._apply_history_edits(edits)
+        return "break"
+
+    def _apply_history_edits(self, edits):
+        """Applies (offset, text_to_remove, text_to_insert) edits without recording them again."""
+        self._applying_history = True
+        try:
+            for offset, removed, inserted in edits:
+                if removed:
+                    self.text_area.delete(self.offset_to_index(offset), self.offset_to_index(offset + len(removed)))
+                if inserted:
+                    self.text_area.insert(self.offset_to_index(offset), inserted)
+        finally:
+            self._applying_history = False
+        cursor = self.offset_to_index(offset + len(inserted))
+        self.text_area.mark_set(tk.INSERT, cursor)
+        self.text_area.see(cursor)
+        self.highlight_dirty_lines()
+        self.mark_as_modified(not self.undo_history.is_at_saved_state())
+
+    def _on_lines_changed(self, first_line, old_last_line, new_last_line):
+        """Lines first_line..old_last_line were replaced by first_line..new_last_line."""
+        self._edit_version += 1
+        self._line_states.replace_lines(first_line, old_last_line, new_last_line)
+        if self._clean_lines is not None:
+            self._clean_lines.replace_lines(first_line, old_last_line, new_last_line)
+        if self._highlight_job:
+            # The background result is stale now; its lines have to be highlighted again
+            _, job_first_line, job_last_line = self._highlight_job
+            self._highlight_job = None
+            self._merge_dirty_region(job_first_line, job_last_line)
+        self._mark_lines_dirty(first_line, old_last_line, new_last_line)
+
+    def _mark_lines_dirty(self, first_line, old_last_line, new_last_line):
+        if self._dirty_lines:
+            # Move the pending region along with the lines that shifted under it
+            shift = new_last_line - old_last_line
+            def moved(line, fallback):
+                if line > old_last_line:
+                    return line + shift
+                return fallback if line >= first_line else line
+            dirty_first, dirty_last = self._dirty_lines
+            self._dirty_lines = (moved(dirty_first, first_line), moved(dirty_last, new_last_line))
+        self._merge_dirty_region(first_line, new_last_line)
+
+    def _merge_dirty_region(self, first_line, last_line):
+        if self._dirty_lines:
+            first_line = min(first_line, self._dirty_lines[0])
+            last_line = max(last_line, self._dirty_lines[1])
+        self._dirty_lines = (first_line, last_line)
 
     def _on_text_modified(self, event=None):
         # This event fires once per modification sequence.
         # Reset the Text widget's modified flag so it fires again next time.
         if self.text_area.edit_modified():
-            self.mark_as_modified(True)
+            # Undoing back to the saved state clears the "*" again
+            self.mark_as_modified(not self.undo_history.is_at_saved_state())
             self.text_area.edit_modified(False) # Crucial reset
 
     def mark_as_modified(self, modified_status):
         self.is_modified = modified_status
+        if not modified_status:
+            self.undo_history.mark_saved()
+            self._saved_version = self.document.version
+        self._sync_journal()
         if self.app_instance: # Ensure app_instance is set
             self.app_instance.update_tab_text_for_editor(self, modified_status)
 
@@ -49,34 +1087,320 @@ class TextEditor:
         self.text_area.tag_configure("multiline_string_single", foreground="red")
         self.text_area.tag_configure("search_highlight", background="yellow", foreground="black") # New
 
+    def set_language_for(self, filepath):
+        """Switches to the grammar of filepath, e.g. after Save As or a rename."""
+        self.filepath = filepath
+        if self.journal:
+            self._compact_journal() # Restoring has to open the file under its new name
+        lexer = GRAMMARS.lexer_for_path(filepath)
+        if lexer is self.lexer:
+            return
+        if self.lexer:
+            self._remove_syntax_tags(1, self._last_line())
+        if self._highlighter:
+            # The worker is bound to the old lexer
+            self._highlighter.stop()
+            self._highlighter = None
+        self.lexer = lexer
+        self.apply_syntax_highlighting(allow_background=True)
+
     def clear_search_highlights(self):
         self.text_area.tag_remove("search_highlight", "1.0", tk.END)
 
-    def apply_syntax_highlighting(self, event=None):
-        content = self.get_content()
-        # Remove existing tags first
-        for tag, _ in SYNTAX_RULES:
-            self.text_area.tag_remove(tag, "1.0", tk.END)
+    def find_matches(self, pattern):
+        """SearchMatches of pattern in the current text; reused until the text or pattern changes."""
+        matches = self._search_matches
+        if matches is None or matches.pattern is not pattern or matches.version != self.document.version:
+            snapshot = self.document.snapshot()
+            matches = self._search_matches = SearchMatches(pattern, snapshot.text(), snapshot.version)
+        return matches
+
+    def apply_syntax_highlighting(self, event=None, allow_background=False):
+        """Re-highlights the whole document.
+
+        With allow_background=True a large document is lexed on the highlight worker
+        and its tags arrive over the next few event-loop iterations, and a very large
+        one is only highlighted where it is visible.
+        """
+        self._dirty_lines = None
+        self._highlight_job = None
+        self._line_states = LineStateCache()
+        if self.lexer is None:
+            self._clean_lines = None
+            return
+        last_line = self._last_line()
+        if allow_background and last_line >= VIEWPORT_HIGHLIGHT_MIN_LINES:
+            # Large document: highlight what is on screen now and the rest as it scrolls into view
+            self._clean_lines = LineIntervalSet()
+            self._remove_syntax_tags(1, last_line)
+            self._highlight_viewport()
+            return
+
+        self._clean_lines = None
+        if allow_background:
+            self._highlight_region(1, last_line)
+        else:
+            self._highlight_lines(1, last_line)
+
+    def highlight_state(self):
+        """(lexer, tag ranges, line start states) of the finished highlighting, for set_content().
+
+        None while highlighting is still pending, or for plain text.
+        """
+        if self.lexer is None or self._dirty_lines or self._highlight_job:
+            return None
+        if self._clean_lines is not None and self._clean_lines.missing(1, self._last_line()):
+            return None # Only highlighted where it was scrolled to
+        ranges = {tag: [str(index) for index in self.text_area.tag_ranges(tag)] for tag in self.lexer.tags}
+        return (self.lexer, ranges, self._line_states.states.tobytes())
+
+    def _restore_highlighting(self, ranges, line_states):
+        self._dirty_lines = None
+        self._highlight_job = None
+        self._clean_lines = None
+        self._line_states = LineStateCache()
+        self._line_states.states.frombytes(line_states)
+        for tag, indices in ranges.items():
+            if indices:
+                self.text_area.tag_add(tag, *indices)
+
+    def highlight_dirty_lines(self, event=None):
+        """Re-highlights the lines changed since the last highlighting pass.
+
+        Lexing resumes from the cached start state of the first changed line and runs
+        past the changed lines only while it leaves them in a different state than the
+        cache has for the next line, e.g. after a docstring was opened or closed.
+        """
+        if not self._dirty_lines:
+            return
+        first_line, last_line = self._dirty_lines
+        self._dirty_lines = None
+        if self.lexer is None:
+            return
+        last_document_line = self._last_line()
+        first_line = max(1, min(first_line, last_document_line))
+        last_line = max(first_line, min(last_line, last_document_line))
+        if self._clean_lines is not None:
+            # Off-screen lines are only marked stale; they are re-highlighted once scrolled to
+            window_first, window_last = self._viewport_window()
+            if first_line < window_first or last_line > window_last:
+                # Whether the edit changed the state of the lines below is only known once
+                # it is lexed, so nothing below it can be trusted until then
+                self._clean_lines.remove(first_line, last_document_line)
+                self._line_states.invalidate_from(first_line + 1)
+            else:
+                self._clean_lines.remove(first_line, last_line)
+            self._highlight_viewport()
+            return
+
+        chunk_lines = last_line - first_line + 1
+        while True:
+            content = self._get_lines(first_line, last_line)
+            if len(content) >= BACKGROUND_HIGHLIGHT_MIN_CHARS:
+                self._highlight_region(first_line, last_document_line)
+                return
+            if not self._highlight_lines(first_line, last_line, content) or last_line >= last_document_line:
+                return
+            # The state leaving the region changed, so the lines below lex differently too
+            chunk_lines = max(2 * chunk_lines, 64)
+            first_line, last_line = last_line + 1, min(last_document_line, last_line + chunk_lines)
+
+    def _on_yview_changed(self, first_fraction, last_fraction):
+        if self._clean_lines is not None and self._viewport_after_id is None:
+            # Coalesce the burst of callbacks a scroll produces into one pass
+            self._viewport_after_id = self.text_area.after_idle(self._highlight_viewport)
+
+    def _viewport_window(self):
+        """First and last line of the viewport, widened by VIEWPORT_HIGHLIGHT_MARGIN."""
+        total_lines = self._last_line()
+        top_fraction, bottom_fraction = self.text_area.yview()
+        first_visible = int(top_fraction * total_lines) + 1
+        # Before the widget is mapped yview covers almost nothing; assume its configured height
+        last_visible = max(int(bottom_fraction * total_lines) + 1, first_visible + int(self.text_area.cget("height")))
+        return (max(1, first_visible - VIEWPORT_HIGHLIGHT_MARGIN),
+                min(total_lines, last_visible + VIEWPORT_HIGHLIGHT_MARGIN))
+
+    def _highlight_viewport(self):
+        """Highlights the not yet clean lines in and around the viewport."""
+        self._viewport_after_id = None
+        if self._clean_lines is None:
+            return
+        first_line, last_line = self._viewport_window()
+        last_document_line = self._last_line()
+        while True:
+            gaps = self._clean_lines.missing(first_line, last_line)
+            if not gaps:
+                return
+            gap_first, gap_last = gaps[0]
+            self._recover_line_state(gap_first)
+            state_changed = self._highlight_lines(gap_first, gap_last)
+            self._clean_lines.add(gap_first, gap_last)
+            if state_changed and gap_last < last_document_line:
+                # Everything below was lexed from a state that no longer holds
+                self._clean_lines.remove(gap_last + 1, last_document_line)
+                self._line_states.invalidate_from(gap_last + 2)
+
+    def _recover_line_state(self, line):
+        """Makes sure the start state of `line` is known before lexing from it.
+
+        After a jump into a large document the nearest known state may be far above;
+        lines up to VIEWPORT_STATE_LOOKBACK_LINES away are lexed for their states
+        only, beyond that the line is assumed to start outside any string.
+        """
+        if self._line_states.get(line) != LEXER_STATE_UNKNOWN:
+            return
+        known_line = self._line_states.last_known_line(line)
+        if line - known_line <= VIEWPORT_STATE_LOOKBACK_LINES:
+            lines = self.document.lines
+            content = self.document.slice(lines.offset(known_line), lines.offset(line))
+            _, line_states = self.lexer.lex(content, known_line, self._line_states.get(known_line), collect_ranges=False)
+            self._line_states.update(known_line, line_states)
+        else:
+            self._line_states.update(line, [LEXER_STATE_NORMAL])
+
+    def _last_line(self):
+        return self.document.lines.line_count
+
+    def _get_lines(self, first_line, last_line):
+        """Text of first_line..last_line including their newlines, as the widget would return it."""
+        lines = self.document.lines
+        content = self.document.slice(lines.offset(first_line), lines.offset(last_line + 1))
+        if last_line >= lines.line_count:
+            content += "\n" # The widget's final newline
+        return content
+
+    def _line_state_at(self, line):
+        state = self._line_states.get(line)
+        return LEXER_STATE_NORMAL if state == LEXER_STATE_UNKNOWN else state
+
+    def _highlight_lines(self, first_line, last_line, content=None):
+        """Lexes and tags first_line..last_line from the cached start state of first_line.
+
+        Returns True if the start state of the line after the region changed, i.e. the
+        lines below have to be lexed again as well.
+        """
+        if content is None:
+            content = self._get_lines(first_line, last_line)
+        previous_next_state = self._line_states.get(last_line + 1)
+        ranges, line_states = self.lexer.lex(content, first_line, self._line_state_at(first_line))
+        self._remove_syntax_tags(first_line, last_line)
+        # Apply new tags, one Tcl call per tag
+        for tag, indices in ranges.items():
+            if indices:
+                self.text_area.tag_add(tag, *indices)
+        self._line_states.update(first_line, line_states)
+        return line_states[-1] != previous_next_state
+
+    def _remove_syntax_tags(self, first_line, last_line):
+        for tag in self.lexer.tags:
+            self.text_area.tag_remove(tag, f"{first_line}.0", f"{last_line + 1}.0")
+
+    def _highlight_region(self, first_line, last_line):
+        """Highlights small regions right away and hands large ones to the worker thread."""
+        content = self._get_lines(first_line, last_line)
+        if len(content) < BACKGROUND_HIGHLIGHT_MIN_CHARS:
+            self._highlight_job = None
+            self._highlight_lines(first_line, last_line, content)
+            return
+
+        if self._highlighter is None:
+            self._highlighter = HighlightWorker(self.lexer)
+        self._highlight_job = (self._edit_version, first_line, last_line)
+        self._highlighter.submit(self._edit_version, first_line, content, self._line_state_at(first_line))
+        if self._highlight_poll_id is None:
+            self._highlight_poll_id = self.text_area.after(HIGHLIGHT_POLL_MS, self._poll_highlight_result)
+
+    def _poll_highlight_result(self):
+        self._highlight_poll_id = None
+        if not self._highlight_job:
+            return
+        result = self._highlighter.take_result()
+        if result is None or result[0] != self._highlight_job[0]:
+            # Still lexing, or the result belongs to a snapshot that was superseded
+            self._highlight_poll_id = self.text_area.after(HIGHLIGHT_POLL_MS, self._poll_highlight_result)
+            return
 
-        # Apply new tags
-        for tag, pattern in SYNTAX_RULES:
-            for match in re.finditer(pattern, content, re.MULTILINE if tag.startswith("multiline") else 0):
-                start_index = self.text_area.index(f"1.0 + {match.start()} chars")
-                end_index = self.text_area.index(f"1.0 + {match.end()} chars")
-                self.text_area.tag_add(tag, start_index, end_index)
+        version, first_line, ranges, line_states = result
+        self._line_states.update(first_line, line_states)
+        batches = self._highlight_batches(first_line, self._highlight_job[2], ranges)
+        batches.reverse() # Popped from the end, so the top of the region comes first
+        self._apply_highlight_batches(version, batches)
+
+    @staticmethod
+    def _highlight_batches(first_line, last_line, ranges):
+        """Splits the tags of first_line..last_line into [(remove_from, remove_to, {tag: indices})].
+
+        Each batch covers whole lines: its old tags are removed and the new ones
+        added in the same after() callback, so no part of the text is shown
+        untagged in between. A range running past its batch (a long string) moves
+        the start of the next batch's removal after it.
+        """
+        positions = [] # (start line, tag, start, end) of every range
+        for tag, indices in ranges.items():
+            for position in range(0, len(indices), 2):
+                start = indices[position]
+                positions.append((int(start.partition(".")[0]), tag, start, indices[position + 1]))
+        positions.sort(key=lambda position: position[0])
+
+        batches = []
+        removed_to = (first_line, 0)
+        position = 0
+        while position < len(positions) or not batches:
+            end = min(position + HIGHLIGHT_BATCH_RANGES, len(positions))
+            while end < len(positions) and positions[end][0] == positions[end - 1][0]:
+                end += 1 # Keep a line's ranges together
+            # The batch runs to the line its successor starts on, the last one to the end of the region
+            boundary = (positions[end][0], 0) if end < len(positions) else (last_line + 1, 0)
+            added = {}
+            batch_to = boundary
+            for _, tag, start, range_end in positions[position:end]:
+                added.setdefault(tag, []).extend((start, range_end))
+                line, _, column = range_end.partition(".")
+                batch_to = max(batch_to, (int(line), int(column)))
+            remove_from = "%d.%d" % removed_to
+            remove_to = "%d.%d" % max(batch_to, removed_to)
+            batches.append((remove_from, remove_to, added))
+            removed_to = max(batch_to, removed_to)
+            position = end
+        return batches
+
+    def _apply_highlight_batches(self, version, batches):
+        # An edit in the meantime clears _highlight_job and re-dirties its lines
+        if not self._highlight_job or self._highlight_job[0] != version:
+            return
+        if batches:
+            remove_from, remove_to, added = batches.pop()
+            for tag in self.lexer.tags:
+                self.text_area.tag_remove(tag, remove_from, remove_to)
+            for tag, indices in added.items():
+                self.text_area.tag_add(tag, *indices)
+        if batches:
+            self.text_area.after(0, self._apply_highlight_batches, version, batches)
+        else:
+            self._highlight_job = None
 
     def get_content(self):
-        return self.text_area.get("1.0", tk.END)
+        # Same as the widget's get("1.0", END), which always ends with a newline
+        return self.document.text() + "\n"
 
-    def set_content(self, text_content, initial_load=False):
+    def set_content(self, text_content, initial_load=False, highlight_state=None):
+        """Replaces the text. highlight_state, from highlight_state() on the same text, saves lexing it again."""
         current_state = self.text_area.cget("state")
         self.text_area.config(state=tk.NORMAL) # Ensure editable for programmatic change
 
-        self.text_area.delete("1.0", tk.END)
-        self.text_area.insert("1.0", text_content)
-        self.apply_syntax_highlighting() # Always highlight after setting content
+        self._journal_paused = initial_load # Loading the file is not an unsaved change
+        try:
+            self.text_area.delete("1.0", tk.END)
+            self.text_area.insert("1.0", text_content)
+        finally:
+            self._journal_paused = False
+        if highlight_state and highlight_state[0] is self.lexer:
+            self._restore_highlighting(*highlight_state[1:])
+        else:
+            self.apply_syntax_highlighting(allow_background=True) # Always highlight after setting content
 
         if initial_load:
+            self.undo_history.clear() # Loading a file is not an undoable edit
             self.mark_as_modified(False) # Reset modified state and tab text
             self.text_area.edit_reset() # Clears undo/redo stack for new file
             self.text_area.edit_modified(False) # Reset the widget's own modified flag
@@ -91,6 +1415,1872 @@ class TextEditor:
     def clear_content(self):
         self.text_area.delete("1.0", tk.END)
 
+    def load_streamed(self, loader):
+        """Fills the editor from a FileLoader over the next event-loop iterations.
+
+        One chunk is inserted per after() callback, so the window stays responsive;
+        the text is read-only, but scrollable, until the whole file is in.
+        """
+        self.is_loading = True
+        self._loader = loader
+        self.undo_history.clear()
+        self.mark_as_modified(False)
+        self.text_area.config(state=tk.DISABLED)
+        self._load_after_id = self.text_area.after(0, self._load_next_chunk)
+
+    def _load_next_chunk(self):
+        self._load_after_id = None
+        loader = self._loader
+        try:
+            chunk = loader.chunks.get_nowait()
+        except queue.Empty:
+            self._load_after_id = self.text_area.after(STREAMED_OPEN_POLL_MS, self._load_next_chunk)
+            return
+        if chunk is None:
+            self._finish_streamed_load()
+            return
+        self.text_area.config(state=tk.NORMAL)
+        try:
+            self.text_area.insert(tk.END, chunk)
+        finally:
+            self.text_area.config(state=tk.DISABLED) # Typing and pasting stay off until the load is done
+        if self.status_bar:
+            self.status_bar.update_status(f"Loading {os.path.basename(loader.filepath)}: {loader.progress()}%")
+        self._load_after_id = self.text_area.after(0, self._load_next_chunk)
+
+    def _finish_streamed_load(self):
+        loader = self._loader
+        self._loader = None
+        self.is_loading = False
+        filename = os.path.basename(loader.filepath)
+        if loader.error:
+            # Keep the partial text read-only so it can't be edited and saved over the file
+            self.load_error = loader.error
+            self.text_area.config(state=tk.DISABLED)
+            self.undo_history.clear()
+            self.mark_as_modified(False)
+            print(f"Error reading file for new tab: {loader.error}")
+            self.status_bar.update_status(f"Error opening: {filename} (partly loaded, read-only)")
+            return
+        self.text_area.config(state=tk.NORMAL)
+        self.undo_history.clear()
+        self.mark_as_modified(False)
+        self.text_area.edit_reset()
+        self.text_area.edit_modified(False)
+        self.apply_syntax_highlighting(allow_background=True)
+        self.status_bar.update_status(f"Loaded {filename}")
+
+    def _cancel_streamed_load(self):
+        if self._loader:
+            self._loader.cancel()
+            self._loader = None
+        if self._load_after_id:
+            self.text_area.after_cancel(self._load_after_id)
+            self._load_after_id = None
+
+    def close(self):
+        """Releases the tab's widgets, which also stops the highlight worker and any load."""
+        self.frame.destroy()
+
+
+# --- Regex Search ---
+SEARCH_PATTERN_CACHE_SIZE = 32
+
+_search_patterns = OrderedDict() # (query, ignore_case) -> compiled pattern, least recently used first
+
+
+def compile_search_pattern(query, ignore_case=False):
+    """The compiled regular expression for a search query, from a small LRU cache.
+
+    Raises re.error if the query is not a valid pattern.
+    """
+    key = (query, ignore_case)
+    pattern = _search_patterns.get(key)
+    if pattern is None:
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0) # ^ and $ match at every line
+        pattern = _search_patterns[key] = re.compile(query, flags)
+        while len(_search_patterns) > SEARCH_PATTERN_CACHE_SIZE:
+            _search_patterns.popitem(last=False)
+    else:
+        _search_patterns.move_to_end(key)
+    return pattern
+
+
+class SearchMatches:
+    """The spans of every match of a pattern in one version of a document.
+
+    Found in a single pass when created; next_match() and previous_match() then
+    bisect the sorted start offsets, wrapping around at either end, instead of
+    searching the text again. Empty matches are left out, as there is nothing to
+    select.
+    """
+    def __init__(self, pattern, text, version):
+        self.pattern = pattern
+        self.version = version
+        self.starts = array("q")
+        self.ends = array("q")
+        for match in pattern.finditer(text):
+            if match.end() > match.start():
+                self.starts.append(match.start())
+                self.ends.append(match.end())
+
+    def __len__(self):
+        return len(self.starts)
+
+    def next_match(self, offset):
+        """(start, end, wrapped) of the first match starting at or after offset, or None if there are none."""
+        if not self.starts:
+            return None
+        position = bisect.bisect_left(self.starts, offset)
+        wrapped = position == len(self.starts)
+        if wrapped:
+            position = 0
+        return self.starts[position], self.ends[position], wrapped
+
+    def previous_match(self, offset):
+        """(start, end, wrapped) of the last match starting before offset, or None if there are none."""
+        if not self.starts:
+            return None
+        position = bisect.bisect_left(self.starts, offset) - 1
+        wrapped = position < 0
+        return self.starts[position], self.ends[position], wrapped
+
+
+# --- File Format Sniffing ---
+SNIFF_BYTES = 8192 # Read from the start of a file to tell its format
+BINARY_CONTROL_RATIO = 0.3 # More non-text bytes than this in the sample means binary
+BINARY_PREVIEW_BYTES = 16 * 1024 # Shown as a hex dump for binary files
+BYTE_ORDER_MARKS = [ # Longest first: the UTF-32 LE mark starts with the UTF-16 LE one
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+# Bytes that occur in text: printable ones plus BEL, BS, TAB, LF, FF, CR and ESC
+TEXT_BYTES = bytes([7, 8, 9, 10, 12, 13, 27]) + bytes(range(0x20, 0x7f)) + bytes(range(0x80, 0x100))
+ASCII_SAMPLE = b"\r\n\t azAZ09" # Decodes to itself in ASCII-compatible encodings
+
+
+class FileFormat:
+    """How a file's bytes become editor text, and back again on save."""
+    def __init__(self, encoding=None, newline=None, is_binary=False):
+        self.encoding = encoding # None: the platform default, as open() uses
+        self.newline = newline # "\n", "\r\n" or "\r"; None: the platform default
+        self.is_binary = is_binary
+
+    @property
+    def is_ascii_compatible(self):
+        """Whether ASCII characters, newlines included, are the same single bytes (not so in UTF-16/32)."""
+        if self.encoding is None:
+            return True # The platform default is always a superset of ASCII
+        try:
+            return ASCII_SAMPLE.decode(self.encoding) == ASCII_SAMPLE.decode("ascii")
+        except (UnicodeDecodeError, LookupError):
+            return False
+
+
+def sniff_file(filepath):
+    """Tells a file's format from its first SNIFF_BYTES bytes."""
+    with open(filepath, "rb") as input_file:
+        sample = input_file.read(SNIFF_BYTES)
+    return sniff_bytes(sample, final=len(sample) < SNIFF_BYTES)
+
+
+def sniff_bytes(sample, final=True):
+    """Tells the format of a file starting with sample; final means sample is the whole file."""
+    for mark, encoding in BYTE_ORDER_MARKS:
+        if sample.startswith(mark):
+            # The sample may end in the middle of a character
+            return FileFormat(encoding, _detect_newline(sample.decode(encoding, errors="ignore")))
+    if b"\0" in sample:
+        return FileFormat(is_binary=True)
+    if sample and len(sample.translate(None, TEXT_BYTES)) > BINARY_CONTROL_RATIO * len(sample):
+        return FileFormat(is_binary=True)
+    try:
+        # Unless it is the whole file, the sample may end in the middle of a character
+        text = codecs.getincrementaldecoder("utf-8")().decode(sample, final=final)
+        encoding = "utf-8"
+    except UnicodeDecodeError:
+        text = sample.decode("latin-1") # Decodes any bytes, so nothing is lost on save
+        encoding = "latin-1"
+    return FileFormat(encoding, _detect_newline(text))
+
+
+def _detect_newline(text):
+    """The most common line ending in text, or None if it has no line breaks."""
+    crlf = text.count("\r\n")
+    counts = {"\r\n": crlf, "\n": text.count("\n") - crlf, "\r": text.count("\r") - crlf}
+    newline = max(counts, key=counts.get)
+    return newline if counts[newline] else None
+
+
+def format_hex_dump(data, offset=0, width=16):
+    """Classic offset / hex bytes / printable characters dump of data."""
+    lines = []
+    for position in range(0, len(data), width):
+        row = data[position:position + width]
+        hex_part = " ".join(f"{byte:02x}" for byte in row)
+        text_part = "".join(chr(byte) if 0x20 <= byte < 0x7f else "." for byte in row)
+        lines.append(f"{offset + position:08x}  {hex_part:<{width * 3 - 1}}  |{text_part}|")
+    return "\n".join(lines)
+
+# --- Streamed File Open ---
+STREAMED_OPEN_MIN_BYTES = 1024 * 1024 # Smaller files are read in one go
+STREAMED_OPEN_CHUNK_CHARS = 64 * 1024 # Read by the worker and inserted per after() callback
+STREAMED_OPEN_QUEUE_CHUNKS = 16 # How far reading may run ahead of the UI
+STREAMED_OPEN_POLL_MS = 20
+
+
+class FileLoader:
+    """Reads a text file in chunks on a background thread.
+
+    Chunks arrive in the `chunks` queue, followed by None once the file has been
+    read or reading failed (see `error`). The queue is bounded, so reading never
+    runs far ahead of the UI; cancel() stops the thread.
+    """
+    def __init__(self, filepath, encoding=None):
+        self.filepath = filepath
+        self.encoding = encoding
+        self.total_bytes = max(os.path.getsize(filepath), 1)
+        self.bytes_read = 0
+        self.error = None
+        self.chunks = queue.Queue(maxsize=STREAMED_OPEN_QUEUE_CHUNKS)
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+
+    def _read(self):
+        try:
+            with open(self.filepath, "r", encoding=self.encoding) as input_file:
+                while not self._cancelled.is_set():
+                    chunk = input_file.read(STREAMED_OPEN_CHUNK_CHARS)
+                    if not chunk:
+                        break
+                    self.bytes_read = input_file.buffer.tell()
+                    self._put(chunk)
+        except Exception as e:
+            self.error = e
+        self._put(None)
+
+    def _put(self, item):
+        while not self._cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def progress(self):
+        """Percentage of the file read so far."""
+        return min(100, self.bytes_read * 100 // self.total_bytes)
+
+    def cancel(self):
+        self._cancelled.set()
+
+# --- Atomic Save ---
+SAVE_CHUNK_CHARS = 256 * 1024 # Written (and fingerprinted) per step
+SAVE_POLL_MS = 20
+SAVE_SUFFIX = "\n" # Written after the document, so a saved file holds get_content()
+
+
+class SaveEngine:
+    """Writes document snapshots to disk on a background thread.
+
+    Each save goes to a temporary file in the target's directory, which is fsynced
+    and then renamed over the target, so a crash mid-write leaves the old file
+    intact. A save whose content fingerprint matches what this engine last wrote to
+    the same file is skipped, unless the file has been changed since. Saves run in submission order; results are collected
+    with take_results().
+    """
+    def __init__(self):
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._fingerprints = {} # Real path -> (digest, file_stamp) of the content last written there
+        self._next_job_id = 0
+        self._thread = None
+        # New files get the permissions open() would give them
+        umask = os.umask(0)
+        os.umask(umask)
+        self._new_file_mode = 0o666 & ~umask
+
+    def save(self, filepath, snapshot, suffix="", file_format=None):
+        """Queues snapshot (followed by suffix) to be written to filepath; returns a job id.
+
+        The text is encoded and its line endings translated as file_format says.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._next_job_id += 1
+        self._jobs.put((self._next_job_id, filepath, snapshot, suffix, file_format or FileFormat(), time.perf_counter()))
+        return self._next_job_id
+
+    def take_results(self):
+        """Finished saves as (job_id, filepath, status, seconds, error) tuples.
+
+        status is "written", "skipped" (content unchanged) or "error".
+        """
+        results = []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def wait(self):
+        """Blocks until every queued save has finished."""
+        if self._thread is not None:
+            self._jobs.join()
+
+    def _run(self):
+        while True:
+            job_id, filepath, snapshot, suffix, file_format, started = self._jobs.get()
+            try:
+                status = self._write(filepath, snapshot, suffix, file_format)
+                error = None
+            except Exception as e:
+                status, error = "error", e
+            self._results.put((job_id, filepath, status, time.perf_counter() - started, error))
+            self._jobs.task_done()
+
+    def _chunks(self, snapshot, suffix):
+        yield from snapshot.chunks(chunk_size=SAVE_CHUNK_CHARS)
+        if suffix:
+            yield suffix
+
+    def _write(self, filepath, snapshot, suffix, file_format):
+        target = os.path.realpath(filepath) # Replace a symlink's target, not the link
+        fingerprint = hashlib.blake2b()
+        fingerprint.update(f"{file_format.encoding}|{file_format.newline}|".encode())
+        for chunk in self._chunks(snapshot, suffix):
+            fingerprint.update(chunk.encode("utf-8", "surrogatepass"))
+        digest = fingerprint.digest()
+        if self._fingerprints.get(target) == (digest, file_stamp(target)):
+            return "skipped"
+
+        directory = os.path.dirname(target)
+        try:
+            mode = stat.S_IMODE(os.stat(target).st_mode)
+        except OSError:
+            mode = self._new_file_mode
+        handle, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(target)}.", suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w", encoding=file_format.encoding, newline=file_format.newline) as output_file:
+                for chunk in self._chunks(snapshot, suffix):
+                    output_file.write(chunk)
+                output_file.flush()
+                os.fsync(output_file.fileno())
+            os.chmod(temp_path, mode)
+            os.replace(temp_path, target)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        self._fsync_directory(directory)
+        self._fingerprints[target] = (digest, file_stamp(target))
+        return "written"
+
+    def _fsync_directory(self, directory):
+        # Makes the rename itself durable; not possible on every platform
+        try:
+            directory_handle = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(directory_handle)
+        except OSError:
+            pass
+        finally:
+            os.close(directory_handle)
+
+# --- Closed Tab Cache ---
+CLOSED_TAB_CACHE_BUDGET_BYTES = 64 * 1024 * 1024 # Memory kept for recently closed tabs
+
+
+def file_stamp(filepath):
+    """(modification time, size) of a file, or None if it can't be read."""
+    try:
+        file_stat = os.stat(filepath)
+    except OSError:
+        return None
+    return (file_stat.st_mtime_ns, file_stat.st_size)
+
+
+class ClosedTab:
+    """What reopening an unchanged file needs: its text and how it was highlighted."""
+    def __init__(self, stamp, content, file_format, highlight_state):
+        self.stamp = stamp
+        self.content = content
+        self.file_format = file_format
+        self.highlight_state = highlight_state # From TextEditor.highlight_state(), or None
+        self.size_bytes = sys.getsizeof(content)
+        if highlight_state:
+            _, ranges, line_states = highlight_state
+            self.size_bytes += len(line_states)
+            self.size_bytes += sum(sys.getsizeof(index) for indices in ranges.values() for index in indices)
+
+
+class ClosedTabCache:
+    """LRU cache of recently closed, unmodified tabs, keyed by path.
+
+    An entry is only handed out while the file's modification time and size are
+    still those it was loaded or saved with. The least recently closed entries are
+    evicted once the cache holds more than budget_bytes.
+    """
+    def __init__(self, budget_bytes=CLOSED_TAB_CACHE_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict() # Absolute path -> ClosedTab, least recently closed first
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, filepath, entry):
+        self.discard(filepath)
+        if entry.size_bytes > self.budget_bytes:
+            return
+        self._entries[os.path.abspath(filepath)] = entry
+        self.size_bytes += entry.size_bytes
+        while self.size_bytes > self.budget_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size_bytes -= evicted.size_bytes
+            self.evictions += 1
+
+    def take(self, filepath):
+        """Removes and returns the entry for filepath if the file is unchanged since, else None."""
+        entry = self._entries.pop(os.path.abspath(filepath), None)
+        if entry:
+            self.size_bytes -= entry.size_bytes
+            if entry.stamp != file_stamp(filepath):
+                entry = None # Changed on disk
+        if entry:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return entry
+
+    def discard(self, filepath):
+        entry = self._entries.pop(os.path.abspath(filepath), None)
+        if entry:
+            self.size_bytes -= entry.size_bytes
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+        }
+
+# --- Crash Recovery Journal ---
+RECOVERY_DIR = os.path.join(os.path.expanduser("~"), ".basic_text_editor", "recovery")
+JOURNAL_SUFFIX = ".journal"
+UNRECOVERABLE_JOURNAL_SUFFIX = ".unrecoverable" # Added to journals that failed to replay, so they aren't offered again
+JOURNAL_COMPACT_MIN_BYTES = 1024 * 1024 # Edits logged before a journal may be compacted
+JOURNAL_CHUNK_CHARS = 256 * 1024 # Text per record when a snapshot is written
+JOURNAL_REPLAY_BLOCK_CHARS = 4096 # Block size of the text edits are replayed on
+
+
+class EditJournal:
+    """Append-only file of one tab's unsaved edits, from which the text can be rebuilt after a crash.
+
+    The file starts with a header naming the file the tab belongs to. The text the
+    edits apply to is either that file, as it was at the header's stamp, or the
+    text records following the header. Then come the edits, each written as it
+    happens, so recording costs as much as the edit, not the document. Once the
+    edits outweigh the document, compact() rewrites the journal as a snapshot.
+
+    Records are a line of ASCII fields followed by UTF-8 text of the given byte
+    length: "H <length>" (JSON header), "T <length>" (text) and
+    "E <offset> <removed characters> <length>" (edit).
+    """
+    def __init__(self, directory, filepath, file_format, stamp=None):
+        os.makedirs(directory, exist_ok=True)
+        # The pid tells journals of running editors from those of crashed ones
+        handle, self.path = tempfile.mkstemp(prefix=f"{os.getpid()}-", suffix=JOURNAL_SUFFIX, dir=directory)
+        self.file_format = file_format
+        self._file = os.fdopen(handle, "wb")
+        self._write_header(filepath, stamp)
+        self._file.flush()
+        self.edit_bytes = 0 # Logged since the journal was started or compacted
+
+    def _write_header(self, filepath, stamp):
+        header = {"path": filepath, "encoding": self.file_format.encoding,
+                  "newline": self.file_format.newline, "stamp": stamp}
+        self._write_record("H", json.dumps(header))
+
+    def _write_record(self, kind, text, *fields):
+        data = text.encode("utf-8", errors="surrogatepass")
+        head = " ".join([kind] + [str(field) for field in fields] + [str(len(data))])
+        self._file.write(head.encode("ascii") + b"\n" + data)
+        return len(data)
+
+    def append(self, edits):
+        """Logs (version, offset, removed, inserted) edits, as in Document.edit_log."""
+        for _, offset, removed, inserted in edits:
+            self.edit_bytes += self._write_record("E", inserted, offset, len(removed)) + len(removed)
+        self._file.flush() # Into the OS, which keeps it even if this process dies
+
+    def needs_compaction(self, document_length):
+        return self.edit_bytes > max(JOURNAL_COMPACT_MIN_BYTES, document_length)
+
+    def compact(self, filepath, snapshot):
+        """Replaces the journal with a header for filepath and the snapshot's text."""
+        directory, name = os.path.split(self.path)
+        handle, temporary_path = tempfile.mkstemp(prefix=name, dir=directory)
+        old_file, self._file = self._file, os.fdopen(handle, "wb")
+        try:
+            self._write_header(filepath, None)
+            for chunk in snapshot.chunks(chunk_size=JOURNAL_CHUNK_CHARS):
+                self._write_record("T", chunk)
+            self._file.flush()
+            os.replace(temporary_path, self.path)
+        except OSError:
+            self._file.close()
+            os.remove(temporary_path)
+            self._file = old_file
+            raise
+        old_file.close()
+        self.edit_bytes = 0
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def find(directory):
+        """Journals in directory left behind by editors that are no longer running, oldest first."""
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return []
+        paths = []
+        for name in names:
+            pid = name.split("-", 1)[0]
+            if name.endswith(JOURNAL_SUFFIX) and not (pid.isdigit() and _process_is_running(int(pid))):
+                paths.append(os.path.join(directory, name))
+        return sorted(paths, key=os.path.getmtime)
+
+    @staticmethod
+    def set_aside(journal_path):
+        """Renames a journal that can't be replayed so find() skips it; returns its new path, or None if it's gone."""
+        new_path = journal_path + UNRECOVERABLE_JOURNAL_SUFFIX
+        try:
+            os.replace(journal_path, new_path)
+            return new_path
+        except OSError:
+            try:
+                os.remove(journal_path)
+            except OSError:
+                pass
+            return None
+
+    @staticmethod
+    def replay(journal_path):
+        """Rebuilds the text of a journal. Returns (filepath, FileFormat, text).
+
+        Raises ValueError if the journal refers to a file that changed since.
+        """
+        with open(journal_path, "rb") as journal_file:
+            data = journal_file.read()
+        header = None
+        base = []
+        edits = []
+        position = 0
+        while True:
+            line_end = data.find(b"\n", position)
+            if line_end < 0:
+                break
+            fields = data[position:line_end].split()
+            length = int(fields[-1])
+            if line_end + 1 + length > len(data):
+                break # Cut off by the crash
+            text = data[line_end + 1:line_end + 1 + length].decode("utf-8", errors="surrogatepass")
+            position = line_end + 1 + length
+            if fields[0] == b"H":
+                header = json.loads(text)
+            elif fields[0] == b"T":
+                base.append(text)
+            elif fields[0] == b"E":
+                _merge_journal_edit(edits, int(fields[1]), int(fields[2]), text)
+        if header is None:
+            raise ValueError(f"{journal_path} is not a journal")
+
+        file_format = FileFormat(header["encoding"], header["newline"])
+        if header["stamp"]:
+            if file_stamp(header["path"]) != tuple(header["stamp"]):
+                raise ValueError(f"{header['path']} changed since the edits were made")
+            with open(header["path"], "r", encoding=file_format.encoding) as input_file:
+                base = [input_file.read()]
+        text = TextBlocks("".join(base))
+        for offset, removed_length, inserted in edits:
+            text.replace(offset, offset + removed_length, inserted)
+        return header["path"], file_format, text.text()
+
+
+class TextBlocks:
+    """Text as blocks of about JOURNAL_REPLAY_BLOCK_CHARS, for applying many scattered edits.
+
+    An edit only rebuilds the block(s) it touches, found through a Fenwick tree of
+    block lengths, so replaying k edits costs O(k log n) instead of a piece table's
+    O(k * pieces).
+    """
+    def __init__(self, text=""):
+        self._set_blocks(self._chunk(text))
+
+    @staticmethod
+    def _chunk(text):
+        return [text[position:position + JOURNAL_REPLAY_BLOCK_CHARS]
+                for position in range(0, len(text), JOURNAL_REPLAY_BLOCK_CHARS)] or [""]
+
+    def _set_blocks(self, blocks):
+        self._blocks = blocks
+        self._lengths = FenwickTree([len(block) for block in blocks])
+        self._length = sum(len(block) for block in blocks)
+
+    def __len__(self):
+        return self._length
+
+    def replace(self, start, end, text):
+        start = max(0, min(start, self._length))
+        end = max(start, min(end, self._length))
+        first, block_start = self._lengths.find(start)
+        if first == len(self._blocks):
+            # start is the end of the text; append to the last block
+            first -= 1
+            block_start -= len(self._blocks[first])
+        last = first
+        block_end = block_start + len(self._blocks[first])
+        while block_end < end:
+            last += 1
+            block_end += len(self._blocks[last])
+        joined = "".join(self._blocks[first:last + 1])
+        replaced = joined[:start - block_start] + text + joined[end - block_start:]
+        if first == last and len(replaced) <= 2 * JOURNAL_REPLAY_BLOCK_CHARS:
+            self._blocks[first] = replaced
+            self._lengths.add(first, len(replaced) - len(joined))
+            self._length += len(replaced) - len(joined)
+        else:
+            self._blocks[first:last + 1] = self._chunk(replaced)
+            self._set_blocks(self._blocks)
+
+    def text(self):
+        return "".join(self._blocks)
+
+
+def _merge_journal_edit(edits, offset, removed_length, inserted):
+    """Appends an edit to edits, folding typing and Backspace into the edit before it."""
+    if edits:
+        last_offset, last_removed_length, last_inserted = edits[-1]
+        last_end = last_offset + len(last_inserted)
+        if removed_length == 0 and offset == last_end:
+            edits[-1] = (last_offset, last_removed_length, last_inserted + inserted)
+            return
+        if not inserted and offset + removed_length == last_end and offset >= last_offset:
+            edits[-1] = (last_offset, last_removed_length, last_inserted[:offset - last_offset])
+            return
+    edits.append((offset, removed_length, inserted))
+
+
+def _process_is_running(pid):
+    if pid == os.getpid():
+        return True
+    if os.name != "posix":
+        return False # No cheap check; signal 0 means something else on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True # Someone else's process
+    return True
+
+# --- Large File Viewer ---
+LARGE_FILE_MIN_BYTES = 64 * 1024 * 1024 # Files at least this big open read-only in a LargeFileViewer
+LARGE_FILE_INDEX_STRIDE_BYTES = 64 * 1024 # One index checkpoint per this many bytes
+LARGE_FILE_WINDOW_LINES = 2000 # Lines loaded into the widget at a time
+LARGE_FILE_WINDOW_MAX_BYTES = 4 * 1024 * 1024 # Caps the window when lines are very long
+LARGE_FILE_SWAP_MARGIN_LINES = 200 # Swap the window once the viewport gets this close to its edge
+LARGE_FILE_POLL_MS = 200
+
+
+class LargeFileIndex:
+    """Sparse line index of a memory-mapped file, built on a background thread.
+
+    Only the line number and offset of one line start per LARGE_FILE_INDEX_STRIDE_BYTES
+    are kept, so the index of a multi-GB file stays around a megabyte; the lines in
+    between are found by scanning forward from the nearest checkpoint.
+    """
+    def __init__(self, filepath, encoding="utf-8"):
+        if not FileFormat(encoding).is_ascii_compatible:
+            # Lines are found by their b"\n" bytes, which e.g. UTF-16 doesn't have
+            raise ValueError(f"Can't index lines of {encoding} text")
+        self.filepath = filepath
+        self.encoding = encoding
+        self._file = open(filepath, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._checkpoint_lines = array("Q", [1])
+        self._checkpoint_offsets = array("Q", [0])
+        self.indexed_bytes = 0
+        self.line_count = 0 # Lines indexed so far; the total once complete
+        self.complete = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._build, daemon=True)
+        self._thread.start()
+
+    def _count_newlines(self, start, end):
+        count = 0
+        for position in range(start, end, LARGE_FILE_INDEX_STRIDE_BYTES):
+            count += self._mmap[position:min(position + LARGE_FILE_INDEX_STRIDE_BYTES, end)].count(b"\n")
+        return count
+
+    def _build(self):
+        offset, line = 0, 1
+        while offset < self.size:
+            if self._stop.is_set():
+                return
+            # The next checkpoint is the first line starting at least a stride further on
+            newline = self._mmap.find(b"\n", min(offset + LARGE_FILE_INDEX_STRIDE_BYTES, self.size) - 1)
+            end = self.size if newline == -1 else newline + 1
+            line += self._count_newlines(offset, end)
+            with self._lock:
+                if end < self.size:
+                    self._checkpoint_lines.append(line)
+                    self._checkpoint_offsets.append(end)
+                self.indexed_bytes = end
+                self.line_count = line - 1
+            offset = end
+        with self._lock:
+            # A last line without a trailing newline still counts
+            if self.size and self._mmap[self.size - 1:self.size] != b"\n":
+                self.line_count = line
+            self.complete = True
+
+    def line_offset(self, line):
+        """Offset of the start of `line`, or None if it is not indexed (yet)."""
+        with self._lock:
+            checkpoint = bisect.bisect_right(self._checkpoint_lines, line) - 1
+            current_line = self._checkpoint_lines[checkpoint]
+            offset = self._checkpoint_offsets[checkpoint]
+            limit = self.size if self.complete else self.indexed_bytes
+        while current_line < line:
+            newline = self._mmap.find(b"\n", offset, limit)
+            if newline == -1:
+                return None
+            offset = newline + 1
+            current_line += 1
+        return offset
+
+    def read_lines(self, first_line, count):
+        """Text of up to `count` lines from first_line on, at most LARGE_FILE_WINDOW_MAX_BYTES of it."""
+        start = self.line_offset(first_line)
+        if start is None:
+            return ""
+        end = self.line_offset(first_line + count)
+        if end is None:
+            end = self.size if self.complete else self.indexed_bytes
+        end = min(end, start + LARGE_FILE_WINDOW_MAX_BYTES)
+        return self._mmap[start:end].decode(self.encoding, errors="replace")
+
+    def estimated_line_count(self):
+        """The line count, extrapolated from the indexed part while indexing is still running."""
+        if self.complete or not self.indexed_bytes:
+            return max(self.line_count, 1)
+        return max(int(self.line_count * self.size / self.indexed_bytes), 1)
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if not self._mmap.closed:
+            self._mmap.close()
+            self._file.close()
+
+
+class ReadOnlyView:
+    """Base of the tabs that show a file without letting it be edited.
+
+    Offers the parts of the TextEditor interface App relies on; subclasses create
+    self.frame and self.text_area.
+    """
+    is_modified = False
+    is_loading = False
+    load_error = None
+
+    def mark_as_modified(self, modified_status):
+        pass # Read-only
+
+    def set_language_for(self, filepath):
+        pass # Never highlighted
+
+    def clear_search_highlights(self):
+        self.text_area.tag_remove("search_highlight", "1.0", tk.END)
+
+    def close(self):
+        self.frame.destroy()
+
+
+class LargeFileViewer(ReadOnlyView):
+    """Read-only view of a file too large to load into a Text widget.
+
+    Only a window of LARGE_FILE_WINDOW_LINES lines around the viewport is in the
+    widget. The scrollbar spans the whole file, and the window is swapped when the
+    view gets close to its edges or jumps elsewhere.
+    """
+    def __init__(self, master_frame, status_bar, app_instance, filepath, encoding=None):
+        self.frame = master_frame
+        self.status_bar = status_bar
+        self.app_instance = app_instance
+        self.filepath = filepath
+        self.index = LargeFileIndex(filepath, encoding or "utf-8")
+        self.window_first = 1 # File line shown on widget line 1
+        self.window_lines = 0
+        self._window_partial = False # Window was cut short because indexing had not got that far
+        self._swap_after_id = None
+        self._poll_id = None
+
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.text_area = Text(self.frame, wrap="none")
+        self.text_area.pack(expand=True, fill='both', side='right')
+        self.text_area.tag_configure("search_highlight", background="yellow", foreground="black")
+        self.text_area.configure(yscrollcommand=self._on_yview_changed)
+        self.text_area.bind("<Control-Home>", lambda event: self._jump(1))
+        self.text_area.bind("<Control-End>", lambda event: self._jump(self.index.estimated_line_count()))
+        self.text_area.bind("<Destroy>", self._on_text_area_destroy, add="+")
+        self._load_window(1)
+        self._poll_index()
+
+    def _load_window(self, first_line):
+        text = self.index.read_lines(first_line, LARGE_FILE_WINDOW_LINES)
+        if text.endswith("\n"):
+            text = text[:-1] # The widget adds its own final newline
+        self.window_first = first_line
+        self.window_lines = text.count("\n") + 1 if text else 0
+        self._window_partial = (not self.index.complete
+                                and self.index.line_offset(first_line + LARGE_FILE_WINDOW_LINES) is None)
+        self.text_area.config(state=tk.NORMAL)
+        self.text_area.delete("1.0", tk.END)
+        self.text_area.insert("1.0", text)
+        self.text_area.config(state=tk.DISABLED)
+
+    def top_line(self):
+        """File line at the top of the viewport."""
+        return self.window_first + int(self.text_area.index("@0,0").split(".")[0]) - 1
+
+    def show_line(self, line):
+        """Scrolls so `line` of the file is at the top, swapping the window if needed."""
+        line = max(1, min(line, self.index.estimated_line_count()))
+        window_last = self.window_first + self.window_lines - 1
+        more_below = window_last < self.index.line_count or not self.index.complete
+        if line < self.window_first or (line + LARGE_FILE_SWAP_MARGIN_LINES > window_last and more_below):
+            self._load_window(max(1, line - LARGE_FILE_WINDOW_LINES // 2))
+        self.text_area.yview(f"{line - self.window_first + 1}.0")
+
+    def _jump(self, line):
+        self.show_line(line)
+        return "break"
+
+    def _on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self.show_line(int(float(args[1]) * self.index.estimated_line_count()) + 1)
+        else:
+            # Line and page steps scroll within the window; its edges trigger a swap
+            self.text_area.yview(*args)
+
+    def _on_yview_changed(self, first_fraction, last_fraction):
+        total_lines = self.index.estimated_line_count()
+        top_line = self.window_first + float(first_fraction) * self.window_lines
+        bottom_line = self.window_first + float(last_fraction) * self.window_lines
+        self.scrollbar.set(min((top_line - 1) / total_lines, 1.0), min((bottom_line - 1) / total_lines, 1.0))
+
+        window_last = self.window_first + self.window_lines - 1
+        near_top = self.window_first > 1 and top_line - self.window_first < LARGE_FILE_SWAP_MARGIN_LINES
+        near_bottom = (window_last - bottom_line < LARGE_FILE_SWAP_MARGIN_LINES
+                       and (window_last < self.index.line_count or not self.index.complete))
+        if (near_top or near_bottom) and self._swap_after_id is None:
+            # Not from inside the widget's scroll callback; coalesces a burst of scrolling too
+            self._swap_after_id = self.text_area.after_idle(self._swap_window)
+
+    def _swap_window(self):
+        self._swap_after_id = None
+        self.show_line(self.top_line())
+
+    def _poll_index(self):
+        self._poll_id = None
+        name = os.path.basename(self.filepath)
+        if self.index.complete:
+            self.status_bar.update_status(f"{name}: {self.index.line_count} lines (read-only large file view)")
+            return
+        percent = int(self.index.indexed_bytes * 100 / max(self.index.size, 1))
+        self.status_bar.update_status(f"Indexing {name}: {percent}%")
+        if self._window_partial:
+            top_line = self.top_line()
+            self._load_window(self.window_first)
+            self.text_area.yview(f"{top_line - self.window_first + 1}.0")
+        self._poll_id = self.text_area.after(LARGE_FILE_POLL_MS, self._poll_index)
+
+    def _on_text_area_destroy(self, event=None):
+        if event is not None and event.widget is not self.text_area:
+            return
+        self.index.close()
+
+    def close(self):
+        for after_id in (self._poll_id, self._swap_after_id):
+            if after_id:
+                self.text_area.after_cancel(after_id)
+        self._poll_id = self._swap_after_id = None
+        super().close()
+        self.index.close()
+
+
+class BinaryPreview(ReadOnlyView):
+    """Hex dump of the first BINARY_PREVIEW_BYTES of a binary file, instead of loading it as text."""
+    def __init__(self, master_frame, status_bar, app_instance, filepath):
+        self.frame = master_frame
+        self.status_bar = status_bar
+        self.app_instance = app_instance
+        self.filepath = filepath
+        with open(filepath, "rb") as input_file:
+            data = input_file.read(BINARY_PREVIEW_BYTES)
+        size = os.path.getsize(filepath)
+
+        self.text_area = Text(self.frame, wrap="none", font="TkFixedFont")
+        self.text_area.pack(expand=True, fill='both', side='right')
+        self.text_area.tag_configure("search_highlight", background="yellow", foreground="black")
+        self.text_area.insert("1.0", format_hex_dump(data))
+        if size > len(data):
+            self.text_area.insert(tk.END, f"\n... {size - len(data)} more bytes not shown")
+        self.text_area.config(state=tk.DISABLED)
+        self.status_bar.update_status(f"{os.path.basename(filepath)} is a binary file ({size} bytes); showing a preview")
+
+# --- Ignore Rules ---
+IGNORE_FILE_NAME = ".gitignore"
+USER_EXCLUDE_FILE = os.path.join(os.path.expanduser("~"), ".basic_text_editor", "exclude") # .gitignore syntax
+DEFAULT_EXCLUDE_PATTERNS = (".git/",) # Applied before the user's, so they can be re-included with "!"
+EXPLORER_HIDE_IGNORED = False # Hide ignored entries instead of showing them greyed out and unscanned
+
+
+def _ignore_pattern_regex(pattern):
+    """Regex source for a .gitignore pattern (without "!" and trailing "/"), matched against /-separated relative paths."""
+    anchored = "/" in pattern # Otherwise it matches a name at any depth
+    if pattern.startswith("/"):
+        pattern = pattern[1:]
+    parts = []
+    position = 0
+    while position < len(pattern):
+        char = pattern[position]
+        if pattern.startswith("**/", position) and (position == 0 or pattern[position - 1] == "/"):
+            parts.append("(?:.*/)?")
+            position += 3
+        elif pattern.startswith("/**", position) and position + 3 == len(pattern):
+            parts.append("/.*")
+            position += 3
+        elif char == "*":
+            parts.append("[^/]*")
+            while position + 1 < len(pattern) and pattern[position + 1] == "*": # Any other ** is a plain *
+                position += 1
+            position += 1
+        elif char == "?":
+            parts.append("[^/]")
+            position += 1
+        elif char == "[":
+            end = position + 1
+            if end < len(pattern) and pattern[end] in "!^":
+                end += 1
+            if end < len(pattern) and pattern[end] == "]":
+                end += 1
+            end = pattern.find("]", end)
+            if end < 0: # No closing bracket; a literal "["
+                parts.append(re.escape(char))
+                position += 1
+                continue
+            body = pattern[position + 1:end].replace("\\", "\\\\")
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            parts.append(f"[{body}]")
+            position = end + 1
+        elif char == "\\" and position + 1 < len(pattern):
+            parts.append(re.escape(pattern[position + 1]))
+            position += 2
+        else:
+            parts.append(re.escape(char))
+            position += 1
+    regex = "".join(parts)
+    return regex if anchored else "(?:.*/)?" + regex
+
+
+class IgnoreRules:
+    """The compiled patterns of one ignore file, matched against paths relative to base_dir.
+
+    Consecutive patterns with the same outcome are merged into one regex, so a
+    typical .gitignore is checked with one or two regex matches.
+    """
+    def __init__(self, base_dir, lines):
+        self.base_dir = base_dir
+        flags = re.IGNORECASE if os.name == "nt" else 0
+        self._runs = [] # [negated, regex for any entry, regex for directories only], in file order
+        for line in lines:
+            line = line.rstrip("\r\n")
+            if not line or line.startswith("#"):
+                continue
+            if not line.endswith("\\ "): # Trailing spaces are ignored unless escaped
+                line = line.rstrip(" ")
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:]
+            directory_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            core = _ignore_pattern_regex(line)
+            if directory_only: # The directory itself, and anything below it
+                any_source, directory_source = core + "/.*", core
+            else:
+                any_source, directory_source = core + "(?:/.*)?", None
+            if not self._runs or self._runs[-1][0] != negated:
+                self._runs.append([negated, [], []])
+            self._runs[-1][1].append(any_source)
+            if directory_source:
+                self._runs[-1][2].append(directory_source)
+        for run in self._runs:
+            run[1] = re.compile("|".join(f"(?:{source})" for source in run[1]), flags)
+            run[2] = re.compile("|".join(f"(?:{source})" for source in run[2]), flags) if run[2] else None
+
+    @classmethod
+    def read(cls, base_dir, filepath):
+        """The rules in filepath, or None if it can't be read."""
+        try:
+            with open(filepath, "r", encoding="utf-8", errors="replace") as ignore_file:
+                return cls(base_dir, ignore_file.readlines())
+        except OSError:
+            return None
+
+    def match(self, relative_path, is_directory):
+        """True if ignored, False if re-included with "!", None if no pattern matches."""
+        for negated, any_regex, directory_regex in reversed(self._runs): # The last matching pattern decides
+            if any_regex.fullmatch(relative_path) or (is_directory and directory_regex and directory_regex.fullmatch(relative_path)):
+                return not negated
+        return None
+
+
+class IgnoreMatcher:
+    """Decides which paths below root are ignored, from its .gitignore files and the user's exclude patterns.
+
+    As in git, a .gitignore applies to its directory and everything below,
+    deeper files override shallower ones and the user's patterns come last. The
+    rules in effect are cached per directory, so checking the entries of a
+    listed directory reads at most its own .gitignore. Scanner and index
+    threads use the same matcher as the UI, so the cache is guarded by a lock.
+    """
+    def __init__(self, root, exclude_patterns=()):
+        self.root = root
+        self._user_rules = IgnoreRules(root, list(DEFAULT_EXCLUDE_PATTERNS) + list(exclude_patterns))
+        self._chains = {} # Directory -> [IgnoreRules] in effect there, deepest first
+        self._lock = threading.Lock()
+        self._generation = 0 # Bumped when cached rules are forgotten, so rules read before aren't stored
+
+    @classmethod
+    def for_root(cls, root):
+        """A matcher with the exclude patterns from USER_EXCLUDE_FILE, if there is one."""
+        try:
+            with open(USER_EXCLUDE_FILE, "r", encoding="utf-8", errors="replace") as exclude_file:
+                return cls(root, exclude_file.readlines())
+        except OSError:
+            return cls(root)
+
+    def _rules_for(self, dir_path):
+        with self._lock:
+            chain = self._chains.get(dir_path)
+            generation = self._generation
+        if chain is None:
+            if dir_path == self.root:
+                chain = [self._user_rules]
+            elif _relative_path(dir_path, self.root) is None: # Outside the project; only the user's patterns
+                return [self._user_rules]
+            else:
+                chain = self._rules_for(os.path.dirname(dir_path))
+            rules = IgnoreRules.read(dir_path, os.path.join(dir_path, IGNORE_FILE_NAME))
+            if rules is not None:
+                chain = [rules] + chain
+            with self._lock:
+                if generation == self._generation:
+                    self._chains[dir_path] = chain
+        return chain
+
+    def is_ignored(self, path, is_directory):
+        for rules in self._rules_for(os.path.dirname(path)):
+            relative_path = _relative_path(path, rules.base_dir)
+            if relative_path is None:
+                continue
+            ignored = rules.match(relative_path, is_directory)
+            if ignored is not None:
+                return ignored
+        return False
+
+    def invalidate(self, dir_path):
+        """Forgets the cached rules of dir_path and below, e.g. after its .gitignore changed."""
+        prefix = os.path.join(dir_path, "")
+        with self._lock:
+            self._generation += 1
+            for cached_path in [path for path in self._chains if path == dir_path or path.startswith(prefix)]:
+                del self._chains[cached_path]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._chains.clear()
+
+
+def _relative_path(path, base_dir):
+    """path relative to base_dir with "/" separators, or None if it isn't below base_dir."""
+    prefix = os.path.join(base_dir, "")
+    if not path.startswith(prefix):
+        return None
+    return path[len(prefix):].replace(os.sep, "/")
+
+
+def walk_project(root, ignore=None):
+    """Yields the paths of the files below root, skipping ignored ones.
+
+    Ignored directories are never entered, and entry types come from
+    os.scandir(), so nothing in an ignored subtree is listed or stat()ed.
+    Symlinked directories are not followed.
+    """
+    pending = [root]
+    while pending:
+        dir_path = pending.pop()
+        try:
+            with os.scandir(dir_path) as entries:
+                items = []
+                for entry in entries:
+                    try:
+                        items.append((entry.path, entry.is_dir(follow_symlinks=False)))
+                    except OSError:
+                        continue
+        except OSError: # Unreadable; skipped like git does
+            continue
+        subdirectories = []
+        for path, is_directory in sorted(items):
+            if ignore is not None and ignore.is_ignored(path, is_directory):
+                continue
+            if is_directory:
+                subdirectories.append(path)
+            else:
+                yield path
+        pending.extend(reversed(subdirectories)) # Depth first, in name order
+
+
+def list_directory(dir_path):
+    """Sorted (name, path, is_directory) of the entries in dir_path.
+
+    Uses the file types os.scandir() gets along with the names, so most file
+    systems need no stat() per entry.
+    """
+    items = []
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            try:
+                is_directory = entry.is_dir() # Follows symlinks, like os.path.isdir
+            except OSError:
+                is_directory = False
+            items.append((entry.name, entry.path, is_directory))
+    items.sort()
+    return items
+
+
+def directory_has_children(dir_path):
+    """Whether dir_path has any entry, reading no further than the first one."""
+    with os.scandir(dir_path) as entries:
+        return next(entries, None) is not None
+
+
+def _probe_children(dir_path):
+    """directory_has_children(), or None if dir_path can't be read."""
+    try:
+        return directory_has_children(dir_path)
+    except OSError: # Permission error etc.
+        return None
+
+
+def visible_entries(items, ignore=None):
+    """The listed (name, path, is_directory) items that are shown, i.e. not hidden as ignored."""
+    if ignore is None or not EXPLORER_HIDE_IGNORED:
+        return items
+    return [item for item in items if not ignore.is_ignored(item[1], item[2])]
+
+
+def describe_entries(items, ignore=None):
+    """(name, path, is_directory, has_children) of listed items, for inserting into the explorer.
+
+    Subdirectories are probed for children, except ignored ones, which are never
+    looked into; they look expandable until they are expanded by hand.
+    """
+    for name, path, is_directory in items:
+        if not is_directory:
+            has_children = False
+        elif ignore is not None and ignore.is_ignored(path, is_directory):
+            has_children = True
+        else:
+            has_children = _probe_children(path)
+        yield name, path, is_directory, has_children
+
+
+EXPLORER_SCAN_BATCH_ENTRIES = 500 # Entries handed to the UI, and inserted into the tree, at a time
+EXPLORER_SCAN_POLL_MS = 20
+EXPLORER_PAGE_MIN_ENTRIES = 5000 # Larger directories are shown a page at a time
+EXPLORER_PAGE_ENTRIES = 1000
+
+
+class DirectoryListing:
+    """Sorted entries of a large directory, kept compactly until they are shown.
+
+    All names are stored in one NUL-separated string with an array of their start
+    offsets, and the entry types in a bytearray, instead of a tuple of strings per
+    entry.
+    """
+    def __init__(self, dir_path, items):
+        self.dir_path = dir_path
+        self._names = "\0".join(name for name, _, _ in items)
+        self._starts = array("Q")
+        position = 0
+        for name, _, _ in items:
+            self._starts.append(position)
+            position += len(name) + 1
+        self._starts.append(position) # End of the last name + 1
+        self._is_directory = bytearray(is_directory for _, _, is_directory in items)
+
+    def __len__(self):
+        return len(self._is_directory)
+
+    def __getitem__(self, index):
+        """(name, path, is_directory) of the index-th entry."""
+        name = self._names[self._starts[index]:self._starts[index + 1] - 1]
+        return name, os.path.join(self.dir_path, name), bool(self._is_directory[index])
+
+    def page(self, start, count):
+        return [self[index] for index in range(start, min(start + count, len(self)))]
+
+
+class DirectoryScanner:
+    """Lists a directory on a worker thread, for expanding it without freezing the UI.
+
+    Puts sorted batches of (name, path, is_directory, has_children) on `batches`,
+    then None; has_children is None for directories that can't be read. A
+    directory of EXPLORER_PAGE_MIN_ENTRIES or more is put as one DirectoryListing
+    instead, without probing its subdirectories. If the listing fails, `error` is
+    set before the None. Ignored entries are hidden or left unprobed, as
+    describe_entries() does.
+
+    cached is a (mtime_ns, entries) listing from a ListingCache; if the
+    directory's mtime still matches, its entries are reused and only their
+    subdirectories are probed again. `mtime_ns` and `entries` (None if a
+    DirectoryListing was put) describe what was found, for caching it.
+    """
+    def __init__(self, dir_path, ignore=None, cached=None):
+        self.dir_path = dir_path
+        self.ignore = ignore
+        self.cached = cached
+        self.batches = queue.Queue()
+        self.error = None
+        self.mtime_ns = None
+        self.entries = []
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._scan, daemon=True)
+        self._thread.start()
+
+    def _scan(self):
+        try:
+            self.mtime_ns = os.stat(self.dir_path).st_mtime_ns # Before listing, so a change while listing shows next time
+            if self.cached and self.cached[0] == self.mtime_ns:
+                items = [(name, path, is_directory) for name, path, is_directory, _ in self.cached[1]]
+            else:
+                items = visible_entries(list_directory(self.dir_path), self.ignore)
+            if len(items) >= EXPLORER_PAGE_MIN_ENTRIES:
+                self.entries = None
+                self.batches.put(DirectoryListing(self.dir_path, items))
+                return
+            for position in range(0, len(items), EXPLORER_SCAN_BATCH_ENTRIES):
+                if self._cancelled.is_set():
+                    return
+                batch = list(describe_entries(items[position:position + EXPLORER_SCAN_BATCH_ENTRIES], self.ignore))
+                self.entries.extend(batch)
+                self.batches.put(batch)
+        except OSError as e:
+            self.error = e
+        finally:
+            self.batches.put(None)
+
+    def cancel(self):
+        self._cancelled.set()
+
+
+# --- File System Watching ---
+WATCH_POLL_MS = 250 # How often the explorer collects file system events
+WATCH_MAX_DELAY_MS = 2000 # A burst is applied once it pauses, or after this long at the latest
+
+
+class InotifyWatcher:
+    """Reports changes to the entries of watched directories, using Linux inotify through ctypes.
+
+    Only the directories themselves are watched, not their subdirectories.
+    read_events() never blocks; it returns (kind, path, is_directory, new_path)
+    tuples where kind is "created", "deleted", "moved" (to new_path) or
+    "overflow" (events were lost, so everything watched should be listed again).
+    """
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ONLYDIR = 0x1000000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+    EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, len; followed by len bytes of NUL-padded name
+    READ_BYTES = 64 * 1024
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True) # libc is already loaded into the interpreter
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            self._raise_errno()
+        self._paths = {} # Watch descriptor -> directory
+        self._descriptors = {} # Directory -> watch descriptor
+
+    def _raise_errno(self, path=None):
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error), path)
+
+    def watch(self, dir_path, listing=None):
+        """Starts watching dir_path; listing is only needed by PollingWatcher."""
+        if dir_path in self._descriptors:
+            return
+        descriptor = self._libc.inotify_add_watch(self._fd, os.fsencode(dir_path), self.WATCH_MASK)
+        if descriptor < 0:
+            self._raise_errno(dir_path)
+        # The same directory under another path gets the same descriptor; the latest path wins
+        self._descriptors.pop(self._paths.get(descriptor), None)
+        self._paths[descriptor] = dir_path
+        self._descriptors[dir_path] = descriptor
+
+    def unwatch(self, dir_path):
+        descriptor = self._descriptors.pop(dir_path, None)
+        if descriptor is not None:
+            del self._paths[descriptor]
+            self._libc.inotify_rm_watch(self._fd, descriptor) # Fails harmlessly if the directory is gone
+
+    def read_events(self):
+        chunks = []
+        while True:
+            try:
+                chunk = os.read(self._fd, self.READ_BYTES) # Always whole events
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            chunks.append(chunk)
+        data = b"".join(chunks)
+        events = []
+        moves = {} # Cookie -> index in events of a move whose destination hasn't been seen yet
+        position = 0
+        while position < len(data):
+            descriptor, mask, cookie, length = self.EVENT_HEADER.unpack_from(data, position)
+            position += self.EVENT_HEADER.size
+            name = os.fsdecode(data[position:position + length].rstrip(b"\0"))
+            position += length
+            if mask & self.IN_Q_OVERFLOW:
+                events.append(("overflow", None, False, None))
+                continue
+            dir_path = self._paths.get(descriptor)
+            if dir_path is None: # Unwatched since
+                continue
+            if mask & self.IN_IGNORED: # The directory itself was deleted
+                del self._paths[descriptor]
+                self._descriptors.pop(dir_path, None)
+                continue
+            path = os.path.join(dir_path, name)
+            is_directory = bool(mask & self.IN_ISDIR)
+            if mask & self.IN_CREATE:
+                events.append(("created", path, is_directory, None))
+            elif mask & self.IN_DELETE:
+                events.append(("deleted", path, is_directory, None))
+            elif mask & self.IN_MOVED_FROM:
+                # Stays a deletion unless the destination is a watched directory too
+                moves[cookie] = len(events)
+                events.append(("deleted", path, is_directory, None))
+            elif mask & self.IN_MOVED_TO:
+                index = moves.pop(cookie, None)
+                if index is None:
+                    events.append(("created", path, is_directory, None))
+                else:
+                    events[index] = ("moved", events[index][1], is_directory, path)
+        return events
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher:
+    """Reports the same events as InotifyWatcher by comparing snapshots of the watched directories.
+
+    The snapshots are the (mtime_ns, [(name, path, is_directory)]) listings the
+    caller already made, passed to watch(); a directory is polled once it has
+    one. A worker thread stats the watched directories every WATCH_POLL_MS and
+    lists again only those whose mtime changed, so nothing is listed on the
+    caller's thread; read_events() collects what it found. Like those listings,
+    entries hidden by ignore are left out. Moves show up as a deletion and a
+    creation.
+    """
+    def __init__(self, ignore=None):
+        self.ignore = ignore
+        self._snapshots = {} # Directory -> (st_mtime_ns, entries), or None until its listing is given
+        self._lock = threading.Lock() # Guards _snapshots against the worker
+        self._events = queue.Queue()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+        self._thread.start()
+
+    def watch(self, dir_path, listing=None):
+        """Starts watching dir_path; it is polled once a listing of it is given, here or by a later call."""
+        with self._lock:
+            if self._snapshots.get(dir_path) is None:
+                self._snapshots[dir_path] = listing if listing and listing[0] is not None else None
+
+    def unwatch(self, dir_path):
+        with self._lock:
+            self._snapshots.pop(dir_path, None)
+
+    def _poll(self):
+        while not self._closed.wait(WATCH_POLL_MS / 1000):
+            with self._lock:
+                snapshots = [(dir_path, snapshot) for dir_path, snapshot in self._snapshots.items() if snapshot]
+            for dir_path, snapshot in snapshots:
+                try:
+                    mtime = os.stat(dir_path).st_mtime_ns # Before listing, so a change during the listing is seen next time
+                    if mtime == snapshot[0]:
+                        continue
+                    entries = visible_entries(list_directory(dir_path), self.ignore)
+                except OSError: # Gone; the deletion is reported for its parent
+                    entries = None
+                with self._lock:
+                    if self._snapshots.get(dir_path) is not snapshot: # Unwatched meanwhile
+                        continue
+                    if entries is None:
+                        del self._snapshots[dir_path]
+                        continue
+                    self._snapshots[dir_path] = (mtime, entries)
+                previous = {entry[0]: entry[2] for entry in snapshot[1]}
+                current = {name: is_directory for name, _, is_directory in entries}
+                events = [("deleted", os.path.join(dir_path, name), is_directory, None)
+                          for name, is_directory in previous.items() if current.get(name) != is_directory]
+                events.extend(("created", os.path.join(dir_path, name), is_directory, None)
+                              for name, is_directory in current.items() if previous.get(name) != is_directory)
+                if events:
+                    self._events.put(events)
+
+    def read_events(self):
+        events = []
+        while True:
+            try:
+                events.extend(self._events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            self._snapshots.clear()
+
+
+def create_directory_watcher(ignore=None):
+    """An InotifyWatcher where inotify is available, a PollingWatcher elsewhere."""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as e: # AttributeError: libc without inotify
+            print(f"inotify is unavailable, polling for file changes instead: {e}")
+    return PollingWatcher(ignore)
+
+
+def coalesce_events(events):
+    """Reduces a burst of watcher events to the net change of each path.
+
+    Returns ({path: is_directory, or None if it is gone}, [(old_path, new_path)]
+    of the moves); later events for a path override earlier ones.
+    """
+    changes = {}
+    moves = []
+    for kind, path, is_directory, new_path in events:
+        if kind == "created":
+            changes[path] = is_directory
+        elif kind == "deleted":
+            changes[path] = None
+        elif kind == "moved":
+            changes[path] = None
+            changes[new_path] = is_directory
+            moves.append((path, new_path))
+    return changes, moves
+
+
+# --- Directory Listing Cache ---
+LISTING_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".basic_text_editor", "listings.sqlite3")
+LISTING_CACHE_MAX_DIRECTORIES = 20000 # The least recently stored listings beyond this are dropped
+LISTING_KINDS = {(False, False): 0, (True, False): 1, (True, True): 2, (True, None): 3} # (is_directory, has_children) -> stored byte
+
+
+class ListingCache:
+    """Directory listings kept on disk between runs, so the explorer can show them before listing.
+
+    A listing is stored in one SQLite row per directory: the names NUL-separated
+    and one byte per entry for its type, along with the directory's mtime to
+    validate it by. The cache is disposable; if it can't be opened, nothing is
+    cached.
+    """
+    def __init__(self, path=LISTING_CACHE_FILE):
+        self._connection = None
+        if sqlite3 is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            connection = sqlite3.connect(path, timeout=0.2)
+            connection.execute("PRAGMA synchronous = OFF") # Losing the last listings in a power cut is fine
+            connection.execute("CREATE TABLE IF NOT EXISTS listings (path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, "
+                               "names TEXT NOT NULL, kinds BLOB NOT NULL, stored REAL NOT NULL)")
+            connection.execute("DELETE FROM listings WHERE path NOT IN "
+                               "(SELECT path FROM listings ORDER BY stored DESC LIMIT ?)", (LISTING_CACHE_MAX_DIRECTORIES,))
+            connection.commit()
+            self._connection = connection
+        except (OSError, sqlite3.Error) as e:
+            print(f"Directory listing cache unavailable: {e}")
+
+    def get(self, dir_path):
+        """(mtime_ns, [(name, path, is_directory, has_children)]) last stored for dir_path, or None."""
+        if self._connection is None:
+            return None
+        try:
+            row = self._connection.execute("SELECT mtime_ns, names, kinds FROM listings WHERE path = ?", (dir_path,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading the directory listing cache: {e}")
+            return None
+        if row is None:
+            return None
+        mtime_ns, names, kinds = row
+        decoded = {kind: key for key, kind in LISTING_KINDS.items()}
+        entries = [(name, os.path.join(dir_path, name)) + decoded[kind]
+                   for name, kind in zip(names.split("\0") if names else (), kinds)]
+        return mtime_ns, entries
+
+    def put(self, dir_path, mtime_ns, entries):
+        if self._connection is None:
+            return
+        names = "\0".join(name for name, _, _, _ in entries)
+        kinds = bytes(LISTING_KINDS[is_directory, has_children if is_directory else False]
+                      for _, _, is_directory, has_children in entries)
+        try:
+            self._connection.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?)",
+                                     (dir_path, mtime_ns, names, kinds, time.time()))
+            self._connection.commit()
+        except sqlite3.Error as e: # E.g. locked by another editor for too long
+            print(f"Error writing the directory listing cache: {e}")
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def diff_listings(old_entries, new_entries):
+    """Watcher-style events turning old_entries into new_entries, and [(path, has_children)] of subdirectories whose has_children changed."""
+    old = {path: (is_directory, has_children) for _, path, is_directory, has_children in old_entries}
+    events = []
+    changed_children = []
+    for _, path, is_directory, has_children in new_entries:
+        previous = old.pop(path, None)
+        if previous is None or previous[0] != is_directory:
+            if previous is not None:
+                events.append(("deleted", path, previous[0], None))
+            events.append(("created", path, is_directory, None))
+        elif is_directory and previous[1] != has_children:
+            changed_children.append((path, has_children))
+    events.extend(("deleted", path, is_directory, None) for path, (is_directory, _) in old.items())
+    return events, changed_children
+
+
+def _directory_mtime(dir_path):
+    try:
+        return os.stat(dir_path).st_mtime_ns
+    except OSError:
+        return None
+
+
+# --- Quick Open ---
+QUICK_OPEN_RESULTS = 50
+QUICK_OPEN_SCAN_BUDGET = 5000 # Candidates checked per search() call, so each keystroke stays fast
+QUICK_OPEN_MAX_AGE_S = 60 # An older index is rebuilt in the background when Quick Open is opened
+QUICK_OPEN_POLL_MS = 50
+
+
+class WorkspaceIndex:
+    """Relative paths of the files below root, for finding them by a fuzzy query.
+
+    Built on a worker thread with walk_project(), so ignored subtrees are
+    skipped. The paths are kept shortest first. For every character there is
+    a bit mask (an int) of the paths that contain it, so a query's candidates
+    come from ANDing a few ints rather than from a scan. A search is
+    incremental. Typing another character only re-checks the previous
+    matches and carries on from where that scan stopped. Each search() call
+    checks at most QUICK_OPEN_SCAN_BUDGET candidates and says whether it got
+    through all of them; call it again to carry on. The best matches so far
+    are kept in a heap while scanning, so once every candidate is checked
+    they are the best of all of them.
+    """
+    def __init__(self, root, ignore=None):
+        self.root = root
+        self.ignore = ignore
+        self.built_at = None
+        # Relative paths (None once removed), relative path -> position, character -> mask; swapped in whole
+        self._data = ([], {}, {})
+        self._search = None # (data, query, limit, candidates left, matches, heap of the best) of the last search
+        self._builder = None
+        self._lock = threading.Lock() # Serializes add()/remove() with installing a rebuilt index
+        self._changes = None # [(method, relative path)] made while a rebuild runs, replayed onto its result
+        self.refresh()
+
+    @property
+    def ready(self):
+        return self.built_at is not None
+
+    def refresh(self):
+        """Rebuilds the index in the background; the current one keeps answering until it is done."""
+        if self._builder and self._builder.is_alive():
+            return
+        with self._lock:
+            self._changes = []
+        self._builder = threading.Thread(target=self._build, daemon=True)
+        self._builder.start()
+
+    def _build(self):
+        prefix = os.path.join(self.root, "")
+        paths = sorted((path[len(prefix):] for path in walk_project(self.root, self.ignore)), key=len)
+        size = (len(paths) + 7) // 8
+        masks = {}
+        for position, path in enumerate(paths):
+            byte, bit = position >> 3, 1 << (position & 7)
+            for char in set(path.lower()):
+                mask = masks.get(char)
+                if mask is None:
+                    mask = masks[char] = bytearray(size)
+                mask[byte] |= bit
+        data = (paths, {path: position for position, path in enumerate(paths)},
+                {char: int.from_bytes(mask, "little") for char, mask in masks.items()})
+        with self._lock:
+            # The walk may have missed changes reported while it ran
+            for method, relative_path in self._changes:
+                method(data, relative_path)
+            self._changes = None
+            self._data = data
+            self.built_at = time.monotonic()
+
+    def _relative(self, path):
+        prefix = os.path.join(self.root, "")
+        return path[len(prefix):] if path.startswith(prefix) else None
+
+    def _change(self, method, path):
+        relative_path = self._relative(path)
+        if relative_path is None:
+            return
+        with self._lock:
+            method(self._data, relative_path)
+            if self._changes is not None:
+                self._changes.append((method, relative_path))
+        self._search = None
+
+    def add(self, path):
+        self._change(self._add, path)
+
+    def remove(self, path):
+        """Removes a file, or all files below a directory."""
+        self._change(self._remove, path)
+
+    @staticmethod
+    def _add(data, relative_path):
+        paths, positions, masks = data
+        if relative_path in positions:
+            return
+        positions[relative_path] = len(paths)
+        bit = 1 << len(paths)
+        paths.append(relative_path)
+        for char in set(relative_path.lower()):
+            masks[char] = masks.get(char, 0) | bit
+
+    @staticmethod
+    def _remove(data, relative_path):
+        paths, positions, masks = data
+        prefix = os.path.join(relative_path, "")
+        removed = [relative_path] if relative_path in positions else [known for known in positions if known.startswith(prefix)]
+        for known in removed:
+            position = positions.pop(known)
+            paths[position] = None
+            bit = 1 << position
+            for char in set(known.lower()):
+                masks[char] &= ~bit
+
+    def apply_events(self, events):
+        """Keeps the index in line with the watcher events of the directories the explorer lists."""
+        for kind, path, is_directory, new_path in events:
+            if kind == "overflow":
+                self.refresh()
+                continue
+            if kind in ("deleted", "moved"):
+                self.remove(path)
+            added = new_path if kind == "moved" else path if kind == "created" else None
+            if added is None:
+                continue
+            if is_directory: # Its files came along without events of their own
+                for file_path in walk_project(added, self.ignore):
+                    self.add(file_path)
+            elif self.ignore is None or not self.ignore.is_ignored(added, False):
+                self.add(added)
+
+    def search(self, query, limit=QUICK_OPEN_RESULTS):
+        """([relative path] of the best matches of query, whether all candidates were checked)."""
+        query = "".join(query.lower().split())
+        data = self._data
+        paths, _, masks = data
+        if not query:
+            return list(itertools.islice((path for path in paths if path is not None), limit)), True
+        pattern = re.compile(".*?".join(re.escape(char) for char in query), re.IGNORECASE | re.DOTALL)
+        previous = self._search
+        if previous and previous[0] is data and previous[1:3] == (query, limit):
+            _, _, _, candidates, matches, best = previous # Carry on where the last call stopped
+        else:
+            mask = -1
+            for char in set(query):
+                mask &= masks.get(char, 0)
+            bits = format(mask, "b")[::-1] if mask > 0 else "" # bits[i] == "1" if paths[i] has every character
+            if previous and previous[0] is data and query.startswith(previous[1]):
+                # Whatever matches query matched the previous query, so only its matches are checked again,
+                # then the candidates it had left that have every character of query
+                candidates = itertools.chain(previous[4], (position for position in previous[3]
+                                                           if position < len(bits) and bits[position] == "1"))
+            else:
+                candidates = _set_bits(bits)
+            matches = []
+            best = [] # Min-heap of (score, -position) of the best `limit` matches so far
+        checked = 0
+        for position in itertools.islice(candidates, QUICK_OPEN_SCAN_BUDGET):
+            checked += 1
+            path = paths[position]
+            if pattern.search(path):
+                matches.append(position)
+                entry = (_quick_open_score(path, query), -position) # Ties go to the earlier, shorter path
+                if len(best) < limit:
+                    heapq.heappush(best, entry)
+                elif best and entry > best[0]:
+                    heapq.heapreplace(best, entry)
+        self._search = (data, query, limit, candidates, matches, best)
+        return [paths[-position] for _, position in sorted(best, reverse=True)], checked < QUICK_OPEN_SCAN_BUDGET
+
+
+def _set_bits(bits):
+    """Yields the positions of the "1"s in a string of bits."""
+    position = bits.find("1")
+    while position >= 0:
+        yield position
+        position = bits.find("1", position + 1)
+
+
+def _quick_open_score(path, query):
+    """Higher for better matches: the query in the file name, at its start, and shorter paths."""
+    path = path.lower()
+    name = os.path.basename(path)
+    score = -len(path) / 10
+    if query in name:
+        score += 150 if name.startswith(query) else 100
+    elif query in path:
+        score += 30
+    return score
+
+
+class QuickOpenPalette:
+    """The Ctrl+P window: type part of a file's path, pick one of the best matches, and it is opened."""
+    def __init__(self, master, index, open_file):
+        self.index = index
+        self.open_file = open_file
+        self.results = []
+        self._after_id = None
+        self.window = tk.Toplevel(master)
+        self.window.title("Quick Open")
+        self.window.transient(master)
+        self.query_var = tk.StringVar()
+        self.entry = tk.Entry(self.window, textvariable=self.query_var, width=70)
+        self.entry.pack(fill=tk.X, padx=5, pady=5)
+        self.results_list = tk.Listbox(self.window, height=15)
+        self.results_list.pack(expand=True, fill='both', padx=5, pady=(0, 5))
+        self.query_var.trace_add("write", lambda *args: self._update())
+        self.entry.bind("<Return>", self._open_selected)
+        self.entry.bind("<Down>", lambda event: self._move_selection(1))
+        self.entry.bind("<Up>", lambda event: self._move_selection(-1))
+        self.results_list.bind("<Double-Button-1>", self._open_selected)
+        self.window.bind("<Escape>", lambda event: self.close())
+        self.entry.focus_set()
+        self._update()
+
+    def _update(self):
+        if self._after_id:
+            self.window.after_cancel(self._after_id)
+            self._after_id = None
+        results, complete = self.index.search(self.query_var.get())
+        if results != self.results:
+            self.results = results
+            self.results_list.delete(0, tk.END)
+            if results:
+                self.results_list.insert(tk.END, *results)
+                self.results_list.selection_set(0)
+        if not complete or not self.index.ready: # Carry on checking, or wait for the index
+            self._after_id = self.window.after(QUICK_OPEN_POLL_MS, self._update)
+
+    def _move_selection(self, step):
+        selection = self.results_list.curselection()
+        if self.results:
+            position = min(max((selection[0] if selection else 0) + step, 0), len(self.results) - 1)
+            self.results_list.selection_clear(0, tk.END)
+            self.results_list.selection_set(position)
+            self.results_list.see(position)
+        return "break"
+
+    def _open_selected(self, event=None):
+        selection = self.results_list.curselection()
+        if not selection:
+            return
+        filepath = os.path.join(self.index.root, self.results[selection[0]])
+        self.close()
+        self.open_file(filepath)
+
+    def close(self):
+        if self._after_id:
+            self.window.after_cancel(self._after_id)
+            self._after_id = None
+        self.window.destroy()
+
+
 class FileExplorer:
     def __init__(self, master_frame, text_editor_instance, app_instance):
         self.frame = master_frame
@@ -107,13 +3297,29 @@ class FileExplorer:
         self.file_tree.column("path", width=0, stretch=tk.NO)
         self.file_tree.column("type", width=0, stretch=tk.NO) # Hidden type column
         self.current_path = os.getcwd()
+        self.ignore = IgnoreMatcher.for_root(self.current_path) # .gitignore'd entries are greyed out and never scanned
+        self.file_tree.tag_configure("ignored", foreground="gray")
+        self._scans = {} # Node id -> [DirectoryScanner, "Loading..." node id, after() id] of expanding directories
+        self._validations = {} # Node id -> [DirectoryScanner, cached entries shown, after() id] of directories shown from cache
+        self.listing_cache = ListingCache()
+        self.workspace_index = None # Built the first time Quick Open is used
+        self._pages = {} # Node id -> [DirectoryListing, entries shown, "Show more" node id] of paged directories
+        self._watcher = create_directory_watcher(self.ignore)
+        self._watched = set() # Listed directories, whose changes are patched into the tree
+        self._nodes = {} # Path -> node id of the files and directories in the tree
+        self._pending_events = [] # Burst of watcher events not applied yet
+        self._pending_since = 0
 
         self._create_context_menu()
-        # Initial population of the root level
-        self.populate_file_explorer("", self.current_path)
+        # Initial population of the root level, from the last run's listing if there is one
+        if not self._show_cached_listing("", self.current_path):
+            self.populate_file_explorer("", self.current_path)
         self.file_tree.bind("<<TreeviewSelect>>", self._on_file_select)
         self.file_tree.bind("<<TreeviewOpen>>", self._on_treeview_open) # For expanding directories
+        self.file_tree.bind("<<TreeviewClose>>", self._on_treeview_close)
         self.file_tree.bind("<Button-3>", self._show_context_menu) # For Windows/Linux
+        self.file_tree.bind("<Destroy>", self._on_destroy)
+        self._watch_after_id = self.file_tree.after(WATCH_POLL_MS, self._poll_watcher)
 
     def _create_context_menu(self):
         self.context_menu = Menu(self.frame, tearoff=0)
@@ -147,6 +3353,19 @@ class FileExplorer:
         self.context_menu.tk_popup(event.x_root, event.y_root)
 
     def _refresh_explorer(self):
+        for node_id in list(self._scans):
+            self._cancel_scan(node_id)
+        for node_id in list(self._validations):
+            self._cancel_validation(node_id)
+        self._pages.clear()
+        for dir_path in list(self._watched):
+            self._unwatch(dir_path)
+        self._pending_events = []
+        self._nodes.clear()
+        self.ignore = IgnoreMatcher.for_root(self.current_path) # Picks up edited ignore files
+        if self.workspace_index:
+            self.workspace_index.ignore = self.ignore
+            self.workspace_index.refresh()
         # Clear all root items. TreeviewOpen handler will populate subdirectories upon expansion.
         for item_id in self.file_tree.get_children(""): # Get children of root
             self.file_tree.delete(item_id)
@@ -154,41 +3373,382 @@ class FileExplorer:
         self.populate_file_explorer("", self.current_path)
 
 
-    def populate_file_explorer(self, parent_node_id, dir_path):
-        """Populates the treeview with items from dir_path under parent_node_id."""
-        try:
-            for item_name in sorted(os.listdir(dir_path)):
-                full_path = os.path.join(dir_path, item_name)
-                item_type = "directory" if os.path.isdir(full_path) else "file"
+    def populate_file_explorer(self, parent_node_id, dir_path, in_background=False):
+        """Populates the treeview with items from dir_path under parent_node_id.
 
-                # Determine icon
-                icon_to_use = None
-                if item_type == "directory" and self.folder_icon:
-                    icon_to_use = self.folder_icon
-                elif item_type == "file" and self.file_icon:
-                    icon_to_use = self.file_icon
-
-                item_id = self.file_tree.insert(parent_node_id, 'end', text=item_name,
-                                                image=icon_to_use if icon_to_use else "", # Use icon if available
-                                                values=[full_path, item_type], open=False)
-
-                # If it's a directory, insert a placeholder to make it expandable
-                if item_type == "directory":
-                    # Check if directory is empty or not readable before adding placeholder
-                    try:
-                        if os.listdir(full_path): # If not empty
-                             self.file_tree.insert(item_id, 'end', text='...', values=['placeholder', 'placeholder'])
-                        # If empty, it will just be an expandable node with no children shown yet
-                    except OSError: # Permission error etc.
-                        self.file_tree.insert(item_id, 'end', text='[Error reading]', values=['error', 'error'])
+        With in_background=True the directory is listed on a worker thread and its
+        items are inserted in batches as they arrive, under a "Loading..." node.
+        """
+        if in_background:
+            if self._show_cached_listing(parent_node_id, dir_path):
+                return
+            self._watch(dir_path)
+            self._start_scan(parent_node_id, dir_path)
+            return
+        try:
+            mtime_ns = _directory_mtime(dir_path)
+            items = visible_entries(list_directory(dir_path), self.ignore)
+            self._watch(dir_path, (mtime_ns, items))
+            if len(items) >= EXPLORER_PAGE_MIN_ENTRIES:
+                self._show_listing(parent_node_id, DirectoryListing(dir_path, items))
+                return
+            # Subdirectories are checked for being empty or unreadable before adding a placeholder
+            entries = list(describe_entries(items, self.ignore))
+            for entry in entries:
+                self._insert_item(parent_node_id, *entry)
+            self._remember_listing(dir_path, mtime_ns, entries)
         except OSError as e:
-            # Error listing the initial dir_path (e.g. permission denied for dir_path itself)
-            # If parent_node_id is "", it's the root, display error there.
-            # Otherwise, could try to insert an error node under the parent.
-            error_node_parent = parent_node_id if parent_node_id else ""
-            self.file_tree.insert(error_node_parent, 'end', text=f"[Error: {os.path.basename(dir_path)}]",
-                                  values=[dir_path, "error"])
-            print(f"Error populating file explorer for {dir_path}: {e}")
+            self._insert_listing_error(parent_node_id, dir_path, e)
+
+    def _insert_item(self, parent_node_id, item_name, full_path, is_directory, has_children, index='end'):
+        item_type = "directory" if is_directory else "file"
+
+        # Determine icon
+        icon_to_use = None
+        if item_type == "directory" and self.folder_icon:
+            icon_to_use = self.folder_icon
+        elif item_type == "file" and self.file_icon:
+            icon_to_use = self.file_icon
+
+        options = {"tags": ("ignored",)} if self.ignore.is_ignored(full_path, is_directory) else {}
+        item_id = self.file_tree.insert(parent_node_id, index, text=item_name,
+                                        image=icon_to_use if icon_to_use else "", # Use icon if available
+                                        values=[full_path, item_type], open=False, **options)
+        self._nodes[full_path] = item_id
+
+        # If it's a directory, insert a placeholder to make it expandable
+        if has_children: # If not empty
+            self.file_tree.insert(item_id, 'end', text='...', values=['placeholder', 'placeholder'])
+        elif has_children is None: # Permission error etc.
+            self.file_tree.insert(item_id, 'end', text='[Error reading]', values=['error', 'error'])
+        # If empty, it will just be an expandable node with no children shown yet
+        return item_id
+
+    def _show_listing(self, node_id, listing):
+        self._pages[node_id] = [listing, 0, None]
+        self._show_next_page(node_id)
+
+    def _show_next_page(self, node_id):
+        """Inserts the next EXPLORER_PAGE_ENTRIES entries of a paged directory, and a node for the rest."""
+        page = self._pages.get(node_id)
+        if not page:
+            return
+        listing, shown, more_id = page
+        if more_id:
+            self.file_tree.delete(more_id)
+        for item_name, full_path, is_directory in listing.page(shown, EXPLORER_PAGE_ENTRIES):
+            # Subdirectories aren't probed; they all look expandable until expanded
+            self._insert_item(node_id, item_name, full_path, is_directory, is_directory)
+        shown = min(shown + EXPLORER_PAGE_ENTRIES, len(listing))
+        remaining = len(listing) - shown
+        if not remaining:
+            del self._pages[node_id]
+            return
+        more_id = self.file_tree.insert(node_id, 'end', text=f"Show {min(remaining, EXPLORER_PAGE_ENTRIES)} more... ({remaining} not shown)",
+                                        values=['more', 'more'])
+        self._pages[node_id] = [listing, shown, more_id]
+
+    def _insert_listing_error(self, parent_node_id, dir_path, error):
+        # Error listing the initial dir_path (e.g. permission denied for dir_path itself)
+        # If parent_node_id is "", it's the root, display error there.
+        # Otherwise, could try to insert an error node under the parent.
+        error_node_parent = parent_node_id if parent_node_id else ""
+        self.file_tree.insert(error_node_parent, 'end', text=f"[Error: {os.path.basename(dir_path)}]",
+                              values=[dir_path, "error"])
+        print(f"Error populating file explorer for {dir_path}: {error}")
+
+    def _start_scan(self, node_id, dir_path):
+        self._cancel_scan(node_id)
+        loading_id = self.file_tree.insert(node_id, 'end', text='Loading...', values=['loading', 'loading'])
+        scanner = DirectoryScanner(dir_path, self.ignore)
+        after_id = self.file_tree.after(EXPLORER_SCAN_POLL_MS, self._poll_scan, node_id)
+        self._scans[node_id] = [scanner, loading_id, after_id]
+
+    def _poll_scan(self, node_id):
+        """Inserts the next batch of a background listing; at most one batch per call, to stay responsive."""
+        scan = self._scans.get(node_id)
+        if not scan:
+            return
+        scanner, loading_id, _ = scan
+        try:
+            batch = scanner.batches.get_nowait()
+        except queue.Empty:
+            scan[2] = self.file_tree.after(EXPLORER_SCAN_POLL_MS, self._poll_scan, node_id)
+            return
+        if batch is None:
+            del self._scans[node_id]
+            self.file_tree.delete(loading_id)
+            if scanner.error:
+                self._insert_listing_error(node_id, scanner.dir_path, scanner.error)
+            elif scanner.entries is not None:
+                self._watch(scanner.dir_path, (scanner.mtime_ns, scanner.entries))
+                self._remember_listing(scanner.dir_path, scanner.mtime_ns, scanner.entries)
+            return
+        if isinstance(batch, DirectoryListing):
+            self._watch(scanner.dir_path, (scanner.mtime_ns, batch))
+            self._show_listing(node_id, batch)
+            batch = []
+        for item_name, full_path, is_directory, has_children in batch:
+            self._insert_item(node_id, item_name, full_path, is_directory, has_children)
+        scan[2] = self.file_tree.after(0, self._poll_scan, node_id)
+
+    def _cancel_scan(self, node_id):
+        """Stops listing node_id; returns whether it was still being listed."""
+        scan = self._scans.pop(node_id, None)
+        if not scan:
+            return False
+        scanner, _, after_id = scan
+        scanner.cancel()
+        self.file_tree.after_cancel(after_id)
+        return True
+
+    def _show_cached_listing(self, node_id, dir_path):
+        """Shows the cached listing of dir_path right away and checks it in the background; False if there is none."""
+        cached = self.listing_cache.get(dir_path)
+        if cached is None:
+            return False
+        self._watch(dir_path)
+        for entry in cached[1]:
+            self._insert_item(node_id, *entry)
+        scanner = DirectoryScanner(dir_path, self.ignore, cached)
+        after_id = self.file_tree.after(EXPLORER_SCAN_POLL_MS, self._poll_validation, node_id)
+        self._validations[node_id] = [scanner, cached[1], after_id]
+        return True
+
+    def _poll_validation(self, node_id):
+        """Once a cached listing has been checked, patches in what changed since it was stored."""
+        validation = self._validations.get(node_id)
+        if not validation:
+            return
+        scanner, cached_entries, _ = validation
+        listing = None
+        while True:
+            try:
+                batch = scanner.batches.get_nowait()
+            except queue.Empty:
+                validation[2] = self.file_tree.after(EXPLORER_SCAN_POLL_MS, self._poll_validation, node_id)
+                return
+            if batch is None:
+                break
+            if isinstance(batch, DirectoryListing):
+                listing = batch
+        del self._validations[node_id]
+        if scanner.error: # Gone or unreadable; the parent's watcher events or a refresh sort it out
+            print(f"Error checking cached listing of {scanner.dir_path}: {scanner.error}")
+        elif listing is not None: # Grew too big to show at once
+            self._watch(scanner.dir_path, (scanner.mtime_ns, listing))
+            self._forget_paths_below(scanner.dir_path)
+            self.file_tree.delete(*self.file_tree.get_children(node_id))
+            self._forget_deleted_nodes()
+            self._show_listing(node_id, listing)
+        else:
+            events, changed_children = diff_listings(cached_entries, scanner.entries)
+            if events:
+                self._patch_tree(events)
+            for path, has_children in changed_children:
+                self._update_placeholder(path, has_children)
+            self._watch(scanner.dir_path, (scanner.mtime_ns, scanner.entries))
+            self._remember_listing(scanner.dir_path, scanner.mtime_ns, scanner.entries)
+
+    def _cancel_validation(self, node_id):
+        validation = self._validations.pop(node_id, None)
+        if validation:
+            validation[0].cancel()
+            self.file_tree.after_cancel(validation[2])
+
+    def _update_placeholder(self, dir_path, has_children):
+        """Makes a directory node that hasn't been listed look expandable, or not, as it now is."""
+        node_id = self._find_node(dir_path)
+        if not node_id or dir_path in self._watched:
+            return
+        self.file_tree.delete(*self.file_tree.get_children(node_id))
+        if has_children:
+            self.file_tree.insert(node_id, 'end', text='...', values=['placeholder', 'placeholder'])
+        elif has_children is None:
+            self.file_tree.insert(node_id, 'end', text='[Error reading]', values=['error', 'error'])
+
+    def _remember_listing(self, dir_path, mtime_ns, entries):
+        if mtime_ns is not None:
+            self.listing_cache.put(dir_path, mtime_ns, entries)
+
+    def _on_treeview_close(self, event=None):
+        node_id = self.file_tree.focus()
+        if node_id and self._cancel_scan(node_id):
+            # Half listed; start over the next time it is expanded
+            self._reset_directory(node_id)
+
+    def _reset_directory(self, node_id):
+        """Drops the listed entries of a directory node; it is listed again when next expanded."""
+        self._pages.pop(node_id, None)
+        dir_path = self.file_tree.item(node_id, "values")[0]
+        self._forget_paths_below(dir_path)
+        self._unwatch(dir_path)
+        self.file_tree.delete(*self.file_tree.get_children(node_id))
+        self.file_tree.insert(node_id, 'end', text='...', values=['placeholder', 'placeholder'])
+        self._forget_deleted_nodes()
+
+    def _forget_deleted_nodes(self):
+        """Stops the listings and pages of nodes that were deleted along with an ancestor."""
+        for node_id in [node_id for node_id in self._scans if not self.file_tree.exists(node_id)]:
+            self._cancel_scan(node_id)
+        for node_id in [node_id for node_id in self._pages if not self.file_tree.exists(node_id)]:
+            del self._pages[node_id]
+        for node_id in [node_id for node_id in self._validations if not self.file_tree.exists(node_id)]:
+            self._cancel_validation(node_id)
+
+    def _forget_paths_below(self, dir_path):
+        """Drops the paths below dir_path from the node index; its listed entries are going away."""
+        if dir_path not in self._watched: # Never listed, so nothing below it is in the tree
+            return
+        prefix = os.path.join(dir_path, "")
+        for path in [path for path in self._nodes if path.startswith(prefix)]:
+            del self._nodes[path]
+
+    def _watch(self, dir_path, listing=None):
+        """Watches dir_path; listing is the (mtime_ns, entries) shown for it, once it is known."""
+        try:
+            self._watcher.watch(dir_path, listing)
+            self._watched.add(dir_path)
+        except OSError as e: # No live updates for it, e.g. over the inotify watch limit
+            print(f"Not watching {dir_path} for changes: {e}")
+
+    def _unwatch(self, dir_path):
+        """Stops watching dir_path and the watched directories below it."""
+        prefix = os.path.join(dir_path, "")
+        for watched_path in [path for path in self._watched if path == dir_path or path.startswith(prefix)]:
+            self._watched.discard(watched_path)
+            self._watcher.unwatch(watched_path)
+
+    def _poll_watcher(self):
+        """Collects file system events; a burst is applied in one batch once it pauses."""
+        self._watch_after_id = self.file_tree.after(WATCH_POLL_MS, self._poll_watcher)
+        events = self._watcher.read_events()
+        now = time.monotonic()
+        if events:
+            if not self._pending_events:
+                self._pending_since = now
+            self._pending_events.extend(events)
+        if self._pending_events and (not events or now - self._pending_since >= WATCH_MAX_DELAY_MS / 1000):
+            events, self._pending_events = self._pending_events, []
+            self._patch_tree(events)
+
+    def get_workspace_index(self):
+        """The Quick Open index of current_path, rebuilt in the background if it has got old."""
+        if self.workspace_index is None:
+            self.workspace_index = WorkspaceIndex(self.current_path, self.ignore)
+        elif self.workspace_index.ready and time.monotonic() - self.workspace_index.built_at > QUICK_OPEN_MAX_AGE_S:
+            # Only the listed directories are watched; changes elsewhere show up this way
+            self.workspace_index.refresh()
+        return self.workspace_index
+
+    def _on_destroy(self, event=None):
+        self.file_tree.after_cancel(self._watch_after_id)
+        self._watcher.close()
+        for node_id in list(self._validations):
+            self._cancel_validation(node_id)
+        self.listing_cache.close()
+
+    def _patch_tree(self, events):
+        """Applies watcher events to the tree as single node inserts, deletes and moves.
+
+        Only directories whose entries are shown (listed, and not still being
+        listed or paged) are patched; the others are listed when expanded.
+        """
+        if self.workspace_index:
+            self.workspace_index.apply_events(events)
+        if any(kind == "overflow" for kind, _, _, _ in events):
+            self._refresh_explorer()
+            return
+        changes, moves = coalesce_events(events)
+        for path in changes:
+            if os.path.basename(path) == IGNORE_FILE_NAME: # Applies to what is listed from now on
+                self.ignore.invalidate(os.path.dirname(path))
+        # Take moved nodes out first, so the deletion of their old path doesn't delete them
+        moved_nodes = {}
+        for old_path, new_path in moves:
+            moved_id = self._find_node(old_path)
+            if moved_id and changes.get(old_path, False) is None and changes.get(new_path) is not None:
+                if old_path in self._watched: # Its listed entries have the old paths
+                    self._reset_directory(moved_id)
+                self.file_tree.detach(moved_id)
+                del self._nodes[old_path]
+                moved_nodes[new_path] = moved_id
+        changes_by_directory = {}
+        for path, is_directory in changes.items():
+            changes_by_directory.setdefault(os.path.dirname(path), []).append((os.path.basename(path), path, is_directory))
+        for dir_path, entries in changes_by_directory.items():
+            node_id = self._shown_directory_node(dir_path)
+            if node_id is not None:
+                self._patch_directory(node_id, sorted(entries), moved_nodes)
+        if moved_nodes: # Moved out of sight
+            self.file_tree.delete(*moved_nodes.values())
+            self._forget_deleted_nodes()
+
+    def _patch_directory(self, node_id, entries, moved_nodes):
+        """Brings the children of node_id in line with sorted (name, path, is_directory or None) entries."""
+        names, node_ids = self._sorted_children(node_id)
+        for name, path, is_directory in entries:
+            position = bisect.bisect_left(names, name)
+            if position < len(names) and names[position] == name:
+                existing_id = node_ids[position]
+                if is_directory is not None and (self.file_tree.item(existing_id, "values")[1] == "directory") == is_directory:
+                    if path in self._watched: # Created again, e.g. by a checkout; the shown entries are stale
+                        self._reset_directory(existing_id)
+                    continue
+                self._forget_paths_below(path)
+                self._unwatch(path)
+                self._nodes.pop(path, None)
+                self.file_tree.delete(existing_id)
+                self._forget_deleted_nodes()
+                del names[position], node_ids[position]
+            if is_directory is None:
+                continue
+            index = self.file_tree.index(node_ids[position]) if position < len(node_ids) else 'end'
+            moved_id = moved_nodes.pop(path, None)
+            if moved_id is None:
+                entries_shown = list(describe_entries(visible_entries([(name, path, is_directory)], self.ignore), self.ignore))
+                if not entries_shown: # Hidden as ignored
+                    continue
+                item_id = self._insert_item(node_id, *entries_shown[0], index)
+            else:
+                item_id = moved_id
+                self.file_tree.move(item_id, node_id, index)
+                self.file_tree.item(item_id, text=name, values=[path, "directory" if is_directory else "file"])
+                self._nodes[path] = item_id
+            names.insert(position, name)
+            node_ids.insert(position, item_id)
+
+    def _sorted_children(self, node_id):
+        """Names and node ids of the file and directory children of node_id, in listing order."""
+        names = []
+        node_ids = []
+        for child_id in self.file_tree.get_children(node_id):
+            values = self.file_tree.item(child_id, "values")
+            if values and values[1] in ("file", "directory"):
+                names.append(os.path.basename(values[0]))
+                node_ids.append(child_id)
+        return names, node_ids
+
+    def _shown_directory_node(self, dir_path):
+        """Node id of dir_path if its entries are shown and can be patched, else None."""
+        if dir_path not in self._watched:
+            return None
+        node_id = self._find_node(dir_path)
+        if node_id is None or node_id in self._scans or node_id in self._pages:
+            return None
+        return node_id
+
+    def _find_node(self, path):
+        """Node id showing path ("" for current_path), or None if it isn't in the tree."""
+        if path == self.current_path:
+            return ""
+        node_id = self._nodes.get(path)
+        if node_id is None:
+            return None
+        if not self.file_tree.exists(node_id) or self.file_tree.item(node_id, "values")[0] != path:
+            del self._nodes[path] # Deleted along with an ancestor
+            return None
+        return node_id
 
 
     def _on_treeview_open(self, event):
@@ -202,7 +3762,7 @@ class FileExplorer:
 
             dir_path_to_expand = self.file_tree.item(selected_node_id)['values'][0]
             if os.path.isdir(dir_path_to_expand):
-                self.populate_file_explorer(selected_node_id, dir_path_to_expand)
+                self.populate_file_explorer(selected_node_id, dir_path_to_expand, in_background=True)
             else: # Should not happen if placeholder logic is correct
                 print(f"Error: Attempted to expand a non-directory: {dir_path_to_expand}")
 
@@ -251,7 +3811,7 @@ class FileExplorer:
             try:
                 full_path = os.path.join(parent_dir, foldername)
                 os.mkdir(full_path)
-                self.populate_file_explorer(self.current_path) # Refresh
+                self._patch_tree([("created", full_path, True, None)])
                 if self.app: self.app.status_bar.update_status(f"Folder '{foldername}' created in {parent_dir}.")
             except FileExistsError:
                 messagebox.showerror("Error", f"Folder '{foldername}' already exists in {parent_dir}.", parent=self.frame)
@@ -268,7 +3828,7 @@ class FileExplorer:
                      messagebox.showerror("Error", f"File '{filename}' already exists in {parent_dir}.", parent=self.frame)
                      return
                 open(full_path, 'w').close() # Create empty file
-                self.populate_file_explorer(self.current_path) # Refresh
+                self._patch_tree([("created", full_path, False, None)])
                 if self.app: self.app.status_bar.update_status(f"File '{filename}' created in {parent_dir}.")
             except OSError as e:
                 messagebox.showerror("Error", f"Failed to create file: {e}", parent=self.frame)
@@ -280,7 +3840,7 @@ class FileExplorer:
             return
 
         selected_item_id = selected_items[0] # Assuming single selection for rename
-        old_path = self.file_tree.item(selected_item_id)['values'][0]
+        old_path, item_type = self.file_tree.item(selected_item_id)['values'][:2]
         old_name = os.path.basename(old_path)
 
         new_name = simpledialog.askstring("Rename", f"Enter new name for '{old_name}':",
@@ -290,7 +3850,7 @@ class FileExplorer:
             new_path = os.path.join(os.path.dirname(old_path), new_name)
             try:
                 os.rename(old_path, new_path)
-                self.populate_file_explorer(self.current_path) # Refresh explorer
+                self._patch_tree([("moved", old_path, item_type == "directory", new_path)])
                 # Notify App to update any open tabs
                 if self.app:
                     self.app.handle_renamed_file(old_path, new_path)
@@ -305,7 +3865,7 @@ class FileExplorer:
             return
 
         selected_item_id = selected_items[0]
-        path_to_delete = self.file_tree.item(selected_item_id)['values'][0]
+        path_to_delete, item_type = self.file_tree.item(selected_item_id)['values'][:2]
         item_name = os.path.basename(path_to_delete)
 
         confirm = messagebox.askyesno("Delete", f"Are you sure you want to delete '{item_name}'?", parent=self.frame)
@@ -316,7 +3876,7 @@ class FileExplorer:
                 elif os.path.isdir(path_to_delete):
                     shutil.rmtree(path_to_delete)
 
-                self.populate_file_explorer(self.current_path) # Refresh explorer
+                self._patch_tree([("deleted", path_to_delete, item_type == "directory", None)])
                 # Notify App to close any open tab for this file
                 if self.app:
                     self.app.handle_deleted_file(path_to_delete)
@@ -333,7 +3893,9 @@ class FileExplorer:
             # Ensure item_values_tuple is a non-empty sequence before trying to access its elements
             if item_values_tuple and len(item_values_tuple) > 0:
                 filepath = item_values_tuple[0] # filepath is the first value
-                if os.path.isfile(filepath):
+                if filepath == 'more': # "Show more..." of a paged directory
+                    self._show_next_page(self.file_tree.parent(selected_item_id))
+                elif os.path.isfile(filepath):
                     # self.text_editor.set_content is no longer valid here.
                     # The App class (self.app) handles opening the file in a new tab.
                     self.app.open_file_in_new_tab(filepath)
@@ -359,13 +3921,92 @@ class StatusBar:
             self.label.config(text="Ready")
 
 
+class TabIndex(dict):
+    """dict of tab id -> value that also indexes the tab ids by value.
+
+    Finds the tab of an editor or path without scanning every tab. With
+    sorted_values=True the distinct values (paths) are kept sorted as well, to
+    find all tabs of the files below a directory.
+    """
+    def __init__(self, items=(), sorted_values=False):
+        super().__init__()
+        self._tabs = {} # Value -> {tab id: None}, in the order they were added
+        self._sorted_values = [] if sorted_values else None
+        self.update(items)
+
+    def __setitem__(self, tab_id, value):
+        if tab_id in self:
+            self._unindex(tab_id, self[tab_id])
+        super().__setitem__(tab_id, value)
+        tabs = self._tabs.get(value)
+        if tabs is None:
+            tabs = self._tabs[value] = {}
+            if self._sorted_values is not None:
+                bisect.insort(self._sorted_values, value)
+        tabs[tab_id] = None
+
+    def __delitem__(self, tab_id):
+        self._unindex(tab_id, self[tab_id])
+        super().__delitem__(tab_id)
+
+    def _unindex(self, tab_id, value):
+        tabs = self._tabs[value]
+        del tabs[tab_id]
+        if not tabs:
+            del self._tabs[value]
+            if self._sorted_values is not None:
+                del self._sorted_values[bisect.bisect_left(self._sorted_values, value)]
+
+    def pop(self, tab_id, *default):
+        if tab_id not in self:
+            return super().pop(tab_id, *default) # The default, or KeyError
+        value = self[tab_id]
+        del self[tab_id]
+        return value
+
+    def popitem(self):
+        tab_id, value = super().popitem()
+        self._unindex(tab_id, value)
+        return tab_id, value
+
+    def setdefault(self, tab_id, default=None):
+        if tab_id not in self:
+            self[tab_id] = default
+        return self[tab_id]
+
+    def update(self, *args, **kwargs):
+        for tab_id, value in dict(*args, **kwargs).items():
+            self[tab_id] = value
+
+    def clear(self):
+        super().clear()
+        self._tabs.clear()
+        if self._sorted_values is not None:
+            self._sorted_values.clear()
+
+    def tab_for(self, value):
+        """The first tab with value, or None."""
+        tabs = self._tabs.get(value)
+        return next(iter(tabs)) if tabs else None
+
+    def tabs_under(self, dir_path):
+        """Tabs whose path is dir_path or below it; needs sorted_values."""
+        tabs = list(self._tabs.get(dir_path, ()))
+        prefix = os.path.join(dir_path, "")
+        position = bisect.bisect_left(self._sorted_values, prefix)
+        while position < len(self._sorted_values) and self._sorted_values[position].startswith(prefix):
+            tabs.extend(self._tabs[self._sorted_values[position]])
+            position += 1
+        return tabs
+
+
 class App:
     def __init__(self):
         self.window = tk.Tk()
         self.window.title("Basic Text Editor - Refactored")
 
         self.case_sensitive_var = tk.BooleanVar()
-        # self.regex_var = tk.BooleanVar() # For later
+        self.regex_var = tk.BooleanVar()
 
         # --- Main Content Frame ---
         # This frame will hold File Explorer (left) and TextEditor (right)
@@ -390,8 +4031,14 @@ class App:
         self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed) # Step 5
 
         # Store TextEditor instances and their filepaths
-        self.editors = {}  # Maps tab_id (widget path) to TextEditor instance
-        self.tab_filepaths = {}  # Maps tab_id (widget path) to filepath
+        self.editors = TabIndex()  # Maps tab_id (widget path) to TextEditor instance, and back
+        self.tab_filepaths = TabIndex(sorted_values=True)  # Maps tab_id (widget path) to filepath, and back
+        self.save_engine = SaveEngine()
+        self.closed_tabs = ClosedTabCache() # Recently closed tabs, reopened without reading or lexing
+        self.recovery_dir = RECOVERY_DIR # Unsaved edits are journaled here in case the editor crashes
+        self._pending_saves = {} # Save job id -> editor it was started from
+        self._latest_saves = {} # Editor -> id of its newest save job; only that one's result counts for the tab
+        self._save_poll_id = None
 
         # --- File Explorer ---
         file_explorer_frame = tk.Frame(main_content_frame, width=250)
@@ -400,8 +4047,13 @@ class App:
         # FileExplorer now gets 'self' (App instance) to call back for opening files
         self.file_explorer = FileExplorer(file_explorer_frame, self, self)
 
+        self.quick_open = None
+        self.window.bind("<Control-p>", self.show_quick_open)
+        self.window.bind_class("Text", "<Control-p>", self.show_quick_open) # Instead of Text's "previous line"
+
         self._create_menu()
         self.update_title_and_status() # Initial status update for empty notebook
+        self.window.after_idle(self._offer_recovery) # Once the window is up
 
     def _create_menu(self):
         self.menubar = Menu(self.window)
@@ -411,6 +4063,7 @@ class App:
         file_menu = Menu(self.menubar, tearoff=0)
         self.menubar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="Open", command=self.open_file)
+        file_menu.add_command(label="Quick Open...", command=self.show_quick_open, accelerator="Ctrl+P")
         file_menu.add_command(label="Save", command=self.save_file)
         file_menu.add_command(label="Close Tab", command=self.close_current_tab)
         file_menu.add_separator()
@@ -445,8 +4098,8 @@ class App:
         )
         self.case_sensitive_check.pack(side=tk.LEFT, padx=2)
 
-        # self.regex_check = tk.Checkbutton(self.search_frame, text="Regex", variable=self.regex_var, command=self._on_search_option_changed)
-        # self.regex_check.pack(side=tk.LEFT, padx=2) # For later
+        self.regex_check = tk.Checkbutton(self.search_frame, text="Regex", variable=self.regex_var, command=self._on_search_option_changed)
+        self.regex_check.pack(side=tk.LEFT, padx=2)
 
         self.close_search_button = tk.Button(self.search_frame, text="X", command=self._toggle_search_frame, width=3)
         self.close_search_button.pack(side=tk.LEFT, padx=(2,5))
@@ -488,6 +4141,9 @@ class App:
         if not query:
             editor.clear_search_highlights()
             return
+        if self.regex_var.get():
+            self._find_regex(editor, query)
+            return
 
         # If query changed or it's a new search context, reset start index
         if self.last_search_match_info.get('query') != query:
@@ -529,6 +4185,9 @@ class App:
         if not query:
             editor.clear_search_highlights()
             return
+        if self.regex_var.get():
+            self._find_regex(editor, query, backwards=True)
+            return
 
         # If query changed or it's a new search context, reset start index for prev search
         if self.last_search_match_info.get('query') != query:
@@ -564,7 +4223,45 @@ class App:
                 self.last_search_match_info = {'index': editor.text_area.index(tk.INSERT), 'query': query}
         # The 'else' for initial search success was removed in a previous step; status update moved into the 'if match_start' block.
 
+    def _find_regex(self, editor, query, backwards=False):
+        """Find Next/Previous in regex mode, from the editor's table of match spans."""
+        if not hasattr(editor, 'find_matches'):
+            self.status_bar.update_status("Regex search is not available for this file.")
+            return
+        try:
+            pattern = compile_search_pattern(query, ignore_case=not self.case_sensitive_var.get())
+        except re.error as e:
+            self.status_bar.update_status(f"Invalid regular expression: {e}")
+            return
+
+        if self.last_search_match_info.get('query') != query:
+            start_index = tk.INSERT if backwards else "1.0"
+        else:
+            start_index = self.last_search_match_info.get('index', "1.0")
+        editor.clear_search_highlights()
+
+        matches = editor.find_matches(pattern)
+        offset = editor.index_to_offset(start_index)
+        match = matches.previous_match(offset) if backwards else matches.next_match(offset)
+        if match is None:
+            self.status_bar.update_status(f"'{query}' not found.")
+            self.last_search_match_info = {'index': editor.text_area.index(tk.INSERT) if backwards else "1.0", 'query': query}
+            return
+
+        start, end, wrapped = match
+        match_start, match_end = editor.offset_to_index(start), editor.offset_to_index(end)
+        editor.text_area.tag_add("search_highlight", match_start, match_end)
+        editor.text_area.see(match_start)
+        found_at = match_start if backwards else match_end # Cursor at the start of the match going back, its end going forward
+        editor.text_area.mark_set(tk.INSERT, found_at)
+        self.last_search_match_info = {'index': found_at, 'query': query}
+        if wrapped:
+            self.status_bar.update_status(f"Wrapped around{' (previous)' if backwards else ''}. Found: '{query}' ({len(matches)} matches)")
+        else:
+            self.status_bar.update_status(f"Found: '{query}' ({len(matches)} matches)")
+
     def quit_application(self):
+        self._wait_for_saves() # A save still being written may fail and leave its tab modified
         # Iterate over a copy of tab IDs, as closing tabs will modify the notebook
         for tab_id in list(self.notebook.tabs()):
             self.notebook.select(tab_id) # Activate the tab to check it
@@ -578,6 +4275,7 @@ class App:
                 )
                 if response is True: # Yes
                     self.save_file()
+                    self._wait_for_saves()
                     if editor.is_modified: # Save was cancelled or failed
                         return # Abort quitting
                 elif response is None: # Cancel
@@ -594,6 +4292,8 @@ class App:
         editor_to_close = self.editors.get(current_tab_id)
         filepath_to_close = self.tab_filepaths.get(current_tab_id, "Untitled")
 
+        if editor_to_close in self._pending_saves.values():
+            self._wait_for_saves() # Once the tab is gone a failed write could not mark it modified
         if editor_to_close and editor_to_close.is_modified:
             response = messagebox.askyesnocancel(
                 "Save changes?",
@@ -601,9 +4301,9 @@ class App:
             )
             if response is True: # Yes
                 self.save_file() # Save the current file
-                # Check if save was cancelled (e.g., user closed save dialog)
-                # A bit tricky here, save_file doesn't directly return status of dialog.
-                # Assuming if still modified, save was cancelled or failed.
+                self._wait_for_saves()
+                # Check if save was cancelled (e.g., user closed save dialog) or failed,
+                # in which case the tab is still or again marked modified.
                 if editor_to_close.is_modified:
                     return # Don't close tab if save was cancelled
             elif response is None: # Cancel
@@ -611,6 +4311,9 @@ class App:
             # If response is False (No), proceed to close without saving.
 
         self.notebook.forget(current_tab_id) # Remove tab from notebook view
+        if editor_to_close:
+            self._remember_closed_tab(editor_to_close, filepath_to_close)
+            editor_to_close.close()
 
         # Clean up stored data associated with the closed tab
         if current_tab_id in self.editors:
@@ -620,6 +4323,17 @@ class App:
 
         self.update_title_and_status() # Update title/status based on new current tab or if no tabs remain
 
+    def _remember_closed_tab(self, editor, filepath):
+        """Keeps the text and highlighting of an unmodified tab for when its file is reopened."""
+        if (isinstance(editor, ReadOnlyView) or editor.is_modified or editor.is_loading
+                or editor.load_error or not editor.file_stamp):
+            return
+        # Reopening must show what a fresh read of the file would. After a save the file also
+        # holds SAVE_SUFFIX, which the highlighting kept here doesn't cover, so that is redone.
+        highlight_state = None if editor.file_suffix else editor.highlight_state()
+        entry = ClosedTab(editor.file_stamp, editor.document.text() + editor.file_suffix, editor.file_format, highlight_state)
+        self.closed_tabs.put(filepath, entry)
+
     def open_file(self):
         try:
             filepath = filedialog.askopenfilename(
@@ -628,40 +4342,106 @@ class App:
             if not filepath:
                 return
 
-            with open(filepath, "r") as input_file:
-                text_content = input_file.read()
-
-            # self.text_editor.set_content(text_content) # Old way
-            self.open_file_in_new_tab(filepath, text_content)
+            # Reading is left to open_file_in_new_tab, which maps large files instead
+            self.open_file_in_new_tab(filepath)
             # self.update_title_and_status(filepath) # update_title_and_status is called by open_file_in_new_tab
         except Exception as e:
             print(f"An error occurred while opening the file: {e}")
             self.status_bar.update_status(f"Error opening file: {os.path.basename(filepath)}")
 
-    def open_file_in_new_tab(self, filepath, content_to_load=None):
-        """Opens a file in a new tab, or switches to it if already open."""
-        # Check if file is already open by iterating through widget IDs and stored filepaths
-        for tab_widget_id in self.notebook.tabs():
-            if self.tab_filepaths.get(tab_widget_id) == filepath:
-                self.notebook.select(tab_widget_id)
-                return
-
-        tab_frame = tk.Frame(self.notebook)
-        # Pass App instance to TextEditor
-        editor_instance = TextEditor(tab_frame, self.status_bar, self)
+    def show_quick_open(self, event=None):
+        if self.quick_open and self.quick_open.window.winfo_exists():
+            self.quick_open.window.lift()
+            self.quick_open.entry.focus_set()
+        else:
+            index = self.file_explorer.get_workspace_index()
+            self.quick_open = QuickOpenPalette(self.window, index, self.open_file_in_new_tab)
+        return "break" # Handled; not passed on to the toplevel's binding as well
+
+    def open_file_in_new_tab(self, filepath, content_to_load=None, reuse_open_tab=True):
+        """Opens a file in a new tab, or switches to it if already open; returns the new tab's editor, if one was made.
+
+        With reuse_open_tab=False a new tab is made anyway, e.g. for recovered text.
+        """
+        # Check if file is already open
+        open_tab_id = self.tab_filepaths.tab_for(filepath) if reuse_open_tab else None
+        if open_tab_id:
+            self.notebook.select(open_tab_id)
+            return
 
+        file_format = FileFormat()
+        file_size = 0
+        stamp = None
+        closed_tab = None
         if content_to_load is None:
+            closed_tab = self.closed_tabs.take(filepath)
+        if closed_tab:
+            # Closed recently and unchanged on disk since
+            file_format = closed_tab.file_format
+            stamp = closed_tab.stamp
+        elif content_to_load is None:
+            stamp = file_stamp(filepath) # Before reading, so a change while reading shows up later
             try:
-                with open(filepath, "r") as input_file:
-                    content_to_load = input_file.read()
+                file_format = sniff_file(filepath)
             except Exception as e:
                 print(f"Error reading file for new tab: {e}")
                 self.status_bar.update_status(f"Error opening: {os.path.basename(filepath)}")
-                # Potentially destroy tab_frame if it was created but not added
                 return
+            file_size = self._file_size(filepath)
 
-        # Pass initial_load=True when first loading content into a new tab
-        editor_instance.set_content(content_to_load, initial_load=True)
+        tab_frame = tk.Frame(self.notebook)
+        loader = None
+        if file_format.is_binary:
+            # Decoding it would mangle the bytes; show what is in it instead
+            try:
+                editor_instance = BinaryPreview(tab_frame, self.status_bar, self, filepath)
+            except Exception as e:
+                print(f"Error reading binary file for new tab: {e}")
+                self.status_bar.update_status(f"Error opening: {os.path.basename(filepath)}")
+                tab_frame.destroy()
+                return
+        elif file_size >= LARGE_FILE_MIN_BYTES and file_format.is_ascii_compatible:
+            # Too big to load into a Text widget; view it read-only straight from the file.
+            # UTF-16/32 files can't be indexed by their bytes, so they are streamed in below.
+            try:
+                editor_instance = LargeFileViewer(tab_frame, self.status_bar, self, filepath, file_format.encoding)
+            except Exception as e:
+                print(f"Error mapping large file for new tab: {e}")
+                self.status_bar.update_status(f"Error opening: {os.path.basename(filepath)}")
+                tab_frame.destroy()
+                return
+        else:
+            # Pass App instance to TextEditor
+            editor_instance = TextEditor(tab_frame, self.status_bar, self, filepath=filepath)
+            editor_instance.file_format = file_format
+            editor_instance.file_stamp = stamp
+            editor_instance.journal_dir = self.recovery_dir
+
+            if closed_tab:
+                editor_instance.set_content(closed_tab.content, initial_load=True,
+                                            highlight_state=closed_tab.highlight_state)
+            elif content_to_load is None and file_size >= STREAMED_OPEN_MIN_BYTES:
+                # Read on a worker thread and fed in once the tab is up
+                try:
+                    loader = FileLoader(filepath, file_format.encoding)
+                except Exception as e:
+                    print(f"Error reading file for new tab: {e}")
+                    self.status_bar.update_status(f"Error opening: {os.path.basename(filepath)}")
+                    tab_frame.destroy()
+                    return
+            elif content_to_load is None:
+                try:
+                    with open(filepath, "r", encoding=file_format.encoding) as input_file:
+                        content_to_load = input_file.read()
+                except Exception as e:
+                    print(f"Error reading file for new tab: {e}")
+                    self.status_bar.update_status(f"Error opening: {os.path.basename(filepath)}")
+                    # Potentially destroy tab_frame if it was created but not added
+                    return
+
+            if loader is None and not closed_tab:
+                # Pass initial_load=True when first loading content into a new tab
+                editor_instance.set_content(content_to_load, initial_load=True)
 
         self.notebook.add(tab_frame, text=os.path.basename(filepath)) # Initial text without "*"
         # The new tab is automatically selected. Get its ID (widget path).
@@ -671,12 +4451,73 @@ class App:
         self.tab_filepaths[current_tab_widget_id] = filepath
 
         self.update_title_and_status() # This will use the newly selected tab
+        if loader:
+            editor_instance.load_streamed(loader)
+        elif closed_tab:
+            stats = self.closed_tabs.stats()
+            self.status_bar.update_status(
+                f"Reopened {os.path.basename(filepath)} from memory "
+                f"(cache: {stats['hits']} hits, {stats['misses']} misses, {stats['size_bytes'] // 1024} KB)")
+        return editor_instance
+
+    def _offer_recovery(self):
+        """Offers to restore the unsaved tabs of an editor that crashed."""
+        journals = EditJournal.find(self.recovery_dir)
+        if not journals:
+            return
+        restore = messagebox.askyesno(
+            "Restore unsaved changes?",
+            f"The editor did not exit properly. Restore {len(journals)} file(s) with unsaved changes?"
+        )
+        restored = 0
+        set_aside = [] # Journals that could not be replayed
+        for journal_path in journals:
+            if restore:
+                try:
+                    filepath, file_format, text = EditJournal.replay(journal_path)
+                except Exception as e:
+                    print(f"Error restoring unsaved changes: {e}")
+                    # Kept for recovery by hand, but not offered again on every start
+                    set_aside.append(EditJournal.set_aside(journal_path))
+                    continue
+                if not self._open_recovered_tab(filepath, file_format, text):
+                    set_aside.append(EditJournal.set_aside(journal_path)) # Only removed once its text is in a tab
+                    continue
+                restored += 1
+            try:
+                os.remove(journal_path)
+            except OSError as e:
+                print(f"Error removing recovery journal: {e}")
+        if restore:
+            self.status_bar.update_status(f"Restored {restored} of {len(journals)} file(s) with unsaved changes")
+        if set_aside:
+            kept = [path for path in set_aside if path]
+            messagebox.showwarning(
+                "Restore failed",
+                f"{len(set_aside)} file(s) could not be restored."
+                + (" Their recovery journals were kept as:\n" + "\n".join(kept) if kept else "")
+            )
+
+    def _open_recovered_tab(self, filepath, file_format, text):
+        """Opens recovered text in a tab of its own; returns whether it did."""
+        # Never switched to an open tab instead: several recovered buffers may all be "Untitled"
+        editor = self.open_file_in_new_tab(filepath or "Untitled", content_to_load=text, reuse_open_tab=False)
+        if not isinstance(editor, TextEditor):
+            return False
+        editor.file_format = file_format
+        # Not what the file holds, so it is unsaved, and journaled again from here
+        editor.undo_history.mark_unsaved()
+        editor.mark_as_modified(True)
+        return True
+
+    def _file_size(self, filepath):
+        try:
+            return os.path.getsize(filepath)
+        except OSError:
+            return 0
 
     def get_tab_id_for_editor(self, editor_instance):
-        for tab_id, editor in self.editors.items():
-            if editor == editor_instance:
-                return tab_id
-        return None
+        return self.editors.tab_for(editor_instance)
 
     def update_tab_text_for_editor(self, editor_instance, is_modified):
         tab_id = self.get_tab_id_for_editor(editor_instance)
@@ -697,6 +4538,14 @@ class App:
             self.status_bar.update_status("No active tab to save.")
             return
 
+        if isinstance(editor, ReadOnlyView):
+            self.status_bar.update_status("This file is opened read-only.")
+            return
+        if editor.is_loading or editor.load_error:
+            # Saving now would overwrite the file with part of its content
+            self.status_bar.update_status("The file has not been loaded completely; not saving.")
+            return
+
         current_tab_id = self.notebook.select() # This is the widget ID
         filepath = self.tab_filepaths.get(current_tab_id)
 
@@ -710,17 +4559,52 @@ class App:
             # Update tab text and stored filepath
             self.notebook.tab(current_tab_id, text=os.path.basename(filepath))
             self.tab_filepaths[current_tab_id] = filepath
+            editor.set_language_for(filepath)
+
+        # Written on the save engine's thread from a snapshot, so editing can go on.
+        # The tab counts as saved right away and is marked modified again if the write fails.
+        editor.file_stamp = None # Until the write is done
+        job_id = self.save_engine.save(filepath, editor.document.snapshot(), SAVE_SUFFIX, editor.file_format)
+        self._pending_saves[job_id] = editor
+        self._latest_saves[editor] = job_id
+        editor.mark_as_modified(False)
+        self.update_title_and_status() # Update title/status using current tab info
+        self.status_bar.update_status(f"Saving {os.path.basename(filepath)}...")
+        if self._save_poll_id is None:
+            self._save_poll_id = self.window.after(SAVE_POLL_MS, self._poll_saves)
+
+    def _poll_saves(self):
+        self._save_poll_id = None
+        for job_id, filepath, status, seconds, error in self.save_engine.take_results():
+            editor = self._pending_saves.pop(job_id, None)
+            filename = os.path.basename(filepath)
+            # A newer save of the same tab decides its state; this one's outcome no longer matters to it
+            is_latest = self._latest_saves.get(editor) == job_id
+            if is_latest:
+                del self._latest_saves[editor]
+            if status == "error":
+                print(f"An error occurred while saving the file: {error}")
+                self.status_bar.update_status(f"Error saving file: {filename}")
+                if is_latest and self.editors.tab_for(editor):
+                    editor.undo_history.mark_unsaved()
+                    editor.mark_as_modified(True)
+                continue
+            if is_latest and self.editors.tab_for(editor):
+                editor.file_stamp = file_stamp(filepath) # The file now holds what was saved
+                editor.file_suffix = SAVE_SUFFIX
+            if status == "skipped":
+                self.status_bar.update_status(f"{filename} unchanged, nothing to write ({seconds * 1000:.0f} ms)")
+            else:
+                self.status_bar.update_status(f"Saved {filename} in {seconds * 1000:.0f} ms")
+        if self._pending_saves:
+            self._save_poll_id = self.window.after(SAVE_POLL_MS, self._poll_saves)
 
-        try:
-            text_content = editor.get_content()
-            with open(filepath, "w") as output_file:
-                output_file.write(text_content)
-            # Mark editor as not modified
-            editor.mark_as_modified(False)
-            self.update_title_and_status() # Update title/status using current tab info
-        except Exception as e:
-            print(f"An error occurred while saving the file: {e}")
-            self.status_bar.update_status(f"Error saving file: {os.path.basename(filepath)}")
+    def _wait_for_saves(self):
+        """Finishes the queued saves now; the tab of a failed one is marked modified again."""
+        self.save_engine.wait()
+        if self._save_poll_id is not None:
+            self.window.after_cancel(self._save_poll_id)
+        self._poll_saves()
 
     def on_tab_changed(self, event=None):
         editor = self.get_current_editor()
@@ -756,43 +4640,38 @@ class App:
         self.window.mainloop()
 
     def handle_renamed_file(self, old_path, new_path):
-        # Check if the renamed file is open in any tab
-        found_tab_id = None
-        for tab_id, filepath in self.tab_filepaths.items():
-            if filepath == old_path:
-                found_tab_id = tab_id
-                break
-
-        if found_tab_id:
+        # The tab of the renamed file, or the tabs of the files in a renamed directory
+        found_tab_ids = self.tab_filepaths.tabs_under(old_path)
+        for found_tab_id in found_tab_ids:
             editor = self.editors.get(found_tab_id)
-            self.tab_filepaths[found_tab_id] = new_path
-            new_base_name = os.path.basename(new_path)
+            moved_path = new_path + self.tab_filepaths[found_tab_id][len(old_path):]
+            self.tab_filepaths[found_tab_id] = moved_path
+            if editor:
+                editor.set_language_for(moved_path)
+            new_base_name = os.path.basename(moved_path)
             tab_text = new_base_name
             if editor and editor.is_modified:
                 tab_text += "*"
             self.notebook.tab(found_tab_id, text=tab_text)
 
-            # If the renamed file is the currently active tab, update the main window title
-            if self.notebook.select() == found_tab_id:
-                self.update_title_and_status()
+        # If the renamed file is the currently active tab, update the main window title
+        if found_tab_ids and self.notebook.select() in found_tab_ids:
+            self.update_title_and_status()
 
     def handle_deleted_file(self, deleted_path):
-        # Check if the deleted file is open in any tab
-        found_tab_id = None
-        for tab_id, filepath in self.tab_filepaths.items():
-            if filepath == deleted_path:
-                found_tab_id = tab_id
-                break
-
-        if found_tab_id:
+        # The tab of the deleted file, or the tabs of the files in a deleted directory
+        found_tab_ids = self.tab_filepaths.tabs_under(deleted_path)
+        for found_tab_id in found_tab_ids:
             # Force close the tab without saving, as the file is gone
             self.notebook.forget(found_tab_id)
             if found_tab_id in self.editors:
-                # Potentially clean up editor resources if any were held (TextEditor currently doesn't have explicit cleanup)
+                # Release the tab's widgets and any worker or file mapping it holds
+                self.editors[found_tab_id].close()
                 del self.editors[found_tab_id]
             if found_tab_id in self.tab_filepaths:
                 del self.tab_filepaths[found_tab_id]
 
+        if found_tab_ids:
             self.update_title_and_status() # Update title as the current tab might have changed or closed
 
 
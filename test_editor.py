@@ -1,9 +1,51 @@
 import unittest
 from unittest.mock import patch, mock_open, MagicMock, call
 import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
 import tkinter as tk
 from tkinter import ttk
-from main import App, TextEditor, FileExplorer, StatusBar, SYNTAX_RULES
+from main import App, TextEditor, FileExplorer, StatusBar, SYNTAX_RULES, SyntaxLexer, LineTable, GRAMMARS, GrammarRegistry, HighlightWorker, LineIntervalSet, LineStateCache, LEXER_STATE_UNKNOWN, Document, LargeFileIndex, LineIndex, FenwickTree, UndoHistory, FileLoader, SaveEngine, FileFormat, sniff_bytes, sniff_file, format_hex_dump, ClosedTab, ClosedTabCache, file_stamp, EditJournal, TextBlocks, list_directory, directory_has_children, DirectoryScanner, DirectoryListing, InotifyWatcher, PollingWatcher, coalesce_events, TabIndex, IgnoreRules, IgnoreMatcher, walk_project, ListingCache, diff_listings, WorkspaceIndex, SearchMatches, compile_search_pattern
+import main
+
+
+class FakeDirEntry:
+
+    def __init__(self, parent, name, is_dir):
+        self.name = name
+        self.path = parent + '/' + name
+        self._is_dir = is_dir
+
+    def is_dir(self):
+        return self._is_dir
+
+
+class FakeScandirIterator:
+
+    def __init__(self, entries):
+        self._entries = iter(entries)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+def fake_scandir(listing):
+    """os.scandir stand-in serving {path: [(name, is_dir), ...]}."""
+    return lambda path: FakeScandirIterator([FakeDirEntry(path, name,
+        is_dir) for name, is_dir in listing.get(path, [])])
 
 
 class TestStatusBar(unittest.TestCase):
@@ -51,6 +93,61 @@ class TestTextEditor(unittest.TestCase):
         self.text_editor.clear_content()
         self.assertEqual(self.text_editor.get_content().strip(), '')
 
+    def test_disabled_editor_ignores_key_edits(self):
+        self.text_editor.set_content('abc', initial_load=True)
+        text_area = self.text_editor.text_area
+        text_area.config(state=tk.DISABLED)
+        text_area.mark_set(tk.INSERT, '1.2')
+        text_area.event_generate('<BackSpace>')
+        text_area.insert(tk.INSERT, 'pasted')
+        self.assertEqual(text_area.get('1.0', 'end-1c'), 'abc')
+        self.assertEqual(self.text_editor.get_content(), 'abc\n')
+        self.assertFalse(self.text_editor.undo_history.can_undo())
+
+    def test_failed_streamed_load_stays_read_only(self):
+        handle, path = tempfile.mkstemp()
+        with os.fdopen(handle, 'wb') as output_file:
+            output_file.write(b'a' * 100 + b'\xff')
+        self.addCleanup(os.remove, path)
+        with patch('main.STREAMED_OPEN_CHUNK_CHARS', 10):
+            self.text_editor.load_streamed(FileLoader(path, encoding='utf-8'))
+            while self.text_editor.is_loading:
+                self.test_root.update()
+        self.assertIsInstance(self.text_editor.load_error, UnicodeDecodeError)
+        text_area = self.text_editor.text_area
+        self.assertEqual(str(text_area.cget('state')), tk.DISABLED)
+        content = self.text_editor.get_content()
+        text_area.event_generate('<BackSpace>')
+        self.assertEqual(self.text_editor.get_content(), content)
+        self.assertEqual(text_area.get('1.0', tk.END), content)
+        self.assertFalse(self.text_editor.is_modified)
+
+    def test_document_follows_widget_edits(self):
+        self.text_editor.set_content('line one\nline two\n', initial_load=True)
+        text_area = self.text_editor.text_area
+        text_area.insert('2.5', 'number ')
+        text_area.delete('1.0', '1.5')
+        text_area.insert('end', 'tail')
+        text_area.delete('1.0', '1.1', '2.0')
+        text_area.replace('1.0', '1.3', 'ONE')
+        self.assertEqual(self.text_editor.document.text(), text_area.get(
+            '1.0', 'end - 1 chars'))
+        self.assertEqual(self.text_editor.get_content(), text_area.get(
+            '1.0', tk.END))
+
+    def test_undo_back_to_saved_state_clears_modified(self):
+        self.text_editor.set_content('saved', initial_load=True)
+        self.text_editor.text_area.insert('1.5', '!')
+        self.text_editor.text_area.delete('1.0', '1.1')
+        self.text_editor.undo()
+        self.assertEqual(self.text_editor.get_content(), 'saved!\n')
+        self.text_editor.undo()
+        self.assertEqual(self.text_editor.get_content(), 'saved\n')
+        self.assertFalse(self.text_editor.is_modified)
+        self.text_editor.redo()
+        self.assertEqual(self.text_editor.get_content(), 'saved!\n')
+        self.assertTrue(self.text_editor.is_modified)
+
     def test_mark_as_modified(self):
         self.text_editor.mark_as_modified(True)
         self.assertTrue(self.text_editor.is_modified)
@@ -61,25 +158,811 @@ class TestTextEditor(unittest.TestCase):
         self.mock_app_instance.update_tab_text_for_editor.assert_called_with(
             self.text_editor, False)
 
-    @patch('main.re.finditer')
-    def test_apply_syntax_highlighting_keywords(self, mock_finditer):
-        mock_match = MagicMock()
-        mock_match.start.return_value = 0
-        mock_match.end.return_value = 3
-        mock_finditer.return_value = [mock_match]
+    def test_apply_syntax_highlighting_keywords(self):
         self.text_editor.text_area.tag_add = MagicMock()
         self.text_editor.text_area.tag_remove = MagicMock()
         self.text_editor.set_content('def func(): pass', initial_load=True)
-        keyword_pattern = next(p for t, p in SYNTAX_RULES if t == 'keyword')
-        mock_finditer.assert_any_call(keyword_pattern, 'def func(): pass\n', 0)
         self.text_editor.text_area.tag_add.assert_any_call('keyword', '1.0',
-            '1.3')
+            '1.3', '1.12', '1.16')
+
+    def test_apply_syntax_highlighting_does_not_tag_keywords_in_strings(self):
+        self.text_editor.set_content("x = 'if' # for", initial_load=True)
+        ranges = self._syntax_tag_ranges()
+        self.assertEqual(ranges['keyword'], [])
+        self.assertEqual(ranges['string'], ['1.4', '1.8'])
+        self.assertEqual(ranges['comment'], ['1.9', '1.14'])
+
+    def test_plain_text_files_are_not_lexed(self):
+        editor = TextEditor(self.text_editor_frame, self.mock_status_bar,
+            self.mock_app_instance, filepath='/logs/server.log')
+        self.assertIsNone(editor.lexer)
+        editor.set_content('if x: pass # not python', initial_load=True)
+        for tag, _ in SYNTAX_RULES:
+            self.assertEqual(editor.text_area.tag_ranges(tag), ())
+
+    def test_set_language_for_switches_grammar(self):
+        self.text_editor.set_content('def f(): pass', initial_load=True)
+        self.text_editor.set_language_for('/notes/readme.md')
+        self.assertIsNone(self.text_editor.lexer)
+        self.assertEqual(self._syntax_tag_ranges()['keyword'], [])
+        self.text_editor.set_language_for('/src/module.py')
+        self.assertEqual(self._syntax_tag_ranges()['keyword'], ['1.0',
+            '1.3', '1.9', '1.13'])
 
     def test_clear_search_highlights(self):
         self.text_editor.text_area.tag_add('search_highlight', '1.0', '1.5')
         self.text_editor.clear_search_highlights()
         pass
 
+    def _syntax_tag_ranges(self):
+        return {tag: [str(index) for index in self.text_editor.text_area.
+            tag_ranges(tag)] for tag, _ in SYNTAX_RULES}
+
+    def test_incremental_highlighting_matches_full_rehighlight(self):
+        source = """def f():
+    \"\"\"Doc
+    string\"\"\"
+    return 'x'  # done
+
+class A:
+    pass
+"""
+        self.text_editor.set_content(source, initial_load=True)
+        text_area = self.text_editor.text_area
+        edits = [lambda : text_area.insert('5.0', 'x = """open\n'), lambda :
+            text_area.delete('3.10', '3.13'), lambda : text_area.insert(
+            'end', 'if x: pass # tail\n'), lambda : text_area.insert('2.4',
+            'y = 1\n'), lambda : text_area.delete('1.0', '3.0')]
+        for edit in edits:
+            edit()
+            self.text_editor.highlight_dirty_lines()
+            incremental = self._syntax_tag_ranges()
+            self.text_editor.apply_syntax_highlighting()
+            self.assertEqual(incremental, self._syntax_tag_ranges())
+
+    def test_highlight_dirty_lines_only_touches_edited_lines(self):
+        self.text_editor.set_content('a = 1\nb = 2\nc = 3\n', initial_load=True
+            )
+        self.text_editor.text_area.insert('2.0', 'if ')
+        self.text_editor.text_area.tag_remove = MagicMock()
+        self.text_editor.highlight_dirty_lines()
+        for tag_remove_call in (self.text_editor.text_area.tag_remove.
+            call_args_list):
+            self.assertEqual(tag_remove_call[0][1:], ('2.0', '3.0'))
+        self.text_editor.text_area.tag_remove.assert_any_call('keyword',
+            '2.0', '3.0')
+
+    def test_relexing_stops_once_line_states_match_the_cache(self):
+        self.text_editor.set_content('"""doc\nstring\n"""\n' + 'x = 1\n' *
+            200, initial_load=True)
+        self.text_editor.text_area.insert('2.0', 'if ')
+        self.text_editor.text_area.tag_remove = MagicMock()
+        self.text_editor.highlight_dirty_lines()
+        self.assertEqual({tag_remove_call[0][1:] for tag_remove_call in
+            self.text_editor.text_area.tag_remove.call_args_list}, {('2.0',
+            '3.0')})
+
+    def test_closing_a_docstring_relexes_the_lines_below(self):
+        self.text_editor.set_content('"""doc\nif x\n' + 'y = 1\n' * 100,
+            initial_load=True)
+        self.assertEqual(self._syntax_tag_ranges()['keyword'], [])
+        self.text_editor.text_area.insert('1.6', '"""')
+        self.text_editor.highlight_dirty_lines()
+        ranges = self._syntax_tag_ranges()
+        self.assertEqual(ranges['multiline_string_double'], ['1.0', '1.9'])
+        self.assertEqual(ranges['keyword'], ['2.0', '2.2'])
+
+    def _wait_for_background_highlighting(self, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while self.text_editor._highlight_job and time.monotonic() < deadline:
+            self.test_root.update()
+            time.sleep(0.01)
+        self.assertIsNone(self.text_editor._highlight_job)
+
+    @patch('main.BACKGROUND_HIGHLIGHT_MIN_CHARS', 10)
+    @patch('main.HIGHLIGHT_BATCH_RANGES', 1)
+    def test_large_regions_are_highlighted_in_background(self):
+        self.text_editor.set_content('def f():\n    return "if"  # x\n',
+            initial_load=True)
+        self.assertIsNotNone(self.text_editor._highlight_job)
+        self._wait_for_background_highlighting()
+        background = self._syntax_tag_ranges()
+        self.assertEqual(background['keyword'], ['1.0', '1.3', '2.4', '2.10'])
+        self.text_editor.apply_syntax_highlighting()
+        self.assertEqual(background, self._syntax_tag_ranges())
+
+    @patch('main.BACKGROUND_HIGHLIGHT_MIN_CHARS', 10)
+    def test_edit_discards_background_highlighting_result(self):
+        self.text_editor.set_content('x = 1\ny = 2\nz = 3\n', initial_load=True
+            )
+        self.text_editor.text_area.insert('2.0', 'if ')
+        self.assertIsNone(self.text_editor._highlight_job)
+        self.assertEqual(self.text_editor._dirty_lines, (1, 4))
+
+    @patch('main.VIEWPORT_HIGHLIGHT_MIN_LINES', 100)
+    @patch('main.VIEWPORT_HIGHLIGHT_MARGIN', 5)
+    def test_large_documents_only_highlight_the_viewport(self):
+        self.text_editor.text_area.yview = MagicMock(return_value=(0.0, 0.05))
+        self.text_editor.set_content('def f(): pass\n' * 400, initial_load=True
+            )
+        keyword_ranges = self._syntax_tag_ranges()['keyword']
+        self.assertIn('1.0', keyword_ranges)
+        self.assertNotIn('300.0', keyword_ranges)
+        self.text_editor.text_area.yview = MagicMock(return_value=(0.74, 0.76))
+        self.text_editor._highlight_viewport()
+        self.assertIn('300.0', self._syntax_tag_ranges()['keyword'])
+        self.assertNotIn('150.0', self._syntax_tag_ranges()['keyword'])
+
+    @patch('main.VIEWPORT_HIGHLIGHT_MIN_LINES', 100)
+    def test_edits_mark_viewport_lines_stale(self):
+        self.text_editor.text_area.yview = MagicMock(return_value=(0.0, 0.05))
+        self.text_editor.set_content('x = 1\n' * 400, initial_load=True)
+        self.text_editor.text_area.insert('2.0', 'if y: pass\n')
+        self.assertEqual(self.text_editor._clean_lines.missing(1, 3), [(2,
+            3)])
+        self.text_editor.highlight_dirty_lines()
+        self.assertIn('2.0', self._syntax_tag_ranges()['keyword'])
+        self.assertEqual(self.text_editor._clean_lines.missing(1, 3), [])
+
+
+class TestSyntaxLexer(unittest.TestCase):
+
+    def test_tokenize_produces_non_overlapping_ranges(self):
+        text = 'def f(): "if x"  # return\n"""a\ndef""" x\n'
+        tokens = list(GRAMMARS.lexer('python').tokenize(text))
+        self.assertEqual([tag for tag, _, _ in tokens], ['keyword', 'string',
+            'comment', 'multiline_string_double'])
+        for (_, _, previous_end), (_, start, _) in zip(tokens, tokens[1:]):
+            self.assertLessEqual(previous_end, start)
+
+    def test_highlight_ranges_uses_line_relative_positions(self):
+        ranges = GRAMMARS.lexer('python').highlight_ranges('x = 1\n    return """a\nb"""\n',
+            first_line=7)
+        self.assertEqual(ranges['keyword'], ['8.4', '8.10'])
+        self.assertEqual(ranges['multiline_string_double'], ['8.11', '9.4'])
+
+    def test_line_table_position(self):
+        table = LineTable('ab\n\ncd', first_line=3)
+        self.assertEqual(table.position(0), '3.0')
+        self.assertEqual(table.position(2), '3.2')
+        self.assertEqual(table.position(3), '4.0')
+        self.assertEqual(table.position(5), '5.1')
+
+    def test_lex_records_line_start_states(self):
+        text = 'x = 1\ns = """a\nb\nc""" + 1\nd = """open\ne\n'
+        ranges, line_states = GRAMMARS.lexer('python').lex(text)
+        self.assertEqual(list(line_states), [0, 0, 1, 1, 0, 1, 1])
+        self.assertEqual(ranges['multiline_string_double'], ['2.4', '4.4',
+            '5.4', '7.0'])
+
+    def test_lex_resumes_inside_multiline_string(self):
+        ranges, line_states = GRAMMARS.lexer('python').lex('b\nc""" + if\n', first_line
+            =3, state=1)
+        self.assertEqual(list(line_states), [1, 1, 0])
+        self.assertEqual(ranges['multiline_string_double'], ['3.0', '4.4'])
+        self.assertEqual(ranges['keyword'], ['4.7', '4.9'])
+
+    def test_custom_rules(self):
+        lexer = SyntaxLexer([('number', '\\d+'), ('word', '[a-z]+')])
+        self.assertEqual(list(lexer.tokenize('ab 12')), [('word', 0, 2), (
+            'number', 3, 5)])
+
+
+class TestGrammarRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = GrammarRegistry(default_grammar='python')
+        self.registry.register('python', ['.py'], SYNTAX_RULES)
+
+    def test_grammar_is_compiled_on_first_use_only(self):
+        self.assertFalse(self.registry.is_compiled('python'))
+        lexer = self.registry.lexer_for_path('/src/app.PY')
+        self.assertTrue(self.registry.is_compiled('python'))
+        self.assertIs(self.registry.lexer_for_path('/src/other.py'), lexer)
+
+    def test_unknown_extensions_are_plain_text(self):
+        self.assertIsNone(self.registry.lexer_for_path('/notes/todo.txt'))
+        self.assertIsNone(self.registry.lexer_for_path('/logs/big.log'))
+        self.assertFalse(self.registry.is_compiled('python'))
+
+    def test_untitled_buffers_use_default_grammar(self):
+        self.assertEqual(self.registry.grammar_for_path(None), 'python')
+        self.assertEqual(self.registry.grammar_for_path('Untitled'), 'python')
+
+
+class TestDocument(unittest.TestCase):
+
+    def test_insert_delete_and_slice(self):
+        document = Document('hello world')
+        document.insert(5, ',')
+        document.insert(len(document), '!')
+        self.assertEqual(document.delete(0, 1), 'h')
+        document.insert(0, 'H')
+        self.assertEqual(document.text(), 'Hello, world!')
+        self.assertEqual(document.slice(7, 12), 'world')
+        self.assertEqual(len(document), 13)
+
+    def test_consecutive_typing_is_coalesced_into_one_piece(self):
+        document = Document('abc')
+        for offset, char in enumerate('xyz', 1):
+            document.insert(offset, char)
+        self.assertEqual(document.text(), 'axyzbc')
+        self.assertEqual(len(document._pieces), 3)
+
+    def test_snapshot_is_unaffected_by_later_edits(self):
+        document = Document('one two')
+        snapshot = document.snapshot()
+        document.delete(0, 4)
+        document.insert(0, 'three ')
+        self.assertEqual(snapshot.text(), 'one two')
+        self.assertEqual(snapshot.version, 0)
+        self.assertEqual(document.text(), 'three two')
+        self.assertEqual(list(snapshot.chunks(chunk_size=3)), ['one', ' tw', 'o'])
+
+    def test_edit_log_and_version(self):
+        document = Document('abc')
+        document.insert(3, 'd')
+        document.replace(0, 1, 'A')
+        self.assertEqual(document.version, 3)
+        self.assertEqual(document.edits_since(1), [(2, 0, 'a', ''), (3, 0, '', 'A')])
+        self.assertEqual(document.edits_since(3), [])
+
+    def test_edits_since_reports_truncated_log(self):
+        document = Document()
+        for position in range(main.DOCUMENT_EDIT_LOG_LIMIT + 5):
+            document.insert(position, 'x')
+        self.assertIsNone(document.edits_since(1))
+        self.assertEqual(len(document.edits_since(document.version - 2)), 2)
+
+
+class TestUndoHistory(unittest.TestCase):
+
+    def test_consecutive_typing_is_one_step(self):
+        history = UndoHistory()
+        for offset, char in enumerate('abc'):
+            history.record([(offset, '', char)])
+        history.record([(3, '', '\n')])
+        self.assertEqual(history.undo(), [(3, '', '\n')])
+        self.assertEqual(history.undo(), [(0, '', 'abc')])
+        self.assertFalse(history.can_undo())
+
+    def test_backspaces_are_one_step(self):
+        history = UndoHistory()
+        for offset, char in ((2, 'c'), (1, 'b'), (0, 'a')):
+            history.record([(offset, char, '')])
+        self.assertEqual(history.undo(), [(0, 'abc', '')])
+
+    def test_typing_after_save_is_a_new_step(self):
+        history = UndoHistory()
+        for offset, char in enumerate('abc'):
+            history.record([(offset, '', char)])
+        history.mark_saved()
+        history.record([(3, '', 'd')])
+        self.assertEqual(history.undo(), [(3, '', 'd')])
+        self.assertTrue(history.is_at_saved_state())
+        self.assertEqual(history.undo(), [(0, '', 'abc')])
+
+    def test_saved_marker_follows_undo_and_redo(self):
+        history = UndoHistory()
+        history.mark_saved()
+        history.record([(0, '', 'x')])
+        self.assertFalse(history.is_at_saved_state())
+        history.undo()
+        self.assertTrue(history.is_at_saved_state())
+        history.redo()
+        self.assertFalse(history.is_at_saved_state())
+
+    def test_typing_after_save_does_not_match_saved_state(self):
+        history = UndoHistory()
+        history.record([(0, '', 'a')])
+        history.mark_saved()
+        history.record([(1, '', 'b')])
+        self.assertFalse(history.is_at_saved_state())
+
+    def test_budget_drops_oldest_steps(self):
+        history = UndoHistory(budget_chars=10)
+        for step in range(5):
+            history.record([(step * 3, '', 'ab\n')])
+        self.assertEqual(len(history._undo), 3)
+        self.assertLessEqual(history._chars, 10)
+        history.record([(0, '', 'x' * 11)])
+        self.assertFalse(history.can_undo())
+
+
+class TestLineIndex(unittest.TestCase):
+
+    def test_fenwick_prefix_sums_and_find(self):
+        tree = FenwickTree([3, 0, 4, 1])
+        tree.add(1, 2)
+        self.assertEqual(tree.prefix_sum(2), 5)
+        self.assertEqual(tree.find(4), (1, 3))
+        self.assertEqual(tree.find(5), (2, 5))
+
+    def test_offset_and_position_round_trip(self):
+        index = LineIndex('ab\ncde\n\nf')
+        self.assertEqual(index.line_count, 4)
+        self.assertEqual(index.offset(2, 1), 4)
+        self.assertEqual(index.offset(2, 99), 6)
+        self.assertEqual(index.offset(9, 0), 9)
+        self.assertEqual(index.position(3), (2, 0))
+        self.assertEqual(index.position(7), (3, 0))
+        self.assertEqual(index.index(9), '4.1')
+
+    @patch('main.LINE_INDEX_BLOCK_LINES', 2)
+    def test_edits_keep_index_in_sync_across_blocks(self):
+        text = ''.join(f'line {number}\n' for number in range(20))
+        index = LineIndex(text)
+        edits = [('insert', 9, 'new\nlines\n'), ('delete', 30, 80), (
+            'insert', 0, 'x'), ('delete', 0, 14), ('insert', 40, '\n\n\n')]
+        for operation, offset, argument in edits:
+            if operation == 'insert':
+                text = text[:offset] + argument + text[offset:]
+                index.insert(offset, argument)
+            else:
+                text = text[:offset] + text[argument:]
+                index.delete(offset, argument)
+            self.assertEqual(len(index), len(text))
+            self.assertEqual(index.line_count, text.count('\n') + 1)
+            for offset_in_text in range(len(text) + 1):
+                line = text.count('\n', 0, offset_in_text) + 1
+                column = offset_in_text - (text.rfind('\n', 0, offset_in_text) + 1)
+                self.assertEqual(index.position(offset_in_text), (line, column))
+                self.assertEqual(index.offset(line, column), offset_in_text)
+
+
+class TestFileLoader(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        with os.fdopen(handle, 'w') as output_file:
+            output_file.write('x' * 2500)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _drain(self, loader):
+        chunks = []
+        while True:
+            chunk = loader.chunks.get(timeout=2)
+            if chunk is None:
+                return chunks
+            chunks.append(chunk)
+
+    @patch('main.STREAMED_OPEN_CHUNK_CHARS', 1000)
+    def test_reads_file_in_chunks(self):
+        loader = FileLoader(self.path)
+        chunks = self._drain(loader)
+        self.assertEqual([len(chunk) for chunk in chunks], [1000, 1000, 500])
+        self.assertEqual(loader.progress(), 100)
+        self.assertIsNone(loader.error)
+
+    def test_read_error_is_reported(self):
+        loader = FileLoader(os.path.dirname(self.path))
+        self.assertEqual(self._drain(loader), [])
+        self.assertIsInstance(loader.error, OSError)
+
+    @patch('main.STREAMED_OPEN_CHUNK_CHARS', 10)
+    @patch('main.STREAMED_OPEN_QUEUE_CHUNKS', 2)
+    def test_cancel_stops_reading(self):
+        loader = FileLoader(self.path)
+        loader.cancel()
+        loader._thread.join(timeout=2)
+        self.assertFalse(loader._thread.is_alive())
+        self.assertLess(loader.chunks.qsize(), 250)
+
+
+class TestSaveEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'notes.txt')
+        with open(self.path, 'w') as output_file:
+            output_file.write('old content')
+        self.engine = SaveEngine()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _save(self, document, suffix='\n', file_format=None):
+        self.engine.save(self.path, document.snapshot(), suffix, file_format)
+        self.engine.wait()
+        results = self.engine.take_results()
+        self.assertEqual(len(results), 1)
+        return results[0]
+
+    def test_writes_snapshot_atomically(self):
+        os.chmod(self.path, 0o640)
+        _, filepath, status, seconds, error = self._save(Document('new\ncontent'))
+        self.assertEqual((filepath, status, error), (self.path, 'written', None))
+        self.assertGreaterEqual(seconds, 0)
+        with open(self.path) as input_file:
+            self.assertEqual(input_file.read(), 'new\ncontent\n')
+        self.assertEqual(os.listdir(self.directory), ['notes.txt'])
+        if os.name == 'posix':
+            self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o640)
+
+    def test_unchanged_content_is_not_written_again(self):
+        document = Document('same')
+        self.assertEqual(self._save(document)[2], 'written')
+        self.assertEqual(self._save(document)[2], 'skipped')
+        document.insert(0, 'not the ')
+        self.assertEqual(self._save(document)[2], 'written')
+
+    def test_file_changed_elsewhere_is_written_again(self):
+        document = Document('ours')
+        self.assertEqual(self._save(document)[2], 'written')
+        with open(self.path, 'w') as output_file:
+            output_file.write('another program')
+        self.assertEqual(self._save(document)[2], 'written')
+        with open(self.path) as input_file:
+            self.assertEqual(input_file.read(), 'ours\n')
+
+    def test_failed_write_keeps_original_file(self):
+        with patch('main.os.replace', side_effect=OSError('disk full')):
+            _, _, status, _, error = self._save(Document('lost'))
+        self.assertEqual(status, 'error')
+        self.assertIsInstance(error, OSError)
+        with open(self.path) as input_file:
+            self.assertEqual(input_file.read(), 'old content')
+        self.assertEqual(os.listdir(self.directory), ['notes.txt'])
+
+    def test_keeps_encoding_and_line_endings(self):
+        file_format = FileFormat('latin-1', '\r\n')
+        self.assertEqual(self._save(Document('caf\xe9\nbar'), '\n', file_format)[2], 'written')
+        with open(self.path, 'rb') as input_file:
+            self.assertEqual(input_file.read(), b'caf\xe9\r\nbar\r\n')
+        # Same text in another format is still a change
+        self.assertEqual(self._save(Document('caf\xe9\nbar'))[2], 'written')
+
+
+class TestFileSniffing(unittest.TestCase):
+
+    def test_byte_order_marks(self):
+        self.assertEqual(sniff_bytes(b'\xef\xbb\xbfa\r\nb').encoding, 'utf-8-sig')
+        self.assertEqual(sniff_bytes('a\nb'.encode('utf-16')).encoding, 'utf-16')
+        file_format = sniff_bytes('a\nb'.encode('utf-32'))
+        self.assertEqual((file_format.encoding, file_format.newline,
+            file_format.is_binary), ('utf-32', '\n', False))
+
+    def test_ascii_compatible_encodings(self):
+        for encoding in (None, 'utf-8', 'utf-8-sig', 'latin-1', 'cp1252'):
+            self.assertTrue(FileFormat(encoding).is_ascii_compatible, encoding)
+        for encoding in ('utf-16', 'utf-16-le', 'utf-32'):
+            self.assertFalse(FileFormat(encoding).is_ascii_compatible, encoding)
+        with self.assertRaises(ValueError):
+            LargeFileIndex(__file__, 'utf-16')
+
+    def test_binary_content(self):
+        self.assertTrue(sniff_bytes(b'PK\x03\x04\x00\x00').is_binary)
+        self.assertTrue(sniff_bytes(bytes([1, 2, 3, 4, 5, 65])).is_binary)
+        self.assertFalse(sniff_bytes(b'plain text\twith a tab\n').is_binary)
+        self.assertFalse(sniff_bytes(b'').is_binary)
+
+    def test_utf8_or_latin1(self):
+        self.assertEqual(sniff_bytes('caf\xe9 na\xefve'.encode('utf-8')).encoding, 'utf-8')
+        # A multi-byte character cut off at the end of the sample is still UTF-8
+        self.assertEqual(sniff_bytes('\u20ac'.encode('utf-8')[:2],
+            final=False).encoding, 'utf-8')
+        self.assertEqual(sniff_bytes('caf\xe9'.encode('latin-1')).encoding, 'latin-1')
+        self.assertEqual(sniff_bytes('\u20ac'.encode('utf-8')[:2]).encoding, 'latin-1')
+
+    def test_newline_style(self):
+        self.assertEqual(sniff_bytes(b'a\r\nb\r\nc\n').newline, '\r\n')
+        self.assertEqual(sniff_bytes(b'a\nb\nc\r\n').newline, '\n')
+        self.assertEqual(sniff_bytes(b'a\rb\r').newline, '\r')
+        self.assertIsNone(sniff_bytes(b'one line').newline)
+
+    def test_sniff_file_reads_the_start_only(self):
+        handle, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'wb') as output_file:
+            output_file.write(b'text\n' * main.SNIFF_BYTES + b'\0')
+        self.assertFalse(sniff_file(path).is_binary)
+
+    def test_hex_dump(self):
+        self.assertEqual(format_hex_dump(b'AB\x00', offset=16),
+            '00000010  41 42 00' + ' ' * 39 + '  |AB.|')
+
+
+class TestClosedTabCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _file(self, name, content='text'):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as output_file:
+            output_file.write(content)
+        return path
+
+    def _entry(self, path, content='text'):
+        return ClosedTab(file_stamp(path), content, FileFormat(), None)
+
+    def test_unchanged_file_is_a_hit(self):
+        cache = ClosedTabCache()
+        path = self._file('a.txt')
+        entry = self._entry(path)
+        cache.put(path, entry)
+        self.assertIs(cache.take(path), entry)
+        self.assertIsNone(cache.take(path))
+        self.assertEqual((cache.hits, cache.misses, cache.size_bytes), (1, 1, 0))
+
+    def test_changed_file_is_a_miss(self):
+        cache = ClosedTabCache()
+        path = self._file('a.txt')
+        cache.put(path, self._entry(path))
+        self._file('a.txt', 'longer text')
+        self.assertIsNone(cache.take(path))
+        os.remove(path)
+        self.assertIsNone(cache.take(path))
+        self.assertEqual(cache.stats()['misses'], 2)
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_closed_is_evicted(self):
+        paths = [self._file(f'{name}.txt') for name in 'abc']
+        entries = [self._entry(path, name * 1000) for path, name in zip(paths, 'abc')]
+        cache = ClosedTabCache(budget_bytes=entries[0].size_bytes * 2)
+        for path, entry in zip(paths, entries):
+            cache.put(path, entry)
+        self.assertEqual((len(cache), cache.evictions), (2, 1))
+        self.assertIsNone(cache.take(paths[0]))
+        self.assertIs(cache.take(paths[2]), entries[2])
+        cache.put(paths[0], self._entry(paths[0], 'x' * 10 ** 6))
+        self.assertEqual(len(cache), 1) # Larger than the whole budget
+
+    def test_stats(self):
+        cache = ClosedTabCache()
+        path = self._file('a.txt')
+        cache.put(path, self._entry(path))
+        cache.take(path)
+        cache.take(path)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (1, 1, 0.5))
+
+
+class TestEditJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.journal_dir = os.path.join(self.directory, 'recovery')
+        self.path = os.path.join(self.directory, 'notes.txt')
+        with open(self.path, 'w') as output_file:
+            output_file.write('one\ntwo\n')
+
+    def _crash(self, journal):
+        """Leaves the journal behind as if its editor had died."""
+        crashed_path = os.path.join(self.journal_dir, '99999999-' + os.path.basename(journal.path))
+        os.rename(journal.path, crashed_path)
+        return crashed_path
+
+    def test_unrecoverable_journal_is_set_aside(self):
+        crashed_path = self._crash(EditJournal(self.journal_dir, None, FileFormat()))
+        kept_path = EditJournal.set_aside(crashed_path)
+        self.assertEqual(kept_path, crashed_path + main.UNRECOVERABLE_JOURNAL_SUFFIX)
+        self.assertTrue(os.path.exists(kept_path))
+        self.assertEqual(EditJournal.find(self.journal_dir), [])
+
+    def test_edits_replay_on_the_file(self):
+        document = Document('one\ntwo\n')
+        journal = EditJournal(self.journal_dir, self.path, FileFormat('utf-8', '\n'), file_stamp(self.path))
+        for offset, character in enumerate('zero\n'):
+            document.insert(offset, character)
+        document.delete(0, 1)
+        document.replace(3, 5, '\u20ac')
+        journal.append(list(document.edit_log))
+        filepath, file_format, text = EditJournal.replay(journal.path)
+        self.assertEqual((filepath, text), (self.path, document.text()))
+        self.assertEqual((file_format.encoding, file_format.newline), ('utf-8', '\n'))
+
+    def test_compact_writes_a_snapshot(self):
+        document = Document('x' * 100)
+        journal = EditJournal(self.journal_dir, None, FileFormat())
+        journal.compact('/new/name.txt', document.snapshot())
+        document.insert(50, 'middle')
+        journal.append(list(document.edit_log))
+        filepath, _, text = EditJournal.replay(journal.path)
+        self.assertEqual((filepath, text), ('/new/name.txt', document.text()))
+        self.assertEqual(journal.edit_bytes, len('middle'))
+        self.assertFalse(journal.needs_compaction(len(document)))
+
+    def test_record_cut_off_by_a_crash_is_ignored(self):
+        journal = EditJournal(self.journal_dir, self.path, FileFormat(), file_stamp(self.path))
+        journal.append([(1, 0, '', 'A'), (2, 8, '', 'tail')])
+        with open(journal.path, 'rb+') as journal_file:
+            journal_file.truncate(os.path.getsize(journal.path) - 2)
+        self.assertEqual(EditJournal.replay(journal.path)[2], 'Aone\ntwo\n')
+
+    def test_changed_file_is_not_replayed(self):
+        journal = EditJournal(self.journal_dir, self.path, FileFormat(), file_stamp(self.path))
+        journal.append([(1, 0, '', 'A')])
+        with open(self.path, 'w') as output_file:
+            output_file.write('rewritten elsewhere')
+        with self.assertRaises(ValueError):
+            EditJournal.replay(journal.path)
+
+    def test_find_skips_journals_of_running_editors(self):
+        running = EditJournal(self.journal_dir, None, FileFormat())
+        crashed_path = self._crash(EditJournal(self.journal_dir, None, FileFormat()))
+        self.assertEqual(EditJournal.find(self.journal_dir), [crashed_path])
+        running.discard()
+        self.assertEqual(EditJournal.find(os.path.join(self.directory, 'missing')), [])
+
+    def test_text_blocks_follow_string_edits(self):
+        with patch('main.JOURNAL_REPLAY_BLOCK_CHARS', 4):
+            expected = 'hello world, and more'
+            blocks = TextBlocks(expected)
+            for start, end, text in [(0, 0, '>'), (3, 12, ''), (len(expected), 99, '!'),
+                    (5, 6, 'a much longer insertion'), (0, 999, ''), (0, 0, 'new')]:
+                start, end = min(start, len(expected)), min(end, len(expected))
+                expected = expected[:start] + text + expected[end:]
+                blocks.replace(start, end, text)
+                self.assertEqual((blocks.text(), len(blocks)), (expected, len(expected)))
+
+
+class TestSearchMatches(unittest.TestCase):
+
+    def test_patterns_are_compiled_once(self):
+        pattern = compile_search_pattern('a+b', ignore_case=True)
+        self.assertIn(('a+b', True), main._search_patterns)
+        self.assertIs(compile_search_pattern('a+b', ignore_case=True), pattern)
+        self.assertIsNot(compile_search_pattern('a+b'), pattern)
+        with patch('main.SEARCH_PATTERN_CACHE_SIZE', 2):
+            compile_search_pattern('c')
+            compile_search_pattern('d')
+            self.assertEqual(list(main._search_patterns), [('c', False), (
+                'd', False)])
+        with self.assertRaises(re.error):
+            compile_search_pattern('(')
+
+    def test_next_and_previous_wrap_around(self):
+        matches = SearchMatches(compile_search_pattern('^x*\\d+'),
+            '12 a\nxx345\nb 6\n7', 1)
+        self.assertEqual(len(matches), 3)
+        self.assertEqual(matches.next_match(0), (0, 2, False))
+        self.assertEqual(matches.next_match(1), (5, 10, False))
+        self.assertEqual(matches.next_match(16), (0, 2, True))
+        self.assertEqual(matches.previous_match(5), (0, 2, False))
+        self.assertEqual(matches.previous_match(0), (15, 16, True))
+        empty = SearchMatches(compile_search_pattern('z*'), 'abc', 1)
+        self.assertEqual((len(empty), empty.next_match(0), empty.
+            previous_match(0)), (0, None, None))
+
+
+class TestLargeFileIndex(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        with os.fdopen(handle, 'w') as output_file:
+            output_file.write(''.join(f'line {number}\n' for number in
+                range(1, 5001)) + 'last')
+        stride_patcher = patch('main.LARGE_FILE_INDEX_STRIDE_BYTES', 256)
+        stride_patcher.start()
+        self.addCleanup(stride_patcher.stop)
+        self.index = LargeFileIndex(self.path)
+        self.index._thread.join()
+
+    def tearDown(self):
+        self.index.close()
+        os.remove(self.path)
+
+    def test_counts_lines_including_unterminated_last_line(self):
+        self.assertTrue(self.index.complete)
+        self.assertEqual(self.index.line_count, 5001)
+
+    def test_index_is_sparse(self):
+        self.assertLess(len(self.index._checkpoint_lines), 5001 // 10)
+
+    def test_read_lines_from_any_line(self):
+        self.assertEqual(self.index.read_lines(1, 2), 'line 1\nline 2\n')
+        self.assertEqual(self.index.read_lines(2500, 2), 'line 2500\nline 2501\n')
+        self.assertEqual(self.index.read_lines(5000, 10), 'line 5000\nlast')
+        self.assertEqual(self.index.read_lines(6000, 10), '')
+
+
+class TestHighlightWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.worker = HighlightWorker(GRAMMARS.lexer('python'), delay=0.05)
+
+    def tearDown(self):
+        self.worker.stop()
+
+    def _wait_for_result(self, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            result = self.worker.take_result()
+            if result is not None:
+                return result
+            time.sleep(0.01)
+        self.fail('No highlighting result arrived')
+
+    def test_result_is_stamped_with_snapshot_version(self):
+        self.worker.submit(3, 10, 'def f(): pass\n')
+        version, first_line, ranges, _ = self._wait_for_result()
+        self.assertEqual((version, first_line), (3, 10))
+        self.assertEqual(ranges['keyword'], ['10.0', '10.3', '10.9', '10.13'])
+
+    def test_newer_submit_supersedes_pending_job(self):
+        self.worker.submit(1, 1, 'if x: pass\n')
+        self.worker.submit(2, 1, 'while x: pass\n')
+        version, _, ranges, _ = self._wait_for_result()
+        self.assertEqual(version, 2)
+        self.assertEqual(ranges['keyword'][:2], ['1.0', '1.5'])
+        time.sleep(0.1)
+        self.assertIsNone(self.worker.take_result())
+
+    def test_cancelled_lexing_returns_none(self):
+        self.assertIsNone(GRAMMARS.lexer('python').highlight_ranges('if x: pass\n',
+            is_cancelled=lambda : True))
+
+
+    def test_results_are_applied_in_whole_line_batches(self):
+        ranges = {'string': ['2.4', '4.3', '6.0', '6.2'], 'keyword': ['1.0',
+            '1.3', '5.0', '5.2', '6.4', '6.6']}
+        with patch('main.HIGHLIGHT_BATCH_RANGES', 2):
+            batches = TextEditor._highlight_batches(1, 10, ranges)
+        self.assertEqual(batches, [('1.0', '5.0', {'keyword': ['1.0', '1.3'
+            ], 'string': ['2.4', '4.3']}), ('5.0', '11.0', {'keyword': [
+            '5.0', '5.2', '6.4', '6.6'], 'string': ['6.0', '6.2']})])
+        with patch('main.HIGHLIGHT_BATCH_RANGES', 1):
+            batches = TextEditor._highlight_batches(1, 10, {'string': ['1.2',
+                '8.3'], 'keyword': ['8.5', '8.7']})
+        self.assertEqual([batch[:2] for batch in batches], [('1.0', '8.3'),
+            ('8.3', '11.0')])
+        self.assertEqual(TextEditor._highlight_batches(3, 5, {'string': []}
+            ), [('3.0', '6.0', {})])
+
+
+class TestLineStateCache(unittest.TestCase):
+
+    def test_replace_lines_keeps_first_line_and_shifts_the_rest(self):
+        cache = LineStateCache()
+        cache.update(1, [0, 0, 1, 1, 0])
+        cache.replace_lines(2, 3, 5)
+        self.assertEqual(list(cache.states), [0, 0, LEXER_STATE_UNKNOWN,
+            LEXER_STATE_UNKNOWN, LEXER_STATE_UNKNOWN, 1, 0])
+        self.assertEqual(cache.get(2), 0)
+        self.assertEqual(cache.get(6), 1)
+        self.assertEqual(cache.get(50), LEXER_STATE_UNKNOWN)
+
+    def test_last_known_line(self):
+        cache = LineStateCache()
+        cache.update(1, [0, 0, 1])
+        cache.replace_lines(2, 2, 4)
+        self.assertEqual(cache.last_known_line(4), 2)
+        self.assertEqual(cache.last_known_line(9), 5)
+        cache.invalidate_from(2)
+        self.assertEqual(cache.last_known_line(9), 1)
+
+
+class TestLineIntervalSet(unittest.TestCase):
+
+    def test_add_merges_touching_intervals(self):
+        intervals = LineIntervalSet()
+        intervals.add(10, 20)
+        intervals.add(1, 5)
+        intervals.add(6, 9)
+        self.assertEqual(intervals.intervals, [(1, 20)])
+
+    def test_missing_and_remove(self):
+        intervals = LineIntervalSet()
+        intervals.add(1, 100)
+        intervals.remove(40, 60)
+        self.assertEqual(intervals.intervals, [(1, 39), (61, 100)])
+        self.assertEqual(intervals.missing(30, 120), [(40, 60), (101, 120)])
+        self.assertEqual(intervals.missing(1, 10), [])
+
+    def test_replace_lines_shifts_following_intervals(self):
+        intervals = LineIntervalSet()
+        intervals.add(1, 10)
+        intervals.add(20, 30)
+        intervals.replace_lines(5, 5, 8)
+        self.assertEqual(intervals.intervals, [(1, 4), (9, 13), (23, 33)])
+        intervals.replace_lines(2, 12, 2)
+        self.assertEqual(intervals.intervals, [(1, 1), (3, 3), (13, 23)])
+
 
 class TestFileExplorer(unittest.TestCase):
 
@@ -95,23 +978,17 @@ class TestFileExplorer(unittest.TestCase):
     def tearDown(self):
         self.test_root.destroy()
 
-    @patch('os.listdir')
-    @patch('os.path.join', side_effect=lambda *args: '/'.join(args))
-    @patch('os.path.isdir', side_effect=lambda x: 'dir' in x)
-    def test_populate_file_explorer(self, mock_isdir, mock_join, mock_listdir):
-
-        def listdir_side_effect(path):
-            if path == '/fake/path':
-                return ['file1.txt', 'subdir', 'file2.py']
-            elif path == '/fake/path/subdir':
-                return ['subfile.txt']
-            return []
-        mock_listdir.side_effect = listdir_side_effect
+    @patch('os.scandir')
+    def test_populate_file_explorer(self, mock_scandir):
+        mock_scandir.side_effect = fake_scandir({'/fake/path': [(
+            'file1.txt', False), ('subdir', True), ('file2.py', False)],
+            '/fake/path/subdir': [('subfile.txt', False)]})
         self.file_explorer.file_tree.insert = MagicMock()
         self.file_explorer.populate_file_explorer('', '/fake/path')
-        expected_listdir_calls = [call('/fake/path'), call('/fake/path/subdir')
+        expected_scandir_calls = [call('/fake/path'), call('/fake/path/subdir')
             ]
-        mock_listdir.assert_has_calls(expected_listdir_calls, any_order=True)
+        mock_scandir.assert_has_calls(expected_scandir_calls, any_order=True)
+        self.assertEqual(mock_scandir.call_count, 2)
         expected_insert_calls = [call('', 'end', text='file1.txt', image='',
             values=['/fake/path/file1.txt', 'file'], open=False), call('',
             'end', text='subdir', image='', values=['/fake/path/subdir',
@@ -140,12 +1017,12 @@ class TestFileExplorer(unittest.TestCase):
         mock_askstring.return_value = 'NewFolder'
         self.file_explorer.file_tree.selection = MagicMock(return_value=())
         self.file_explorer.current_path = '/current'
-        with patch.object(self.file_explorer, 'populate_file_explorer'
-            ) as mock_populate:
+        with patch.object(self.file_explorer, '_patch_tree') as mock_patch:
             self.file_explorer._create_new_folder()
         mock_mkdir.assert_called_once_with(os.path.join('/current',
             'NewFolder'))
-        mock_populate.assert_called_once_with('/current')
+        mock_patch.assert_called_once_with([('created', os.path.join(
+            '/current', 'NewFolder'), True, None)])
         self.mock_app.status_bar.update_status.assert_called_with(
             "Folder 'NewFolder' created in /current.")
 
@@ -157,12 +1034,12 @@ class TestFileExplorer(unittest.TestCase):
         mock_askstring.return_value = 'new_file.txt'
         self.file_explorer.file_tree.selection = MagicMock(return_value=())
         self.file_explorer.current_path = '/current'
-        with patch.object(self.file_explorer, 'populate_file_explorer'
-            ) as mock_populate:
+        with patch.object(self.file_explorer, '_patch_tree') as mock_patch:
             self.file_explorer._create_new_file()
         mock_file_open.assert_called_once_with(os.path.join('/current',
             'new_file.txt'), 'w')
-        mock_populate.assert_called_once_with('/current')
+        mock_patch.assert_called_once_with([('created', os.path.join(
+            '/current', 'new_file.txt'), False, None)])
         self.mock_app.status_bar.update_status.assert_called_with(
             "File 'new_file.txt' created in /current.")
 
@@ -175,15 +1052,15 @@ class TestFileExplorer(unittest.TestCase):
         self.file_explorer.file_tree.item = MagicMock(return_value={
             'values': [os.path.join('/fake', 'old_name.txt'), 'file']})
         self.file_explorer.current_path = '/fake'
-        with patch.object(self.file_explorer, 'populate_file_explorer'
-            ) as mock_populate:
+        with patch.object(self.file_explorer, '_patch_tree') as mock_patch:
             self.file_explorer._rename_item()
         mock_rename.assert_called_once_with(os.path.join('/fake',
             'old_name.txt'), os.path.join('/fake', 'renamed_file.txt'))
         self.mock_app.handle_renamed_file.assert_called_once_with(os.path.
             join('/fake', 'old_name.txt'), os.path.join('/fake',
             'renamed_file.txt'))
-        mock_populate.assert_called_once()
+        mock_patch.assert_called_once_with([('moved', os.path.join('/fake',
+            'old_name.txt'), False, os.path.join('/fake', 'renamed_file.txt'))])
         self.mock_app.status_bar.update_status.assert_called_with(
             "Renamed 'old_name.txt' to 'renamed_file.txt'.")
 
@@ -197,13 +1074,13 @@ class TestFileExplorer(unittest.TestCase):
         self.file_explorer.file_tree.item = MagicMock(return_value={
             'values': ['/fake/file_to_delete.txt', 'file']})
         self.file_explorer.current_path = '/fake'
-        with patch.object(self.file_explorer, 'populate_file_explorer'
-            ) as mock_populate:
+        with patch.object(self.file_explorer, '_patch_tree') as mock_patch:
             self.file_explorer._delete_item()
         mock_os_remove.assert_called_once_with('/fake/file_to_delete.txt')
         self.mock_app.handle_deleted_file.assert_called_once_with(
             '/fake/file_to_delete.txt')
-        mock_populate.assert_called_once()
+        mock_patch.assert_called_once_with([('deleted',
+            '/fake/file_to_delete.txt', False, None)])
         self.mock_app.status_bar.update_status.assert_called_with(
             "Deleted 'file_to_delete.txt'.")
 
@@ -237,10 +1114,148 @@ class TestFileExplorer(unittest.TestCase):
         with patch.object(self.file_explorer, 'populate_file_explorer'
             ) as mock_recursive_populate:
             self.file_explorer._on_treeview_open(None)
-        mock_recursive_populate.assert_called_once_with(dir_id, dir_path)
+        mock_recursive_populate.assert_called_once_with(dir_id, dir_path,
+            in_background=True)
         self.file_explorer.file_tree.delete.assert_called_once_with(
             placeholder_id)
 
+    def _expand_temp_directory(self, file_count):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        os.mkdir(os.path.join(directory, 'listing'))
+        for number in range(file_count):
+            with open(os.path.join(directory, 'listing', f'{number:05d}.txt'
+                ), 'w'):
+                pass
+        tree = self.file_explorer.file_tree
+        tree.delete(*tree.get_children(''))
+        self.file_explorer.populate_file_explorer('', directory)
+        node_id = tree.get_children('')[0]
+        tree.focus(node_id)
+        self.file_explorer._on_treeview_open(None)
+        return node_id
+
+    @patch('main.EXPLORER_SCAN_BATCH_ENTRIES', 100)
+    def test_expanding_lists_directory_in_background(self):
+        node_id = self._expand_temp_directory(450)
+        tree = self.file_explorer.file_tree
+        self.assertEqual([tree.item(child, 'text') for child in tree.
+            get_children(node_id)], ['Loading...'])
+        deadline = time.time() + 10
+        while self.file_explorer._scans and time.time() < deadline:
+            self.test_root.update()
+            time.sleep(0.005)
+        children = tree.get_children(node_id)
+        self.assertEqual(len(children), 450)
+        self.assertEqual(tree.item(children[0], 'text'), '00000.txt')
+
+    @patch('main.EXPLORER_PAGE_MIN_ENTRIES', 50)
+    @patch('main.EXPLORER_PAGE_ENTRIES', 20)
+    def test_large_directory_is_shown_a_page_at_a_time(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for number in range(55):
+            with open(os.path.join(directory, f'{number:02d}.txt'), 'w'):
+                pass
+        tree = self.file_explorer.file_tree
+        tree.delete(*tree.get_children(''))
+        self.file_explorer.populate_file_explorer('', directory)
+        children = tree.get_children('')
+        self.assertEqual(len(children), 21)
+        self.assertEqual(tree.item(children[-1], 'text'),
+            'Show 20 more... (35 not shown)')
+        for shown in (41, 55):
+            tree.selection = MagicMock(return_value=(tree.get_children('')
+                [-1],))
+            self.file_explorer._on_file_select()
+            self.assertEqual(len(tree.get_children('')), shown + (shown <
+                55))
+        self.assertEqual(tree.item(tree.get_children('')[-1], 'text'),
+            '54.txt')
+        self.assertEqual(self.file_explorer._pages, {})
+
+    def test_collapsing_cancels_background_listing(self):
+        node_id = self._expand_temp_directory(10)
+        self.file_explorer._on_treeview_close()
+        tree = self.file_explorer.file_tree
+        self.assertEqual(self.file_explorer._scans, {})
+        self.assertEqual([tree.item(child, 'text') for child in tree.
+            get_children(node_id)], ['...'])
+
+    def test_file_changes_patch_only_the_affected_nodes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for name in ('a.txt', 'c.txt'):
+            with open(os.path.join(directory, name), 'w'):
+                pass
+        os.mkdir(os.path.join(directory, 'closed'))
+        tree = self.file_explorer.file_tree
+        tree.delete(*tree.get_children(''))
+        self.file_explorer.current_path = directory
+        self.file_explorer.populate_file_explorer('', directory)
+        a_id, c_id, closed_id = tree.get_children('')
+        os.rename(os.path.join(directory, 'a.txt'), os.path.join(directory,
+            'd.txt'))
+        with open(os.path.join(directory, 'b.txt'), 'w'):
+            pass
+        with open(os.path.join(directory, 'closed', 'inner.txt'), 'w'):
+            pass
+        self.file_explorer._patch_tree([('moved', os.path.join(directory,
+            'a.txt'), False, os.path.join(directory, 'd.txt')), ('created',
+            os.path.join(directory, 'b.txt'), False, None), ('deleted', os.
+            path.join(directory, 'c.txt'), False, None), ('created', os.
+            path.join(directory, 'closed', 'inner.txt'), False, None)])
+        children = tree.get_children('')
+        self.assertEqual([tree.item(child, 'text') for child in children],
+            ['b.txt', 'closed', 'd.txt'])
+        self.assertEqual(children[1:], (closed_id, a_id))
+        self.assertEqual(tree.item(a_id, 'values')[0], os.path.join(
+            directory, 'd.txt'))
+        self.assertFalse(tree.exists(c_id))
+        self.assertEqual(tree.get_children(closed_id), ())
+        self.assertEqual(self.file_explorer._find_node(os.path.join(
+            directory, 'd.txt')), a_id)
+        self.assertIsNone(self.file_explorer._find_node(os.path.join(
+            directory, 'a.txt')))
+
+    def test_burst_of_file_events_is_applied_once_it_pauses(self):
+        self.file_explorer._watcher = MagicMock()
+        self.file_explorer._watcher.read_events.side_effect = [[('created',
+            '/a', False, None)], [('deleted', '/b', False, None)], []]
+        with patch.object(self.file_explorer, '_patch_tree') as mock_patch:
+            for _ in range(3):
+                self.file_explorer._poll_watcher()
+        mock_patch.assert_called_once_with([('created', '/a', False, None),
+            ('deleted', '/b', False, None)])
+
+    def test_cached_listing_is_shown_then_checked(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, 'new.txt'), 'w'):
+            pass
+        cache_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_directory)
+        self.file_explorer.listing_cache = ListingCache(os.path.join(
+            cache_directory, 'listings.sqlite3'))
+        self.file_explorer.listing_cache.put(directory, 0, [('old.txt', os.
+            path.join(directory, 'old.txt'), False, False)])
+        tree = self.file_explorer.file_tree
+        tree.delete(*tree.get_children(''))
+        self.file_explorer.current_path = directory
+        self.file_explorer.populate_file_explorer('', directory,
+            in_background=True)
+        self.assertEqual([tree.item(child, 'text') for child in tree.
+            get_children('')], ['old.txt'])
+        deadline = time.time() + 10
+        while self.file_explorer._validations and time.time() < deadline:
+            self.test_root.update()
+            time.sleep(0.005)
+        self.assertEqual([tree.item(child, 'text') for child in tree.
+            get_children('')], ['new.txt'])
+        self.assertEqual([name for name, _, _, _ in self.file_explorer.
+            listing_cache.get(directory)[1]], ['new.txt'])
+        self.file_explorer.listing_cache.close()
+
     def test_refresh_explorer(self):
         self.file_explorer.file_tree.get_children = MagicMock(return_value=
             ['id1', 'id2'])
@@ -253,11 +1268,10 @@ class TestFileExplorer(unittest.TestCase):
         mock_populate.assert_called_once_with('', self.file_explorer.
             current_path)
 
-    @patch('os.listdir', return_value=['folder1'])
-    @patch('os.path.isdir', return_value=True)
+    @patch('os.scandir', side_effect=fake_scandir({'/testroot': [('folder1',
+        True)], '/testroot/folder1': [('child.txt', False)]}))
     @patch('main.FileExplorer._load_icons', MagicMock())
-    def test_populate_adds_placeholder_for_directory(self, mock_isdir,
-        mock_listdir):
+    def test_populate_adds_placeholder_for_directory(self, mock_scandir):
         self.file_explorer.file_tree.insert = MagicMock(return_value=
             'folder_id')
         self.file_explorer.current_path = '/testroot'
@@ -272,9 +1286,9 @@ class TestFileExplorer(unittest.TestCase):
         self.assertEqual(args_list[1][1]['values'][0], 'placeholder')
         self.assertEqual(args_list[1][0][0], 'folder_id')
 
-    @patch('os.listdir', side_effect=PermissionError('Test permission denied'))
+    @patch('os.scandir', side_effect=PermissionError('Test permission denied'))
     @patch('main.FileExplorer._load_icons', MagicMock())
-    def test_populate_handles_permission_error(self, mock_listdir):
+    def test_populate_handles_permission_error(self, mock_scandir):
         self.file_explorer.file_tree.insert = MagicMock()
         self.file_explorer.current_path = '/unreadable_dir'
         self.file_explorer.populate_file_explorer('', self.file_explorer.
@@ -284,18 +1298,9 @@ class TestFileExplorer(unittest.TestCase):
             '/unreadable_dir', 'error'])
 
     @patch('tkinter.PhotoImage')
-    @patch('os.path.isdir')
-    @patch('os.listdir', return_value=['file.txt', 'folder'])
-    def test_populate_assigns_icons(self, mock_listdir, mock_isdir,
-        mock_photoimage):
-
-        def isdir_side_effect(path):
-            if path.endswith('folder'):
-                return True
-            if path.endswith('file.txt'):
-                return False
-            return False
-        mock_isdir.side_effect = isdir_side_effect
+    @patch('os.scandir', side_effect=fake_scandir({'/fake_path': [(
+        'file.txt', False), ('folder', True)]}))
+    def test_populate_assigns_icons(self, mock_scandir, mock_photoimage):
 
         def no_op_load_icons(instance):
             instance.folder_icon = None
@@ -328,6 +1333,424 @@ class TestFileExplorer(unittest.TestCase):
             'Folder item with icon not inserted correctly')
 
 
+class TestDirectoryListing(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        os.mkdir(os.path.join(self.directory, 'b_dir'))
+        os.mkdir(os.path.join(self.directory, 'empty'))
+        for name in ('c.txt', 'a.txt', os.path.join('b_dir', 'inner.txt')):
+            with open(os.path.join(self.directory, name), 'w'):
+                pass
+
+    def test_list_directory_is_sorted_with_types(self):
+        self.assertEqual(list_directory(self.directory), [('a.txt', os.path
+            .join(self.directory, 'a.txt'), False), ('b_dir', os.path.join(
+            self.directory, 'b_dir'), True), ('c.txt', os.path.join(self.
+            directory, 'c.txt'), False), ('empty', os.path.join(self.
+            directory, 'empty'), True)])
+
+    def test_directory_has_children_stops_at_first_entry(self):
+        self.assertTrue(directory_has_children(os.path.join(self.directory,
+            'b_dir')))
+        self.assertFalse(directory_has_children(os.path.join(self.
+            directory, 'empty')))
+        with self.assertRaises(OSError):
+            directory_has_children(os.path.join(self.directory, 'missing'))
+        with patch('os.scandir', side_effect=fake_scandir({'/many': [(str(
+            number), False) for number in range(1000)]})) as mock_scandir:
+            self.assertTrue(directory_has_children('/many'))
+        mock_scandir.assert_called_once_with('/many')
+
+    def _scan(self, dir_path):
+        scanner = DirectoryScanner(dir_path)
+        batches = []
+        while True:
+            batch = scanner.batches.get(timeout=5)
+            if batch is None:
+                return scanner, batches
+            batches.append(batch)
+
+    def test_scanner_streams_sorted_batches(self):
+        with patch('main.EXPLORER_SCAN_BATCH_ENTRIES', 3):
+            scanner, batches = self._scan(self.directory)
+        self.assertIsNone(scanner.error)
+        self.assertEqual([len(batch) for batch in batches], [3, 1])
+        self.assertEqual([(name, is_dir, has_children) for batch in
+            batches for name, _, is_dir, has_children in batch], [('a.txt',
+            False, False), ('b_dir', True, True), ('c.txt', False, False),
+            ('empty', True, False)])
+
+    @patch('main.EXPLORER_PAGE_MIN_ENTRIES', 4)
+    def test_scanner_hands_large_directories_over_as_listing(self):
+        scanner, batches = self._scan(self.directory)
+        self.assertEqual(len(batches), 1)
+        self.assertIsInstance(batches[0], DirectoryListing)
+        self.assertEqual(len(batches[0]), 4)
+
+    def test_listing_pages(self):
+        listing = DirectoryListing('/big', [('a', '/big/a', False), ('b',
+            '/big/b', True), ('\u00e9t\u00e9', '/big/\u00e9t\u00e9', False)])
+        self.assertEqual(len(listing), 3)
+        self.assertEqual(listing[1], ('b', os.path.join('/big', 'b'), True))
+        self.assertEqual(listing.page(1, 5), [listing[1], listing[2]])
+        self.assertEqual(listing[2][0], '\u00e9t\u00e9')
+        self.assertEqual(listing.page(3, 5), [])
+
+    def test_scanner_reports_listing_errors(self):
+        scanner, batches = self._scan(os.path.join(self.directory, 'missing'))
+        self.assertEqual(batches, [])
+        self.assertIsInstance(scanner.error, FileNotFoundError)
+
+
+class TestIgnoreRules(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for name, content in (('.gitignore', 'node_modules/\n*.log\n/dist\n'
+            ), (os.path.join('src', '.gitignore'), '!keep.log\n'), (os.path.
+            join('src', 'app.py'), ''), (os.path.join('src', 'debug.log'),
+            ''), (os.path.join('src', 'keep.log'), ''), (os.path.join(
+            'src', 'dist', 'b.txt'), ''), (os.path.join('dist', 'a.txt'), ''
+            ), (os.path.join('node_modules', 'pkg', 'index.js'), '')):
+            path = os.path.join(self.directory, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+
+    def test_invalidate_while_other_threads_match(self):
+        matcher = IgnoreMatcher(self.directory)
+        stop = threading.Event()
+        errors = []
+
+        def match_paths():
+            try:
+                while not stop.is_set():
+                    for number in range(200):
+                        matcher.is_ignored(os.path.join(self.directory,
+                            'src', f'd{number}', 'debug.log'), False)
+            except Exception as e:
+                errors.append(e)
+        thread = threading.Thread(target=match_paths)
+        thread.start()
+        try:
+            for _ in range(200):
+                matcher.invalidate(os.path.join(self.directory, 'src'))
+        finally:
+            stop.set()
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertFalse(matcher.is_ignored(os.path.join(self.directory,
+            'src', 'keep.log'), False))
+
+    def test_patterns_follow_gitignore_syntax(self):
+        rules = IgnoreRules('/base', ['# comment', '', '*.pyc', '/build',
+            'logs/', 'doc/*.txt', 'a/**/b', '!important.pyc'])
+        self.assertTrue(rules.match('src/x.pyc', False))
+        self.assertFalse(rules.match('important.pyc', False))
+        self.assertTrue(rules.match('build', True))
+        self.assertIsNone(rules.match('src/build', True))
+        self.assertTrue(rules.match('x/logs', True))
+        self.assertIsNone(rules.match('logs', False))
+        self.assertTrue(rules.match('logs/today.txt', False))
+        self.assertTrue(rules.match('doc/a.txt', False))
+        self.assertIsNone(rules.match('doc/sub/a.txt', False))
+        self.assertTrue(rules.match('a/x/y/b', False))
+
+    def test_deeper_ignore_files_override(self):
+        matcher = IgnoreMatcher(self.directory)
+        path = lambda *names: os.path.join(self.directory, *names)
+        self.assertTrue(matcher.is_ignored(path('src', 'debug.log'), False))
+        self.assertFalse(matcher.is_ignored(path('src', 'keep.log'), False))
+        self.assertTrue(matcher.is_ignored(path('dist'), True))
+        self.assertFalse(matcher.is_ignored(path('src', 'dist'), True))
+        self.assertTrue(matcher.is_ignored(path('.git'), True))
+        self.assertFalse(IgnoreMatcher(self.directory, ['!.git/']).
+            is_ignored(path('.git'), True))
+
+    def test_walk_never_enters_ignored_directories(self):
+        with patch('os.scandir', wraps=os.scandir) as mock_scandir:
+            files = list(walk_project(self.directory, IgnoreMatcher(self.
+                directory)))
+        self.assertEqual([os.path.relpath(path, self.directory) for path in
+            files], ['.gitignore', os.path.join('src', '.gitignore'), os.
+            path.join('src', 'app.py'), os.path.join('src', 'keep.log'), os
+            .path.join('src', 'dist', 'b.txt')])
+        scanned = [os.path.relpath(args[0], self.directory) for args, _ in
+            mock_scandir.call_args_list]
+        self.assertNotIn('node_modules', scanned)
+        self.assertNotIn('dist', scanned)
+
+    def test_scanner_does_not_probe_ignored_directories(self):
+        with patch('main._probe_children', return_value=True) as mock_probe:
+            scanner = DirectoryScanner(self.directory, IgnoreMatcher(self.
+                directory))
+            batches = list(iter(lambda: scanner.batches.get(timeout=5), None))
+        names = [(name, has_children) for batch in batches for name, _, _,
+            has_children in batch]
+        self.assertIn(('node_modules', True), names)
+        probed = [os.path.basename(args[0]) for args, _ in mock_probe.
+            call_args_list]
+        self.assertNotIn('node_modules', probed)
+        with patch('main.EXPLORER_HIDE_IGNORED', True):
+            hidden = DirectoryScanner(self.directory, IgnoreMatcher(self.
+                directory))
+            names = [name for batch in iter(lambda: hidden.batches.get(
+                timeout=5), None) for name, _, _, _ in batch]
+        self.assertEqual(names, ['.gitignore', 'src'])
+
+
+class TestListingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = ListingCache(os.path.join(self.directory, 'cache',
+            'listings.sqlite3'))
+        self.addCleanup(self.cache.close)
+
+    def test_stores_listings_compactly(self):
+        entries = [('a.txt', '/p/a.txt', False, False), ('empty', '/p/empty',
+            True, False), ('full', '/p/full', True, True), ('locked',
+            '/p/locked', True, None)]
+        self.assertIsNone(self.cache.get('/p'))
+        self.cache.put('/p', 123, entries)
+        self.assertEqual(self.cache.get('/p'), (123, [(name, os.path.join(
+            '/p', name), is_dir, has_children) for name, _, is_dir,
+            has_children in entries]))
+        self.cache.put('/p', 456, [])
+        self.assertEqual(self.cache.get('/p'), (456, []))
+
+    def test_unchanged_directory_is_not_listed_again(self):
+        os.mkdir(os.path.join(self.directory, 'sub'))
+        mtime_ns = os.stat(self.directory).st_mtime_ns
+        cached = mtime_ns, [('sub', os.path.join(self.directory, 'sub'),
+            True, True)]
+        with patch('main.list_directory') as mock_list_directory:
+            scanner = DirectoryScanner(self.directory, cached=cached)
+            batches = list(iter(lambda: scanner.batches.get(timeout=5), None))
+        mock_list_directory.assert_not_called()
+        self.assertEqual(scanner.entries, [('sub', os.path.join(self.
+            directory, 'sub'), True, False)])
+        self.assertEqual(scanner.mtime_ns, mtime_ns)
+        self.assertEqual(batches, [scanner.entries])
+
+    def test_diff_listings(self):
+        events, changed_children = diff_listings([('a', '/p/a', False,
+            False), ('b', '/p/b', True, False), ('c', '/p/c', False, False)],
+            [('b', '/p/b', True, True), ('c', '/p/c', True, False), ('d',
+            '/p/d', False, False)])
+        self.assertEqual(events, [('deleted', '/p/c', False, None), (
+            'created', '/p/c', True, None), ('created', '/p/d', False, None
+            ), ('deleted', '/p/a', False, None)])
+        self.assertEqual(changed_children, [('/p/b', True)])
+
+
+class TestWorkspaceIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for relative_path in ['main.py', 'README.md', os.path.join('src',
+            'parser.py'), os.path.join('src', 'make_main.py'), os.path.join
+            ('.git', 'config')]:
+            os.makedirs(os.path.dirname(self._path(relative_path)),
+                exist_ok=True)
+            with open(self._path(relative_path), 'w'):
+                pass
+
+    def _path(self, relative_path):
+        return os.path.join(self.directory, relative_path)
+
+    def _built_index(self):
+        index = WorkspaceIndex(self.directory, IgnoreMatcher(self.directory))
+        index._builder.join(timeout=5)
+        self.assertTrue(index.ready)
+        return index
+
+    def test_best_matches_come_first(self):
+        index = self._built_index()
+        self.assertEqual(index.search('main'), (['main.py', os.path.join(
+            'src', 'make_main.py')], True))
+        self.assertEqual(index.search('srpy'), ([os.path.join('src',
+            'parser.py'), os.path.join('src', 'make_main.py')], True))
+        self.assertEqual(index.search('conf'), ([], True))
+        self.assertEqual(index.search('MAIN')[0][0], 'main.py')
+
+    def test_search_is_carried_on_within_its_budget(self):
+        for number in range(30):
+            with open(self._path(f'note{number:02d}.txt'), 'w'):
+                pass
+        index = self._built_index()
+        expected = index.search('note')
+        index._search = None
+        with patch('main.QUICK_OPEN_SCAN_BUDGET', 7):
+            calls = 1
+            results, complete = index.search('n')
+            while not complete:
+                calls += 1
+                results, complete = index.search('note')
+        self.assertEqual(calls, 6)
+        self.assertEqual(results, expected[0])
+
+    def test_best_match_is_found_after_many_weaker_ones(self):
+        for number in range(40):
+            with open(self._path(f'x{number:02d}y.txt'), 'w'):
+                pass
+        os.makedirs(self._path(os.path.join('deep', 'folder')))
+        with open(self._path(os.path.join('deep', 'folder',
+            'xylophone_notes.txt')), 'w'):
+            pass
+        index = self._built_index()
+        with patch('main.QUICK_OPEN_SCAN_BUDGET', 8):
+            results, complete = index.search('xy', limit=5)
+            while not complete:
+                results, complete = index.search('xy', limit=5)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(results[0], os.path.join('deep', 'folder',
+            'xylophone_notes.txt'))
+
+    def test_changes_made_during_a_rebuild_are_kept(self):
+        index = self._built_index()
+        walking = threading.Event()
+        release = threading.Event()
+        walk = main.walk_project
+
+        def slow_walk(root, ignore):
+            walking.set()
+            release.wait(5)
+            return walk(root, ignore)
+        with patch('main.walk_project', side_effect=slow_walk):
+            index.refresh()
+            walking.wait(5)
+            index.add(self._path('added.txt'))
+            index.remove(self._path('README.md'))
+            release.set()
+            index._builder.join(timeout=5)
+        self.assertEqual(index.search(''), (['main.py', os.path.join('src',
+            'parser.py'), os.path.join('src', 'make_main.py'), 'added.txt'],
+            True))
+
+    def test_file_events_keep_it_up_to_date(self):
+        index = self._built_index()
+        os.mkdir(self._path('docs'))
+        with open(self._path(os.path.join('docs', 'guide.md')), 'w'):
+            pass
+        index.apply_events([('created', self._path('docs'), True, None), (
+            'moved', self._path('README.md'), False, self._path('READ.md')),
+            ('deleted', self._path('src'), True, None)])
+        self.assertEqual(index.search('md'), (['READ.md', os.path.join(
+            'docs', 'guide.md')], True))
+        self.assertEqual(index.search('py'), (['main.py'], True))
+
+
+class TestDirectoryWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        os.mkdir(os.path.join(self.directory, 'sub'))
+        with open(os.path.join(self.directory, 'old.txt'), 'w'):
+            pass
+
+    def _path(self, *names):
+        return os.path.join(self.directory, *names)
+
+    def _change_files(self):
+        os.rename(self._path('old.txt'), self._path('sub', 'new.txt'))
+        os.mkdir(self._path('made'))
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'inotify is Linux only')
+    def test_inotify_reports_entry_changes(self):
+        watcher = InotifyWatcher()
+        self.addCleanup(watcher.close)
+        watcher.watch(self.directory)
+        watcher.watch(self._path('sub'))
+        self.assertEqual(watcher.read_events(), [])
+        self._change_files()
+        self.assertEqual(watcher.read_events(), [('moved', self._path(
+            'old.txt'), False, self._path('sub', 'new.txt')), ('created',
+            self._path('made'), True, None)])
+        watcher.unwatch(self._path('sub'))
+        os.remove(self._path('sub', 'new.txt'))
+        self.assertEqual(watcher.read_events(), [])
+
+    def _read_polled_events(self, watcher, count):
+        events = []
+        deadline = time.monotonic() + 5
+        while len(events) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+            events.extend(watcher.read_events())
+        return events
+
+    @patch('main.WATCH_POLL_MS', 10)
+    def test_polling_reports_entry_changes(self):
+        watcher = PollingWatcher()
+        self.addCleanup(watcher.close)
+        for dir_path in (self.directory, self._path('sub')):
+            os.utime(dir_path, ns=(0, 0)) # So changes show even with coarse timestamps
+            watcher.watch(dir_path, (0, list_directory(dir_path)))
+        time.sleep(0.05)
+        self.assertEqual(watcher.read_events(), [])
+        self._change_files()
+        self.assertEqual(sorted(self._read_polled_events(watcher, 3)), [(
+            'created', self._path('made'), True, None), ('created', self.
+            _path('sub', 'new.txt'), False, None), ('deleted', self._path(
+            'old.txt'), False, None)])
+        time.sleep(0.05)
+        self.assertEqual(watcher.read_events(), [])
+
+    @patch('main.WATCH_POLL_MS', 10)
+    def test_polling_waits_for_the_listing_shown(self):
+        watcher = PollingWatcher()
+        self.addCleanup(watcher.close)
+        os.utime(self.directory, ns=(0, 0))
+        watcher.watch(self.directory)
+        os.mkdir(self._path('made'))
+        time.sleep(0.05)
+        self.assertEqual(watcher.read_events(), [])
+        # The listing was made before 'made' was, so it is reported as created
+        watcher.watch(self.directory, (0, [('old.txt', self._path(
+            'old.txt'), False), ('sub', self._path('sub'), True)]))
+        self.assertEqual(self._read_polled_events(watcher, 1), [('created',
+            self._path('made'), True, None)])
+
+    def test_coalesce_keeps_the_net_change_per_path(self):
+        changes, moves = coalesce_events([('created', '/d/a', False, None),
+            ('deleted', '/d/a', False, None), ('deleted', '/d/b', True,
+            None), ('created', '/d/b', True, None), ('moved', '/d/c', False,
+            '/e/c')])
+        self.assertEqual(changes, {'/d/a': None, '/d/b': True, '/d/c': None,
+            '/e/c': False})
+        self.assertEqual(moves, [('/d/c', '/e/c')])
+
+
+class TestTabIndex(unittest.TestCase):
+
+    def test_finds_tabs_by_value(self):
+        editor = object()
+        index = TabIndex({'t1': editor})
+        self.assertEqual(index.tab_for(editor), 't1')
+        index['t2'] = editor
+        del index['t1']
+        self.assertEqual(index.tab_for(editor), 't2')
+        self.assertEqual(index.pop('t2'), editor)
+        self.assertIsNone(index.tab_for(editor))
+        self.assertEqual(index.pop('t2', None), None)
+
+    def test_tabs_under_directory(self):
+        index = TabIndex({'t1': '/p/a.txt', 't2': '/p/sub/b.txt', 't3':
+            '/p2/c.txt', 't4': '/p'}, sorted_values=True)
+        self.assertEqual(sorted(index.tabs_under('/p')), ['t1', 't2', 't4'])
+        index['t2'] = '/q/b.txt'
+        index.update({'t5': '/p/sub/e.txt'})
+        self.assertEqual(sorted(index.tabs_under('/p/sub')), ['t5'])
+        index.clear()
+        self.assertEqual(index.tabs_under('/p'), [])
+
+
 class TestApp(unittest.TestCase):
 
     def setUp(self):
@@ -341,18 +1764,37 @@ class TestApp(unittest.TestCase):
         self.app.file_explorer = MagicMock(spec=FileExplorer)
         self.app.search_frame = MagicMock(spec=tk.Frame)
         self.app.search_entry = MagicMock(spec=tk.Entry)
-        self.app.editors = {}
-        self.app.tab_filepaths = {}
+        self.app.editors.clear()
+        self.app.tab_filepaths.clear()
         self.app.last_search_match_info = {'index': '1.0', 'query': ''}
 
     def tearDown(self):
         self.test_root.destroy()
 
+    def test_quick_open_opens_the_chosen_match(self):
+        index = MagicMock(root='/project', ready=True)
+        index.search.return_value = ['main.py', os.path.join('src',
+            'main_window.py')], True
+        self.app.file_explorer.get_workspace_index.return_value = index
+        self.app.open_file_in_new_tab = MagicMock()
+        self.app.show_quick_open()
+        palette = self.app.quick_open
+        palette.query_var.set('main')
+        index.search.assert_called_with('main')
+        self.assertEqual(palette.results_list.get(0, tk.END), ('main.py',
+            os.path.join('src', 'main_window.py')))
+        palette._move_selection(1)
+        palette._open_selected()
+        self.app.open_file_in_new_tab.assert_called_once_with(os.path.join(
+            '/project', 'src', 'main_window.py'))
+        self.assertFalse(palette.window.winfo_exists())
+
     @patch('builtins.open', new_callable=mock_open, read_data='file content')
     @patch('os.path.isfile', return_value=True)
+    @patch('main.sniff_file', return_value=FileFormat())
     @patch('main.TextEditor')
-    def test_open_file_in_new_tab(self, MockTextEditor, mock_isfile,
-        mock_file_open):
+    def test_open_file_in_new_tab(self, MockTextEditor, mock_sniff_file,
+        mock_isfile, mock_file_open):
         mock_editor_instance = MockTextEditor.return_value
         mock_editor_instance.is_modified = False
         self.app.notebook.tabs = MagicMock(return_value=[])
@@ -367,11 +1809,72 @@ class TestApp(unittest.TestCase):
         self.assertTrue(any(fp == '/fake/test.txt' for fp in self.app.
             tab_filepaths.values()))
 
+    @patch('os.path.getsize', return_value=main.LARGE_FILE_MIN_BYTES)
+    @patch('main.sniff_file', return_value=FileFormat('utf-8', '\n'))
+    @patch('main.LargeFileViewer')
+    @patch('main.TextEditor')
+    def test_open_large_file_uses_viewer(self, MockTextEditor,
+        MockLargeFileViewer, mock_sniff_file, mock_getsize):
+        self.app.notebook.tabs = MagicMock(return_value=[])
+        self.app.notebook.add = MagicMock()
+        self.app.notebook.select = MagicMock(return_value='.!notebook.!frame')
+        self.app.open_file_in_new_tab('/logs/huge.log')
+        MockTextEditor.assert_not_called()
+        MockLargeFileViewer.assert_called_once()
+        self.assertIs(self.app.editors['.!notebook.!frame'],
+            MockLargeFileViewer.return_value)
+
+    @patch('os.path.getsize', return_value=main.LARGE_FILE_MIN_BYTES)
+    @patch('main.sniff_file', return_value=FileFormat('utf-16', '\n'))
+    @patch('main.FileLoader')
+    @patch('main.LargeFileViewer')
+    @patch('main.TextEditor')
+    def test_open_large_utf16_file_is_streamed(self, MockTextEditor,
+        MockLargeFileViewer, MockFileLoader, mock_sniff_file, mock_getsize):
+        self.app.notebook.tabs = MagicMock(return_value=[])
+        self.app.notebook.add = MagicMock()
+        self.app.notebook.select = MagicMock(return_value='.!notebook.!frame')
+        self.app.open_file_in_new_tab('/logs/huge-utf16.log')
+        MockLargeFileViewer.assert_not_called()
+        MockFileLoader.assert_called_once_with('/logs/huge-utf16.log', 'utf-16')
+        MockTextEditor.return_value.load_streamed.assert_called_once_with(
+            MockFileLoader.return_value)
+
+    @patch('os.path.getsize', return_value=main.STREAMED_OPEN_MIN_BYTES)
+    @patch('main.sniff_file', return_value=FileFormat('latin-1', '\r\n'))
+    @patch('main.FileLoader')
+    @patch('main.TextEditor')
+    def test_open_big_file_streams_content(self, MockTextEditor,
+        MockFileLoader, mock_sniff_file, mock_getsize):
+        self.app.notebook.tabs = MagicMock(return_value=[])
+        self.app.notebook.add = MagicMock()
+        self.app.notebook.select = MagicMock(return_value='.!notebook.!frame')
+        self.app.open_file_in_new_tab('/fake/big.txt')
+        self.app.notebook.add.assert_called_once()
+        editor = MockTextEditor.return_value
+        editor.set_content.assert_not_called()
+        MockFileLoader.assert_called_once_with('/fake/big.txt', 'latin-1')
+        editor.load_streamed.assert_called_once_with(MockFileLoader.return_value)
+        self.assertIs(editor.file_format, mock_sniff_file.return_value)
+
+    @patch('main.sniff_file', return_value=FileFormat(is_binary=True))
+    @patch('main.BinaryPreview')
+    @patch('main.TextEditor')
+    def test_open_binary_file_shows_preview(self, MockTextEditor,
+        MockBinaryPreview, mock_sniff_file):
+        self.app.notebook.tabs = MagicMock(return_value=[])
+        self.app.notebook.add = MagicMock()
+        self.app.notebook.select = MagicMock(return_value='.!notebook.!frame')
+        self.app.open_file_in_new_tab('/fake/image.png')
+        MockTextEditor.assert_not_called()
+        self.assertIs(self.app.editors['.!notebook.!frame'],
+            MockBinaryPreview.return_value)
+
     def test_open_existing_file_switches_tab(self):
         mock_editor = MagicMock(spec=TextEditor)
         tab_id_1 = '.!notebook.!frame'
-        self.app.editors = {tab_id_1: mock_editor}
-        self.app.tab_filepaths = {tab_id_1: '/fake/existing.txt'}
+        self.app.editors.update({tab_id_1: mock_editor})
+        self.app.tab_filepaths.update({tab_id_1: '/fake/existing.txt'})
         self.app.notebook.tabs = MagicMock(return_value=[tab_id_1])
         self.app.notebook.select = MagicMock()
         self.app.notebook.add = MagicMock()
@@ -388,13 +1891,132 @@ class TestApp(unittest.TestCase):
         self.app.notebook.tabs = MagicMock(return_value=[tab_id])
         self.app.notebook.select = MagicMock(return_value=tab_id)
         self.app.notebook.forget = MagicMock()
-        self.app.editors = {tab_id: mock_editor}
-        self.app.tab_filepaths = {tab_id: '/fake/file.txt'}
+        self.app.editors.update({tab_id: mock_editor})
+        self.app.tab_filepaths.update({tab_id: '/fake/file.txt'})
         self.app.close_current_tab()
         mock_messagebox.assert_not_called()
         self.app.notebook.forget.assert_called_once_with(tab_id)
+        mock_editor.close.assert_called_once()
         self.assertNotIn(tab_id, self.app.editors)
 
+    @patch('main.sniff_file')
+    @patch('main.TextEditor')
+    def test_reopen_closed_file_from_memory(self, MockTextEditor, mock_sniff_file):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        mock_editor = MagicMock(spec=TextEditor)
+        mock_editor.is_modified = False
+        mock_editor.is_loading = False
+        mock_editor.load_error = None
+        mock_editor.file_stamp = main.file_stamp(path)
+        mock_editor.file_format = FileFormat('utf-8', '\n')
+        mock_editor.file_suffix = ''
+        mock_editor.document = MagicMock()
+        mock_editor.document.text.return_value = 'cached text'
+        mock_editor.highlight_state.return_value = None
+        tab_id = '.!notebook.!frame'
+        self.app.notebook.tabs = MagicMock(return_value=[tab_id])
+        self.app.notebook.select = MagicMock(return_value=tab_id)
+        self.app.notebook.forget = MagicMock()
+        self.app.notebook.add = MagicMock()
+        self.app.editors.update({tab_id: mock_editor})
+        self.app.tab_filepaths.update({tab_id: path})
+        self.app.close_current_tab()
+        self.app.notebook.tabs = MagicMock(return_value=[])
+        self.app.open_file_in_new_tab(path)
+        mock_sniff_file.assert_not_called()
+        MockTextEditor.return_value.set_content.assert_called_once_with(
+            'cached text', initial_load=True, highlight_state=None)
+        self.assertEqual(self.app.closed_tabs.hits, 1)
+
+    @patch('main.messagebox.showwarning')
+    @patch('main.messagebox.askyesno', return_value=True)
+    @patch.object(App, '_open_recovered_tab')
+    def test_failed_recovery_is_not_offered_again(self,
+        mock_open_recovered_tab, mock_askyesno, mock_showwarning):
+        self.app.recovery_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.app.recovery_dir)
+        crashed_path = os.path.join(self.app.recovery_dir,
+            '99999999-broken.journal')
+        with open(crashed_path, 'wb') as journal_file:
+            journal_file.write(b'not a journal')
+        self.app._offer_recovery()
+        mock_open_recovered_tab.assert_not_called()
+        mock_showwarning.assert_called_once()
+        self.assertIn(crashed_path + main.UNRECOVERABLE_JOURNAL_SUFFIX,
+            mock_showwarning.call_args[0][1])
+        self.assertEqual(EditJournal.find(self.app.recovery_dir), [])
+        mock_askyesno.reset_mock()
+        self.app._offer_recovery()
+        mock_askyesno.assert_not_called()
+
+    def test_closed_tab_after_save_caches_the_saved_file_text(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        mock_editor = MagicMock(spec=TextEditor)
+        mock_editor.is_modified = False
+        mock_editor.is_loading = False
+        mock_editor.load_error = None
+        mock_editor.file_stamp = main.file_stamp(path)
+        mock_editor.file_suffix = main.SAVE_SUFFIX
+        mock_editor.file_format = FileFormat('utf-8', '\n')
+        mock_editor.document = Document('saved text')
+        self.app._remember_closed_tab(mock_editor, path)
+        entry = self.app.closed_tabs.take(path)
+        self.assertEqual(entry.content, 'saved text\n')
+        self.assertIsNone(entry.highlight_state)
+        mock_editor.highlight_state.assert_not_called()
+
+    @patch('main.messagebox.askyesno', return_value=True)
+    @patch.object(App, '_open_recovered_tab')
+    def test_offer_recovery_restores_crashed_journals(self,
+        mock_open_recovered_tab, mock_askyesno):
+        self.app.recovery_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.app.recovery_dir)
+        journal = EditJournal(self.app.recovery_dir, None, FileFormat())
+        journal.compact(None, Document('unsaved text').snapshot())
+        crashed_path = os.path.join(self.app.recovery_dir, '99999999-crashed.journal')
+        os.rename(journal.path, crashed_path)
+        self.app._offer_recovery()
+        mock_askyesno.assert_called_once()
+        mock_open_recovered_tab.assert_called_once()
+        self.assertEqual(mock_open_recovered_tab.call_args[0][2], 'unsaved text')
+        self.assertEqual(os.listdir(self.app.recovery_dir), [])
+
+    @patch('main.messagebox.showwarning')
+    @patch('main.messagebox.askyesno', return_value=True)
+    @patch.object(App, '_open_recovered_tab', return_value=False)
+    def test_recovery_keeps_journal_that_did_not_open(self,
+        mock_open_recovered_tab, mock_askyesno, mock_showwarning):
+        self.app.recovery_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.app.recovery_dir)
+        journal = EditJournal(self.app.recovery_dir, None, FileFormat())
+        journal.compact(None, Document('unsaved text').snapshot())
+        crashed_path = os.path.join(self.app.recovery_dir, '99999999-crashed.journal')
+        os.rename(journal.path, crashed_path)
+        self.app._offer_recovery()
+        mock_open_recovered_tab.assert_called_once()
+        self.assertIn(crashed_path + main.UNRECOVERABLE_JOURNAL_SUFFIX,
+            mock_showwarning.call_args[0][1])
+        self.assertTrue(os.path.exists(crashed_path + main.UNRECOVERABLE_JOURNAL_SUFFIX))
+
+    def test_recovered_untitled_buffers_each_get_a_tab(self):
+        mock_editors = [MagicMock(spec=TextEditor), MagicMock(spec=TextEditor)]
+        for mock_editor in mock_editors:
+            mock_editor.undo_history = MagicMock()
+        self.app.open_file_in_new_tab = MagicMock(side_effect=mock_editors)
+        self.assertTrue(self.app._open_recovered_tab(None, FileFormat(), 'first'))
+        self.assertTrue(self.app._open_recovered_tab(None, FileFormat(), 'second'))
+        for call in self.app.open_file_in_new_tab.call_args_list:
+            self.assertEqual(call[0][0], 'Untitled')
+            self.assertFalse(call[1]['reuse_open_tab'])
+        for mock_editor in mock_editors:
+            mock_editor.mark_as_modified.assert_called_once_with(True)
+        self.app.open_file_in_new_tab = MagicMock(return_value=None)
+        self.assertFalse(self.app._open_recovered_tab(None, FileFormat(), 'lost'))
+
     @patch('main.messagebox.askyesnocancel', return_value=True)
     @patch.object(App, 'save_file')
     def test_close_current_tab_modified_save_yes(self, mock_save_file,
@@ -405,8 +2027,8 @@ class TestApp(unittest.TestCase):
         self.app.notebook.tabs = MagicMock(return_value=[tab_id])
         self.app.notebook.select = MagicMock(return_value=tab_id)
         self.app.notebook.forget = MagicMock()
-        self.app.editors = {tab_id: mock_editor}
-        self.app.tab_filepaths = {tab_id: '/fake/file.txt'}
+        self.app.editors.update({tab_id: mock_editor})
+        self.app.tab_filepaths.update({tab_id: '/fake/file.txt'})
 
         def side_effect_save():
             mock_editor.is_modified = False
@@ -416,6 +2038,57 @@ class TestApp(unittest.TestCase):
         mock_save_file.assert_called_once()
         self.app.notebook.forget.assert_called_once_with(tab_id)
 
+    @patch('main.messagebox.askyesnocancel', return_value=True)
+    @patch.object(App, 'save_file')
+    def test_close_current_tab_keeps_tab_when_save_fails(self,
+        mock_save_file, mock_messagebox):
+        mock_editor = MagicMock(spec=TextEditor)
+        mock_editor.is_modified = True
+        mock_editor.undo_history = MagicMock()
+        mock_editor.mark_as_modified.side_effect = lambda modified: setattr(
+            mock_editor, 'is_modified', modified)
+        tab_id = '.!notebook.!frame'
+        self.app.notebook.tabs = MagicMock(return_value=[tab_id])
+        self.app.notebook.select = MagicMock(return_value=tab_id)
+        self.app.notebook.forget = MagicMock()
+        self.app.editors[tab_id] = mock_editor
+        self.app.tab_filepaths[tab_id] = '/fake/file.txt'
+
+        def failing_save():
+            job_id = self.app.save_engine.save(os.path.join(tempfile.
+                gettempdir(), 'missing-directory', 'file.txt'), Document(
+                'text').snapshot())
+            self.app._pending_saves[job_id] = mock_editor
+            self.app._latest_saves[mock_editor] = job_id
+            mock_editor.mark_as_modified(False)
+        mock_save_file.side_effect = failing_save
+        self.app.close_current_tab()
+        self.app.notebook.forget.assert_not_called()
+        self.assertTrue(mock_editor.is_modified)
+        mock_editor.undo_history.mark_unsaved.assert_called_once()
+        self.assertIn(tab_id, self.app.editors)
+
+    def test_failed_save_superseded_by_newer_save_is_ignored(self):
+        mock_editor = MagicMock(spec=TextEditor)
+        mock_editor.is_modified = False
+        mock_editor.undo_history = MagicMock()
+        mock_editor.file_stamp = None
+        self.app.editors['.!notebook.!frame'] = mock_editor
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        saved_path = os.path.join(directory, 'file.txt')
+        for filepath in (os.path.join(directory, 'missing', 'file.txt'),
+            saved_path):
+            job_id = self.app.save_engine.save(filepath, Document('text').
+                snapshot())
+            self.app._pending_saves[job_id] = mock_editor
+            self.app._latest_saves[mock_editor] = job_id
+        self.app._wait_for_saves()
+        mock_editor.mark_as_modified.assert_not_called()
+        mock_editor.undo_history.mark_unsaved.assert_not_called()
+        self.assertEqual(mock_editor.file_stamp, file_stamp(saved_path))
+        self.assertEqual(self.app._latest_saves, {})
+
     def test_on_tab_changed(self):
         mock_editor = MagicMock(spec=TextEditor)
         mock_editor.clear_search_highlights = MagicMock()
@@ -434,8 +2107,8 @@ class TestApp(unittest.TestCase):
         new_path = '/new/path.txt'
         mock_editor = MagicMock(spec=TextEditor)
         mock_editor.is_modified = True
-        self.app.tab_filepaths = {tab_id: old_path}
-        self.app.editors = {tab_id: mock_editor}
+        self.app.tab_filepaths.update({tab_id: old_path})
+        self.app.editors.update({tab_id: mock_editor})
         self.app.notebook.select = MagicMock(return_value=tab_id)
         self.app.notebook.tab = MagicMock()
         self.app.notebook.tabs = MagicMock(return_value=[tab_id])
@@ -444,11 +2117,29 @@ class TestApp(unittest.TestCase):
         self.app.notebook.tab.assert_called_once_with(tab_id, text='path.txt*')
         self.app.status_bar.update_filepath.assert_called()
 
+    def test_renaming_directory_moves_its_open_files(self):
+        self.app.tab_filepaths.update({'t1': '/proj/src/a.py', 't2':
+            '/proj/src/pkg/b.py', 't3': '/proj/src2/c.py', 't4': '/other.txt'})
+        self.app.editors.update({tab_id: MagicMock(spec=TextEditor, is_modified
+            =False) for tab_id in self.app.tab_filepaths})
+        self.app.notebook.select = MagicMock(return_value='t4')
+        self.app.notebook.tab = MagicMock()
+        self.app.handle_renamed_file('/proj/src', '/proj/lib')
+        self.assertEqual(self.app.tab_filepaths, {'t1': '/proj/lib/a.py',
+            't2': '/proj/lib/pkg/b.py', 't3': '/proj/src2/c.py', 't4':
+            '/other.txt'})
+        self.assertEqual(self.app.tab_filepaths.tab_for('/proj/lib/pkg/b.py'
+            ), 't2')
+        self.assertIsNone(self.app.tab_filepaths.tab_for('/proj/src/a.py'))
+        self.app.editors['t2'].set_language_for.assert_called_once_with(
+            '/proj/lib/pkg/b.py')
+        self.assertEqual(self.app.notebook.tab.call_count, 2)
+
     def test_handle_deleted_file(self):
         tab_id = '.!notebook.!frame'
         deleted_path = '/path/to/deleted_file.txt'
-        self.app.tab_filepaths = {tab_id: deleted_path}
-        self.app.editors = {tab_id: MagicMock(spec=TextEditor)}
+        self.app.tab_filepaths.update({tab_id: deleted_path})
+        self.app.editors.update({tab_id: MagicMock(spec=TextEditor)})
         self.app.notebook.forget = MagicMock()
         self.app.handle_deleted_file(deleted_path)
         self.app.notebook.forget.assert_called_once_with(tab_id)
@@ -491,6 +2182,36 @@ class TestApp(unittest.TestCase):
         self.assertEqual(self.app.last_search_match_info, {'index':
             '1.5+4c', 'query': 'test'})
 
+    def test_regex_find_uses_match_table(self):
+        mock_editor = MagicMock(spec=TextEditor)
+        mock_editor.text_area = MagicMock()
+        mock_editor.text_area.index.return_value = '1.0'
+        mock_editor.find_matches.return_value = SearchMatches(
+            compile_search_pattern('\\d+', ignore_case=True), 'a 12 b 345', 1)
+        mock_editor.index_to_offset.side_effect = lambda index: {'1.0': 0,
+            '1.4': 4, '1.10': 10}[index]
+        mock_editor.offset_to_index.side_effect = lambda offset: f'1.{offset}'
+        self.app.search_entry.get.return_value = '\\d+'
+        self.app.regex_var.set(True)
+        with patch.object(self.app, 'get_current_editor', return_value=
+            mock_editor):
+            self.app._find_next()
+            mock_editor.text_area.tag_add.assert_called_with(
+                'search_highlight', '1.2', '1.4')
+            self.app._find_next()
+            mock_editor.text_area.tag_add.assert_called_with(
+                'search_highlight', '1.7', '1.10')
+            self.app._find_previous()
+            mock_editor.text_area.tag_add.assert_called_with(
+                'search_highlight', '1.7', '1.10')
+            self.app.search_entry.get.return_value = '('
+            self.app._find_next()
+        mock_editor.text_area.search.assert_not_called()
+        self.assertEqual(self.app.last_search_match_info, {'index': '1.7',
+            'query': '\\d+'})
+        self.assertIn('Invalid regular expression', self.app.status_bar.
+            update_status.call_args[0][0])
+
     def test_find_next_not_found_then_wrap(self):
         mock_editor = MagicMock(spec=TextEditor)
         mock_editor.text_area = MagicMock()